@@ -0,0 +1,137 @@
+import random
+import string
+from dataclasses import dataclass
+
+from src.models.index import Index, IndexItem
+from src.models.instrument import InstrumentBase
+from src.models.positions import Positions, PositionsCash, PositionsInstrument, Cash
+
+
+LOT_SIZES = [1, 1, 1, 10, 10, 100, 1000, 10000]
+
+
+def to_cash(value: float) -> Cash:
+    units = int(value)
+    return Cash(units=units, nano=int(round((value - units) * 1e9)))
+
+
+def make_tickers(count: int, rnd: random.Random) -> list[str]:
+    tickers = set()
+    while len(tickers) < count:
+        tickers.add("".join(rnd.choices(string.ascii_uppercase, k=4)))
+    return sorted(tickers)
+
+
+def make_index(tickers_count: int, seed: int = 0) -> Index:
+    """
+    Синтетический индекс: веса суммируются в 100, размеры лотов и цены разного порядка.
+    :param tickers_count: Количество бумаг в индексе
+    :param seed: Зерно генератора
+    :return: Состав индекса
+    """
+    rnd = random.Random(seed)
+    tickers = make_tickers(tickers_count, rnd)
+    raw_weights = [rnd.paretovariate(1.5) for _ in tickers]
+    scale = 100 / sum(raw_weights)
+
+    items = []
+    for ticker, raw_weight in zip(tickers, raw_weights):
+        lot_size = rnd.choice(LOT_SIZES)
+        last_price = round(rnd.uniform(50, 8000) / lot_size ** 0.5, 2) or 0.01
+        items.append(IndexItem(ticker=ticker, shortnames=ticker, weight=round(raw_weight * scale, 4),
+                               lot_size=lot_size, isin=f"RU000{ticker}", last_price=last_price))
+
+    return Index(name="SYNTH", date="2025-06-17", items=items)
+
+
+def make_positions(index: Index, cash: float, fill: float = 0.5, seed: int = 0) -> Positions:
+    """
+    Синтетические позиции по бумагам индекса.
+    :param index: Индекс, из бумаг которого собирается портфель
+    :param cash: Свободные средства на счете, руб.
+    :param fill: Доля бумаг индекса, которые уже есть в портфеле
+    :param seed: Зерно генератора
+    :return: Позиции на счете
+    """
+    rnd = random.Random(seed)
+    shares = []
+    for item in index.items:
+        if rnd.random() < fill:
+            price = item.last_price * rnd.uniform(0.97, 1.03)
+            shares.append(PositionsInstrument(uid=f"uid-{item.ticker}", figi=f"figi-{item.ticker}",
+                                              balance=item.lot_size * rnd.randint(1, 50),
+                                              last_price=to_cash(price), lot_size=item.lot_size,
+                                              ticker=item.ticker, type="share"))
+
+    money = to_cash(cash)
+    return Positions(cash=PositionsCash(units=money.units, nano=money.nano, currency="rub"), shares=shares)
+
+
+@dataclass()
+class FakeSecurity:
+    instrument_uid: str
+    instrument_type: str
+    balance: int
+
+
+@dataclass()
+class FakeLastPrice:
+    instrument_uid: str
+    price: Cash
+
+
+class FakeClient:
+    """
+    Заглушка клиента T-Invest API с ответами по заранее собранным позициям
+    """
+
+    def __init__(self, positions: Positions):
+        self.securities = [FakeSecurity(s.uid, s.type, s.balance) for s in positions.shares]
+        self.money = [positions.cash]
+        self.prices = {s.uid: s.last_price for s in positions.shares}
+        self.operations = self
+        self.market_data = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return None
+
+    def get_positions(self, account_id: str):
+        return self
+
+    def get_last_prices(self, instrument_id: list[str]):
+        self.last_prices = [FakeLastPrice(uid, self.prices[uid]) for uid in instrument_id]
+        return self
+
+
+class FakeBroker:
+    """
+    Заглушка TBroker: клиент без сети и справочник инструментов в памяти
+    """
+
+    def __init__(self, positions: Positions):
+        from src.services.prices import PriceTable
+
+        self.positions = positions
+        self.prices = PriceTable()
+        self.instruments = {
+            s.uid: InstrumentBase(s.uid, s.figi, s.ticker, s.lot_size, None, s.type)
+            for s in positions.shares
+        }
+
+    def get_client(self):
+        return FakeClient(self.positions)
+
+    def find_instrument(self, value: str, field: str = "uid") -> InstrumentBase | None:
+        return self.instruments.get(value)
+
+    def cached_last_prices(self, uids: list[str]) -> tuple[dict, list[str]]:
+        return {}, list(uids)
+
+    def cached_positions(self, account_id: str) -> Positions | None:
+        return None
+
+    def remember_positions(self, account_id: str, positions: Positions) -> None:
+        return None
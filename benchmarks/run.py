@@ -0,0 +1,182 @@
+"""
+Бенчмарки балансировщика, разбора ответов Мосбиржи и построения позиций.
+
+Запуск из корня репозитория:
+    python -m benchmarks.run --output bench_results.json
+    python -m benchmarks.run --only balancer --engines heap,closed_form
+    python -m benchmarks.run --output new.json --compare old.json
+
+Результаты пишутся в JSON, сравнение с прошлым файлом показывает замедление по каждому замеру.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+from unittest.mock import patch
+
+from src.core.balancer import Balancer
+from src.services.stock_market import Moex
+
+from benchmarks.generators import make_index, make_positions, FakeBroker
+
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "data")
+
+TICKERS_COUNTS = [10, 50, 100, 500]
+CASH_AMOUNTS = [1_000, 100_000, 10_000_000, 100_000_000]
+ENGINES = ["iterative", "heap", "closed_form", "min_orders"]
+
+
+def load_payload(filename: str) -> dict:
+    with open(os.path.join(DATA_PATH, filename), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def measure(name: str, func, repeat: int, **params) -> dict:
+    """
+    Замеряет время выполнения функции несколько раз
+    :param name: Название замера
+    :param func: Функция без аргументов
+    :param repeat: Количество повторов
+    :param params: Параметры замера, попадают в результат
+    :return: Результат замера в секундах
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    result = {
+        "name": name,
+        "params": params,
+        "repeat": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+    }
+    print(f"{name} {params}: median {result['median'] * 1000:.3f} ms")
+    return result
+
+
+def bench_balancer(repeat: int, engines: list[str], max_iterations: int) -> list[dict]:
+    results = []
+    for tickers_count in TICKERS_COUNTS:
+        index = make_index(tickers_count)
+        for cash in CASH_AMOUNTS:
+            positions = make_positions(index, cash)
+            for engine in engines:
+                results.append(measure(
+                    "balancer.calculate_actions",
+                    lambda: Balancer(positions, index, engine=engine,
+                                     max_iterations=max_iterations).calculate_actions(),
+                    repeat, tickers=tickers_count, cash=cash, engine=engine, max_iterations=max_iterations
+                ))
+    return results
+
+
+def bench_moex(repeat: int) -> list[dict]:
+    analytics = load_payload("imoex_analytics.json")
+    securities = load_payload("imoex_securities.json")
+
+    def fetch_json(url, params):
+        return analytics if "analytics" in url else securities
+
+    moex = Moex()
+    with patch.object(moex, "_fetch_json", side_effect=fetch_json):
+        return [measure("moex.get_index_list", lambda: moex.get_index_list("IMOEX"), repeat,
+                        tickers=len(analytics["analytics"]["data"]))]
+
+
+def bench_positions(repeat: int) -> list[dict]:
+    from src.services.broker import TAccount
+
+    results = []
+    for tickers_count in TICKERS_COUNTS:
+        positions = make_positions(make_index(tickers_count), 100_000, fill=1)
+        account = TAccount("bench-account", FakeBroker(positions))
+        results.append(measure("taccount.get_positions", account.get_positions, repeat,
+                               positions=len(positions.shares)))
+        results.append(measure("positions.shares_to_dataframe", positions.shares_to_dataframe, repeat,
+                               positions=len(positions.shares)))
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """
+    Сравнивает медианы замеров с прошлым запуском
+    :param baseline: Результаты прошлого запуска
+    :param current: Результаты текущего запуска
+    :param threshold: Во сколько раз замер может быть медленнее без признания регрессией
+    :return: Были ли регрессии
+    """
+    def key(result: dict) -> str:
+        return f"{result['name']} {json.dumps(result['params'], sort_keys=True)}"
+
+    previous = {key(r): r for r in baseline["results"]}
+    regressions = False
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if not before or not before["median"]:
+            continue
+        ratio = result["median"] / before["median"]
+        mark = "REGRESSION" if ratio > threshold else ""
+        regressions |= ratio > threshold
+        print(f"{key(result)}: {before['median'] * 1000:.3f} -> {result['median'] * 1000:.3f} ms "
+              f"(x{ratio:.2f}) {mark}")
+    return regressions
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки ShadowTrader")
+    parser.add_argument("--output", default="bench_results.json", help="Куда записать результаты")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество повторов каждого замера")
+    parser.add_argument("--only", choices=["balancer", "moex", "positions"], action="append",
+                        help="Запустить только выбранные группы замеров")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="Движки балансировщика через запятую")
+    parser.add_argument("--max-iterations", type=int, default=2000,
+                        help="Ограничение шагов пошаговых движков, чтобы замер не длился часами")
+    parser.add_argument("--compare", help="Файл с результатами прошлого запуска для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Допустимое замедление при сравнении")
+    args = parser.parse_args()
+
+    groups = args.only or ["balancer", "moex", "positions"]
+    results = []
+    if "balancer" in groups:
+        results += bench_balancer(args.repeat, args.engines.split(","), args.max_iterations)
+    if "moex" in groups:
+        results += bench_moex(args.repeat)
+    if "positions" in groups:
+        results += bench_positions(args.repeat)
+
+    report = {
+        "created": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
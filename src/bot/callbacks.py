@@ -41,17 +41,17 @@ async def callbacks_account(
     """
     account_id = callback_data.account_id
     manager = PortfolioManager()
-    account = [acc for acc in manager.get_user_accounts() if acc.id == account_id]
+    account = [acc for acc in await manager.get_user_accounts_async() if acc.id == account_id]
 
     ConfigLoader.update_broker_account(callback.from_user.id, account_id, account[0].name, callback_data.target)
     updated_settings = ConfigLoader.config
     if callback_data.target == "index_bindings":
-        await tracking_index_setting_message(callback.message, manager.get_indices_list())
+        await tracking_index_setting_message(callback.message, await manager.get_indices_list_async())
     elif callback_data.target == "bonds_account":
         await callable_bonds_account_selected_message(callback.message)
 
         user = [user for user in settings.users if user.telegram_id == callback.from_user.id][0]
-        callable_bonds = manager.get_callable_bonds(account_id)
+        callable_bonds = await manager.get_callable_bonds_async(account_id)
         reminder_state = user.schedule.enable_bond_reminder
         await account_callable_bonds_message(callback.message, callable_bonds, reminder_state, account_id)
     await callback.answer()
@@ -103,9 +103,9 @@ async def callbacks_actions(
         broker_account_id = user.index_bindings.broker_account_id
 
         manager = PortfolioManager(broker_account_id)
-        portfolio = manager.get_portfolio()
-        index_moex = manager.get_index_list(user.index_bindings.index_name)
-        actions, new_balance = manager.get_action_for_rebalance(portfolio, index_moex)
+        portfolio = await manager.get_portfolio_async()
+        index_moex = await manager.get_index_list_async(user.index_bindings.index_name)
+        actions, new_balance = await manager.get_action_for_rebalance_async(portfolio, index_moex)
 
         await portfolio_structure_message(callback.message, portfolio)
         await state.update_data(manager=manager)
@@ -119,19 +119,19 @@ async def callbacks_actions(
         if broker_account_for_bonds:
             broker_account_id = broker_account_for_bonds.broker_account_id
             manager = PortfolioManager(broker_account_id)
-            callable_bonds = manager.get_callable_bonds()
+            callable_bonds = await manager.get_callable_bonds_async()
             reminder_state = user.schedule.enable_bond_reminder
             await account_callable_bonds_message(callback.message, callable_bonds, reminder_state, broker_account_id)
         else:
 
             manager = PortfolioManager()
-            accounts = manager.get_user_accounts()
+            accounts = await manager.get_user_accounts_async()
             await callable_bonds_account_selecting_message(callback.message, accounts)
         await callback.answer()
 
     if callback_data.action == "relinked":
         manager = PortfolioManager()
-        accounts = manager.get_user_accounts()
+        accounts = await manager.get_user_accounts_async()
         await change_user_index_bindings_answer(callback.message, accounts)
         await callback.answer()
 
@@ -144,7 +144,7 @@ async def callbacks_balance_actions(
 ):
     state_data = await state.get_data()
     manager: PortfolioManager = state_data.get("manager")
-    success_action_list, error_action_list = manager.execute_actions()
+    success_action_list, error_action_list = await manager.execute_actions_async()
 
     await actions_result_message(callback.message, success_action_list, error_action_list)
     await callback.answer()
@@ -209,7 +209,7 @@ async def callbacks_set_callable_bonds_account(
     :return:
     """
     manager = PortfolioManager()
-    accounts = manager.get_user_accounts()
+    accounts = await manager.get_user_accounts_async()
     await callable_bonds_account_selecting_message(callback.message, accounts)
     await callback.answer()
 
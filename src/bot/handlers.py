@@ -2,15 +2,20 @@ import logging
 
 from aiogram import Router, F
 from aiogram.types import Message
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 
 from src.core.portfolio_manager import PortfolioManager
 
-from src.config import settings
+from src.config import settings, ConfigLoader
 
-from src.bot.texts import welcome_head
+from src.bot.texts import welcome_head, profiling_usage_template
 from src.bot.utils import check_index_bindings_exist
-from src.bot.ui import welcome_user_answer, change_user_index_bindings_answer, user_settings_message
+from src.bot.ui import welcome_user_answer, change_user_index_bindings_answer, user_settings_message, stats_message
+from src.bot.ui import profiling_state_message
+
+from src.services.metrics import registry as metrics
+from src.services.cache import cache_stats
+from src.services.profiling import profile_dir
 
 from src.db.database import get_session
 from src.db.repositories.task_repository import TaskRepository
@@ -28,7 +33,7 @@ async def cmd_start(message: Message):
         await welcome_user_answer(message, index_bindings, welcome_head)
     else:
         manager = PortfolioManager()
-        accounts = manager.get_user_accounts()
+        accounts = await manager.get_user_accounts_async()
         await change_user_index_bindings_answer(message, accounts, welcome_head)
 
 
@@ -63,5 +68,42 @@ async def cmd_settings(message: Message):
         await user_settings_message(message, user_settings, bond_last_checked_date)
     else:
         manager = PortfolioManager()
-        accounts = manager.get_user_accounts()
-        await change_user_index_bindings_answer(message, accounts, welcome_head)
\ No newline at end of file
+        accounts = await manager.get_user_accounts_async()
+        await change_user_index_bindings_answer(message, accounts, welcome_head)
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    """
+    Логика выполнения команды /stats.
+    Возвращает количество, среднюю длительность и p95 внешних вызовов, заданий и обработчиков,
+    а также статистику кэшей.
+    :param message:
+    :return:
+    """
+    await stats_message(message, metrics.summary(), cache_stats())
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, command: CommandObject):
+    """
+    Логика выполнения команды /profile.
+    /profile on [доля] - включить профилирование заданий планировщика и обработчиков кнопок,
+    /profile off - выключить, без аргументов - показать текущее состояние.
+    Настройка сохраняется в конфиг.
+    :param message:
+    :param command: Аргументы команды
+    :return:
+    """
+    args = (command.args or "").split()
+    if args:
+        try:
+            if args[0] not in ("on", "off") or len(args) > 2:
+                raise ValueError(args)
+            sample_rate = float(args[1]) if len(args) == 2 else None
+            ConfigLoader.update_profiling(args[0] == "on", sample_rate)
+        except ValueError:
+            await message.answer(profiling_usage_template)
+            return
+
+    await profiling_state_message(message, settings.profiling, profile_dir())
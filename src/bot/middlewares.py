@@ -0,0 +1,39 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from src.services.metrics import registry as metrics, BOT_HANDLER
+from src.services.profiling import profile
+
+
+def _handler_name(event: TelegramObject, data: Dict[str, Any]) -> str:
+    handler_object = data.get("handler")
+    return getattr(getattr(handler_object, "callback", None), "__name__", type(event).__name__)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Замеряет длительность обработчиков бота. Регистрируется как внутренний middleware,
+    чтобы в данных уже был выбранный обработчик
+    """
+
+    async def __call__(self,
+                      handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                      event: TelegramObject,
+                      data: Dict[str, Any]) -> Any:
+        with metrics.timer(BOT_HANDLER, handler=_handler_name(event, data)):
+            return await handler(event, data)
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """
+    Профилирует обработчики бота, когда профилирование включено в настройках
+    """
+
+    async def __call__(self,
+                      handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                      event: TelegramObject,
+                      data: Dict[str, Any]) -> Any:
+        with profile(_handler_name(event, data)):
+            return await handler(event, data)
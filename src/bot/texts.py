@@ -31,3 +31,11 @@ callable_bonds_account_selecting_template = """Выберете счёт бро
 Кол-во счетов обнаружено: $accounts_count
 """
 callable_bonds_account_selected_template = "Счёт брокера для отслеживания облигации обновлён."
+stats_head_template = "Метрика [метки]: кол-во, среднее мс, p95 мс"
+stats_text_template = "$metric [$labels]: $count, $avg, $p95"
+stats_cache_head_template = "Кэши: попадания / промахи / размер"
+stats_cache_text_template = "$name: $hits / $misses / $size"
+stats_empty_template = "Метрик пока нет"
+profiling_state_template = """Профилирование: $state, доля вызовов: $sample_rate
+Результаты: $path"""
+profiling_usage_template = "Использование: /profile on [доля вызовов от 0 до 1] | off"
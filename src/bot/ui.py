@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
 from aiogram.types import Message
 
@@ -11,6 +11,9 @@ from src.bot.texts import user_settings_text_template, bonds_reminder_template
 from src.bot.texts import callable_bonds_head_template, callable_bonds_text_template
 from src.bot.texts import callable_bonds_account_selecting_template, callable_bonds_account_selected_template
 from src.bot.texts import user_settings_text_template_with_bonds
+from src.bot.texts import stats_head_template, stats_text_template, stats_empty_template
+from src.bot.texts import stats_cache_head_template, stats_cache_text_template
+from src.bot.texts import profiling_state_template
 
 from src.bot.utils import AccountCallbackFactory, BalanceActionsCallbackFactory, ActionsCallbackFactory
 from src.bot.utils import ScheduleCallbackFactory, SetIndexCallbackFactory
@@ -21,7 +24,7 @@ from src.models.positions import Positions
 from src.models.action import Action
 from src.models.error import Error
 from src.models.scheduler_frequency import ScheduleFrequency
-from src.models.config import UserIndexBindingsConfig, UserConfig
+from src.models.config import UserIndexBindingsConfig, UserConfig, ProfilingConfig
 from src.models.bond import Bond
 
 #region Keys
@@ -280,4 +283,49 @@ async def callable_bonds_account_selected_message(message: Message):
     """
     await message.answer(callable_bonds_account_selected_template)
 
+async def stats_message(message: Message, summary: List[dict], caches: Dict[str, dict]):
+    """
+    Формирует и отправляет сообщение со сводкой метрик длительности и статистикой кэшей.
+    :param message: Сообщение, на которое необходимо ответить.
+    :param summary: Сводка метрик, как в MetricsRegistry.summary
+    :param caches: Статистика кэшей, как в cache_stats
+    """
+    if not summary and not caches:
+        await message.answer(stats_empty_template)
+        return
+
+    mes = stats_head_template + "\n" + "\n".join(
+        [
+            Template(stats_text_template).substitute(
+                metric=_item["metric"],
+                labels=", ".join(f"{k}={v}" for k, v in _item["labels"].items()),
+                count=_item["count"],
+                avg=f"{_item['avg'] * 1000:.0f}",
+                p95=f"{_item['p95'] * 1000:.0f}"
+            ) for _item in summary
+        ]
+    )
+    if caches:
+        mes = mes + "\n\n" + stats_cache_head_template + "\n" + "\n".join(
+            [
+                Template(stats_cache_text_template).substitute(name=_name, **_stats)
+                for _name, _stats in caches.items()
+            ]
+        )
+    await message.answer(mes)
+
+async def profiling_state_message(message: Message, profiling: ProfilingConfig, path: str):
+    """
+    Сообщение о текущем состоянии профилирования.
+    :param message: Сообщение, на которое необходимо ответить.
+    :param profiling: Настройки профилирования
+    :param path: Каталог с результатами
+    """
+    mes = Template(profiling_state_template).substitute(
+        state="включено" if profiling.enabled else "выключено",
+        sample_rate=profiling.sample_rate,
+        path=path
+    )
+    await message.answer(mes)
+
 #endregion Message
\ No newline at end of file
@@ -7,6 +7,7 @@ from datetime import datetime
 from typing import Any
 
 from src.models.config import AppConfig, UserIndexBindingsConfig, UserScheduleConfig, BrokerAccountConfig
+from src.models.config import ProfilingConfig
 
 
 ENV = os.getenv("APP_ENV", "prod")
@@ -117,3 +118,17 @@ class ConfigLoader:
             new_data=new_data,
             model_cls=UserScheduleConfig
         )
+
+    @classmethod
+    def update_profiling(cls, enabled: bool, sample_rate: float = None):
+        """
+        Включение/выключение профилирования без перезапуска.
+        :param enabled: Флаг включения/выключения.
+        :param sample_rate: Доля профилируемых вызовов, если нужно изменить.
+        """
+        if sample_rate is not None and not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1]")
+        data = cls.config.profiling.model_dump()
+        data.update({k: v for k, v in {"enabled": enabled, "sample_rate": sample_rate}.items() if v is not None})
+        cls.config.profiling = ProfilingConfig(**data)
+        cls.save()
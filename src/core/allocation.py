@@ -0,0 +1,309 @@
+import time
+
+import numpy as np
+
+
+def outside_band(weight: np.ndarray, target_weight: np.ndarray, delta: float):
+    """
+    Бумаги, вес которых вышел за допустимое отклонение от целевого
+    :param weight: Текущий вес (доля от 0 до 1)
+    :param target_weight: Целевой вес (доля от 0 до 1)
+    :param delta: Допустимое отклонение
+    :return: Маски перевеса и недобора
+    """
+    weight = np.asarray(weight, dtype=float)
+    target_weight = np.asarray(target_weight, dtype=float)
+    return weight > target_weight * (1 + delta), target_weight > weight * (1 + delta)
+
+
+def lots_to_sell(balance: np.ndarray, lot_size: np.ndarray, last_price: np.ndarray,
+                 total: float, target_weight: np.ndarray, min_lots_to_keep: float) -> np.ndarray:
+    """
+    Количество лотов, которое можно продать, не опускаясь ниже целевого веса.
+    Повторяет условия поштучной продажи: после продажи остаётся больше лота,
+    вес не ниже целевого и сохраняется минимум лотов.
+    :param balance: Количество бумаг на счете
+    :param lot_size: Размер лота
+    :param last_price: Цена одной бумаги
+    :param total: Общая стоимость портфеля
+    :param target_weight: Целевой вес (доля от 0 до 1)
+    :param min_lots_to_keep: Минимальное количество лотов, которое нельзя продавать
+    :return: Количество лотов на продажу по каждой бумаге
+    """
+    balance = np.asarray(balance, dtype=float)
+    lot_size = np.asarray(lot_size, dtype=float)
+    last_price = np.asarray(last_price, dtype=float)
+    target_weight = np.asarray(target_weight, dtype=float)
+
+    # После каждой продажи на счете должно оставаться больше одного лота
+    by_lot = np.ceil(balance / lot_size) - 1
+    # и не меньше min_lots_to_keep лотов
+    by_keep = np.ceil(balance // lot_size - min_lots_to_keep + 1) - 1
+
+    # Вес после продажи не должен опускаться ниже целевого
+    with np.errstate(divide="ignore", invalid="ignore"):
+        by_weight = np.floor((balance - target_weight * total / last_price) / lot_size)
+    by_weight = np.nan_to_num(by_weight, nan=0, posinf=0, neginf=0)
+
+    # Поправка на погрешность деления: проверяем условие так же, как при поштучной продаже
+    by_weight -= (balance - by_weight * lot_size) * last_price / total < target_weight
+    by_weight += (balance - (by_weight + 1) * lot_size) * last_price / total >= target_weight
+
+    return np.maximum(np.minimum(np.minimum(by_lot, by_keep), by_weight), 0).astype(int)
+
+
+def lots_to_target(value: np.ndarray, lot_size: np.ndarray, last_price: np.ndarray,
+                   total: float, target_weight: np.ndarray) -> np.ndarray:
+    """
+    Количество целых лотов, которое нужно докупить, чтобы приблизиться к целевому весу снизу.
+    :param value: Текущая стоимость позиции
+    :param lot_size: Размер лота
+    :param last_price: Цена одной бумаги
+    :param total: Общая стоимость портфеля
+    :param target_weight: Целевой вес (доля от 0 до 1)
+    :return: Количество лотов на покупку по каждой бумаге
+    """
+    lot_price = np.asarray(lot_size, dtype=float) * np.asarray(last_price, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lots = np.floor((np.asarray(target_weight) * total - np.asarray(value)) / lot_price)
+    lots = np.nan_to_num(lots, nan=0, posinf=0, neginf=0)
+    return np.maximum(lots, 0).astype(int)
+
+
+def fit_to_cash(lots: np.ndarray, lot_cost: np.ndarray, free_cash) -> np.ndarray:
+    """
+    Уменьшает количество лотов пропорционально, если на все покупки не хватает средств.
+    Массивы могут быть как по тикерам одного портфеля, так и матрицей счета × тикеры.
+    :param lots: Желаемое количество лотов
+    :param lot_cost: Стоимость лота с учётом комиссии
+    :param free_cash: Доступные средства (по каждому счету для матрицы)
+    :return: Количество лотов, которое можно оплатить
+    """
+    cost = (lots * lot_cost).sum(axis=-1, keepdims=True)
+    free_cash = np.reshape(free_cash, (-1, 1)) if np.ndim(lots) > 1 else free_cash
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where((cost < free_cash) | (cost == 0), 1, free_cash / cost)
+    return np.floor(lots * scale).astype(int)
+
+
+def spend_residual(lots: np.ndarray, value: np.ndarray, lot_size: np.ndarray, last_price: np.ndarray,
+                   total, target_weight: np.ndarray, commission: float, free_cash):
+    """
+    Жадно тратит остаток средств: по одному лоту в бумаги с наибольшим недобором до целевого веса.
+    Каждая бумага просматривается один раз, поэтому время не зависит от суммы на счете.
+    Для матрицы счета × тикеры проход идёт по рангу бумаги сразу по всем счетам.
+    :param lots: Уже распределённое количество лотов на покупку
+    :param value: Стоимость позиций до покупки
+    :param lot_size: Размер лота
+    :param last_price: Цена одной бумаги
+    :param total: Общая стоимость портфеля (по каждому счету для матрицы)
+    :param target_weight: Целевой вес (доля от 0 до 1)
+    :param commission: Комиссия брокера
+    :param free_cash: Остаток средств после распределения (по каждому счету для матрицы)
+    :return: Итоговое количество лотов и остаток средств
+    """
+    single = np.ndim(lots) == 1
+    lots = np.atleast_2d(lots).copy()
+    value = np.atleast_2d(value)
+    total = np.reshape(np.asarray(total, dtype=float), -1)
+    free_cash = np.reshape(np.array(free_cash, dtype=float), -1).copy()
+
+    lot_price = np.asarray(lot_size) * np.asarray(last_price)
+    lot_cost = np.broadcast_to(lot_price * (1 + commission), lots.shape)
+    value_after = value + lots * lot_price
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.broadcast_to(np.where(target_weight > 0, value_after / target_weight, np.inf), lots.shape)
+
+    rows = np.arange(lots.shape[0])
+    order = np.argsort(ratio, axis=-1, kind="stable")
+    for rank in range(lots.shape[1]):
+        i = order[:, rank]
+        # Бумаги, которые уже добраны до целевого веса, не докупаем
+        needed = ratio[rows, i] < total
+        if not needed.any():
+            break
+        buy = needed & (lot_cost[rows, i] < free_cash)
+        lots[rows[buy], i[buy]] += 1
+        free_cash[buy] -= lot_cost[rows[buy], i[buy]]
+
+    if single:
+        return lots[0], float(free_cash[0])
+    return lots, free_cash
+
+
+def greedy_fill(value: np.ndarray, lot_size: np.ndarray, last_price: np.ndarray,
+                total: float, target_weight: np.ndarray, commission: float, free_cash: float):
+    """
+    Раскладывает свободные средства только покупками. Бумаги сортируются по недобору до целевого веса,
+    каждая по очереди добирается до цели целыми лотами, пока хватает средств.
+    Остаток докупается по одному лоту, в первую очередь в бумаги, по которым заявка уже есть.
+    Сортировка - O(N log N), дальше каждая бумага просматривается не больше двух раз.
+    :param value: Текущая стоимость позиции
+    :param lot_size: Размер лота
+    :param last_price: Цена одной бумаги
+    :param total: Общая стоимость портфеля вместе со свободными средствами
+    :param target_weight: Целевой вес (доля от 0 до 1)
+    :param commission: Комиссия брокера
+    :param free_cash: Свободные средства
+    :return: Количество лотов на покупку и остаток средств
+    """
+    value = np.asarray(value, dtype=float)
+    target_weight = np.asarray(target_weight, dtype=float)
+    lot_price = np.asarray(lot_size, dtype=float) * np.asarray(last_price, dtype=float)
+    lot_cost = lot_price * (1 + commission)
+
+    wanted = lots_to_target(value, lot_size, last_price, total, target_weight)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(target_weight > 0, value / target_weight, np.inf)
+
+    lots = np.zeros(len(value), dtype=int)
+    for i in np.argsort(ratio, kind="stable"):
+        if ratio[i] >= total or free_cash < lot_cost[i]:
+            continue
+        affordable = int(free_cash // lot_cost[i])
+        lots[i] = min(wanted[i], affordable)
+        free_cash -= lots[i] * lot_cost[i]
+
+    # Остаток по одному лоту: сначала в бумаги с заявкой, чтобы не плодить новые заявки
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(target_weight > 0, (value + lots * lot_price) / target_weight, np.inf)
+    for i in np.lexsort((ratio, lots == 0)):
+        if ratio[i] < total and lot_cost[i] < free_cash:
+            lots[i] += 1
+            free_cash -= lot_cost[i]
+
+    return lots, float(free_cash)
+
+
+def closed_form_plan(balance: np.ndarray, hold_price: np.ndarray, target_weight: np.ndarray,
+                     lot_size: np.ndarray, last_price: np.ndarray, free_cash: np.ndarray,
+                     delta: float, commission: float, min_lots_to_keep: float):
+    """
+    План балансировки сразу для матрицы счета × тикеры (тикеры в порядке индекса).
+    Перевес за пределами допустимого отклонения продаётся до целевого веса, недобор докупается
+    целыми лотами, а остаток средств раскладывается жадно по одному лоту.
+    :param balance: Количество бумаг на счетах
+    :param hold_price: Цена позиции на счетах
+    :param target_weight: Целевой вес (доля от 0 до 1)
+    :param lot_size: Размер лота
+    :param last_price: Цена бумаги по индексу
+    :param free_cash: Свободные средства на счетах
+    :param delta: Допустимое отклонение от целевого веса
+    :param commission: Комиссия брокера
+    :param min_lots_to_keep: Минимальное количество лотов, которое нельзя продавать
+    :return: Лоты на продажу, лоты на покупку, остаток средств на счетах
+    """
+    free_cash = np.array(free_cash, dtype=float)
+    value = balance * hold_price
+    total_value = value.sum(axis=-1) + free_cash
+
+    # Продаём перевес за пределами допустимого отклонения
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = value / total_value[:, None] / target_weight
+    sell_lots = lots_to_sell(balance, lot_size, last_price, total_value[:, None],
+                             target_weight, min_lots_to_keep)
+    sell_lots = np.where(ratio > 1 + delta, sell_lots, 0)
+    sell_price = sell_lots * lot_size * last_price
+    free_cash += (sell_price * (1 - commission)).sum(axis=-1)
+    value = value - sell_lots * lot_size * hold_price
+
+    # Докупаем недобор до целевого веса
+    total_value = value.sum(axis=-1) + free_cash
+    buy_condition = target_weight > value / total_value[:, None] * (1 + delta)
+    lot_cost = lot_size * last_price * (1 + commission)
+    buy_lots = lots_to_target(value, lot_size, last_price, total_value[:, None], target_weight)
+    buy_lots = fit_to_cash(np.where(buy_condition, buy_lots, 0), lot_cost, free_cash)
+    free_cash -= (buy_lots * lot_cost).sum(axis=-1)
+    buy_lots, free_cash = spend_residual(buy_lots, value, lot_size, last_price, total_value,
+                                         target_weight, commission, free_cash)
+
+    return sell_lots, buy_lots, free_cash
+
+
+def exact_lots(lots_held: np.ndarray, lot_price: np.ndarray, target_weight: np.ndarray,
+               total: float, free_cash: float, commission: float, min_lots_to_keep: float,
+               buckets: int = 2000, deadline: float = None) -> np.ndarray | None:
+    """
+    Точное распределение целых лотов: для каждой бумаги выбирается итоговое количество лотов,
+    при котором сумма квадратов отклонений весов от целевых минимальна, а на покупки хватает средств.
+    Ограниченный рюкзак: динамика по остатку средств, разбитому на корзины. Стоимость покупки
+    округляется вверх до корзины, выручка от продажи - вниз, поэтому план всегда можно оплатить.
+    Промежуточный остаток может уходить в минус: покупку оплачивает продажа бумаги, которая идёт позже.
+    :param lots_held: Количество лотов на счете
+    :param lot_price: Стоимость лота
+    :param target_weight: Целевой вес (доля от 0 до 1)
+    :param total: Общая стоимость портфеля
+    :param free_cash: Свободные средства
+    :param commission: Комиссия брокера
+    :param min_lots_to_keep: Минимальное количество лотов, которое нельзя продавать
+    :param buckets: На сколько корзин делится остаток средств
+    :param deadline: Момент time.perf_counter(), после которого расчёт прерывается
+    :return: Итоговое количество лотов по каждой бумаге или None, если расчёт прерван
+    """
+    lots_held = np.asarray(lots_held, dtype=int)
+    lot_price = np.asarray(lot_price, dtype=float)
+    capacity = free_cash + (lots_held * lot_price).sum() * (1 - commission)
+    if capacity <= 0:
+        return lots_held.copy()
+
+    step = capacity / buckets
+    keep = np.minimum(lots_held, min_lots_to_keep).astype(int)
+    # Больше лотов, чем хватит средств после продажи всего портфеля, не купить
+    affordable = lots_held + capacity // (lot_price * (1 + commission))
+    top = np.maximum(lots_held, np.minimum(np.ceil(target_weight * total / lot_price), affordable)).astype(int)
+
+    def cash_shift(i: int, lots: np.ndarray) -> np.ndarray:
+        """На сколько корзин уменьшится остаток средств, если оставить на счете lots лотов"""
+        change = (lots - lots_held[i]) * lot_price[i]
+        return np.where(change > 0,
+                        np.ceil(change * (1 + commission) / step),
+                        -(-change * (1 - commission) // step)).astype(int)
+
+    # Корзины ниже нуля - под покупки, которые оплатят продажи следующих бумаг.
+    # Глубже выручки от продажи всех позиций уходить нет смысла
+    below_zero = min(sum(max(int(cash_shift(i, top[i])), 0) for i in range(len(lots_held))),
+                     int(buckets - free_cash // step) + 1)
+    size = below_zero + buckets + 1
+
+    cost = np.full(size, np.inf)
+    cost[below_zero + min(int(free_cash // step), buckets)] = 0
+    choices = []
+    for i in range(len(lots_held)):
+        if deadline is not None and time.perf_counter() > deadline:
+            return None
+
+        # Из вариантов, попадающих в одну корзину, достаточно самого близкого к целевому весу
+        options = np.arange(keep[i], top[i] + 1)
+        shifts = cash_shift(i, options)
+        penalties = (options * lot_price[i] / total - target_weight[i]) ** 2
+        order = np.lexsort((penalties, shifts))
+        first = np.r_[True, np.diff(shifts[order]) != 0]
+        order = order[first]
+
+        best = np.full(size, np.inf)
+        choice = np.zeros(size, dtype=np.int32)
+        for lots, shift, penalty in zip(options[order], shifts[order], penalties[order]):
+            if shift >= size:
+                break
+            if shift >= 0:
+                source, target = slice(shift, size), slice(0, size - shift)
+            else:
+                source, target = slice(0, size + shift), slice(-shift, size)
+            candidate = cost[source] + penalty
+            better = candidate < best[target]
+            best[target] = np.where(better, candidate, best[target])
+            choice[target] = np.where(better, lots, choice[target])
+        cost = best
+        choices.append(choice)
+
+    # В итоге остаток средств не может быть отрицательным
+    state = below_zero + int(np.argmin(cost[below_zero:]))
+    if not np.isfinite(cost[state]):
+        return None
+
+    lots = np.zeros(len(lots_held), dtype=int)
+    for i in reversed(range(len(lots_held))):
+        lots[i] = choices[i][state]
+        state += int(cash_shift(i, lots[i]))
+    return lots
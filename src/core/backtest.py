@@ -0,0 +1,256 @@
+import json
+from datetime import datetime
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config import settings
+
+from src.core.balancer import Balancer
+
+from src.models.index import Index, IndexItem
+from src.models.positions import Positions, PositionsCash, PositionsInstrument, Cash
+from src.models.scheduler_frequency import should_rebalance
+
+
+@dataclass()
+class BacktestData:
+    """
+    История индекса в колоночном виде: строки - даты, столбцы - тикеры
+    """
+
+    dates: np.ndarray  # datetime64[D], (T,)
+    tickers: List[str]  # (N,)
+    lot_sizes: np.ndarray  # (N,)
+    prices: np.ndarray  # (T, N), nan - нет цены
+    weights: np.ndarray  # (T, N), вес в индексе в процентах, 0 - бумаги нет в индексе
+
+    @classmethod
+    def from_indices(cls, indices: List[Index], prices: Dict[str, Dict[str, float]] = None) -> "BacktestData":
+        """
+        Собирает историю из составов индекса на даты и снимков цен.
+        Состав действует до следующей даты, цены без снимка берутся из состава индекса.
+        :param indices: Составы индекса, дата в формате YYYY-MM-DD
+        :param prices: Цены по датам: {дата: {тикер: цена}}
+        :return: История индекса
+        """
+        prices = prices or {}
+        indices = sorted(indices, key=lambda i: i.date)
+        dates = sorted({i.date for i in indices} | set(prices))
+
+        tickers, lot_sizes = [], {}
+        for index in indices:
+            for item in index.items:
+                if item.ticker not in lot_sizes:
+                    tickers.append(item.ticker)
+                lot_sizes[item.ticker] = item.lot_size
+        columns = {ticker: i for i, ticker in enumerate(tickers)}
+
+        price_table = np.full((len(dates), len(tickers)), np.nan)
+        weight_table = np.full((len(dates), len(tickers)), np.nan)
+        rows = {date: i for i, date in enumerate(dates)}
+        for index in indices:
+            weight_table[rows[index.date]] = 0
+            for item in index.items:
+                weight_table[rows[index.date], columns[item.ticker]] = item.weight
+                price_table[rows[index.date], columns[item.ticker]] = item.last_price
+        for date, snapshot in prices.items():
+            for ticker, price in snapshot.items():
+                if ticker in columns:
+                    price_table[rows[date], columns[ticker]] = price
+
+        return cls(
+            dates=np.array(dates, dtype="datetime64[D]"),
+            tickers=tickers,
+            lot_sizes=np.array([lot_sizes[t] for t in tickers], dtype=float),
+            prices=price_table,
+            weights=np.nan_to_num(_forward_fill(weight_table), nan=0),
+        )
+
+    @classmethod
+    def from_json(cls, path: str) -> "BacktestData":
+        """
+        Загружает историю из JSON: {"dates": [...], "tickers": [...], "lot_sizes": [...],
+        "prices": [[...]], "weights": [[...]]}
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        return cls(
+            dates=np.array(data["dates"], dtype="datetime64[D]"),
+            tickers=data["tickers"],
+            lot_sizes=np.array(data["lot_sizes"], dtype=float),
+            prices=np.array(data["prices"], dtype=float),
+            weights=np.array(data["weights"], dtype=float),
+        )
+
+
+@dataclass()
+class BacktestResult:
+    """
+    Результат прогона: кривая стоимости портфеля и статистика оборота
+    """
+
+    dates: np.ndarray
+    equity: np.ndarray
+    cash: np.ndarray
+    rebalance_dates: List[str]
+    orders: int
+    traded_value: float
+    commission_paid: float
+
+    @property
+    def turnover(self) -> float:
+        """Оборот сделок относительно средней стоимости портфеля"""
+        mean_equity = float(self.equity.mean()) if len(self.equity) else 0
+        return self.traded_value / mean_equity if mean_equity else 0
+
+    @property
+    def total_return(self) -> float:
+        return float(self.equity[-1] / self.equity[0] - 1) if len(self.equity) and self.equity[0] else 0
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame({"date": self.dates, "equity": self.equity, "cash": self.cash})
+
+
+def _forward_fill(table: np.ndarray) -> np.ndarray:
+    """Заполняет пропуски (nan) последним известным значением по каждому столбцу"""
+    rows = np.where(np.isnan(table), 0, np.arange(len(table))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return table[rows, np.arange(table.shape[1])]
+
+
+class Backtester:
+    """
+    Класс прогоняет балансировку по истории индекса. Состав индекса и цены берутся на каждую дату,
+    балансировка выполняется по расписанию ScheduleFrequency, сделки исполняются по цене дня с комиссией.
+    """
+
+    def __init__(self, data: BacktestData, frequency: str,
+                 initial_cash: float = 100_000,
+                 deposits: Optional[np.ndarray] = None,
+                 delta: float = settings.balancer.delta,
+                 commission: float = settings.balancer.commission,
+                 min_lots_to_keep: float = settings.balancer.min_lots_to_keep,
+                 engine: str = settings.balancer.engine,
+                 ):
+        self.data = data
+        self.frequency = frequency
+        self.initial_cash = initial_cash
+        self.deposits = deposits if deposits is not None else np.zeros(len(data.dates))
+
+        self.delta = delta
+        self.commission = commission
+        self.min_lots_to_keep = min_lots_to_keep
+        self.engine = engine
+
+    def _snapshot(self, row: int, holdings: np.ndarray, prices: np.ndarray, cash: float) -> tuple[Positions, Index]:
+        """Позиции и состав индекса на дату в виде моделей для балансировщика"""
+        data = self.data
+        date = str(data.dates[row])
+
+        items = [
+            IndexItem(ticker=data.tickers[i], shortnames=data.tickers[i], weight=float(data.weights[row, i]),
+                      lot_size=int(data.lot_sizes[i]), isin="", last_price=float(prices[i]))
+            for i in np.flatnonzero((data.weights[row] > 0) & np.isfinite(prices))
+        ]
+        shares = []
+        for i in np.flatnonzero(holdings):
+            price = Cash(units=int(prices[i]), nano=int(round((prices[i] - int(prices[i])) * 1e9)))
+            shares.append(PositionsInstrument(uid=data.tickers[i], figi=data.tickers[i], balance=int(holdings[i]),
+                                              last_price=price, lot_size=int(data.lot_sizes[i]),
+                                              ticker=data.tickers[i], type="share"))
+        money = Cash(units=int(cash), nano=int(round((cash - int(cash)) * 1e9)))
+
+        return (Positions(cash=PositionsCash(units=money.units, nano=money.nano, currency="rub"), shares=shares),
+                Index(name="BACKTEST", date=date, items=items))
+
+    def run(self) -> BacktestResult:
+        """
+        Прогоняет историю. Цикл по датам работает только в дни балансировки,
+        стоимость портфеля на остальные даты считается по столбцам разом.
+        :return: Кривая стоимости и статистика
+        """
+        data = self.data
+        prices = _forward_fill(data.prices)
+        columns = {ticker: i for i, ticker in enumerate(data.tickers)}
+        cash_flow = np.asarray(self.deposits, dtype=float).copy()
+        cash_flow[0] += self.initial_cash
+
+        # Изменения позиций и денег по датам, остальные даты заполняются накопленной суммой
+        holdings_change = np.zeros((len(data.dates), len(data.tickers)))
+        holdings = np.zeros(len(data.tickers))
+        cash = 0.0
+
+        last_run = None
+        rebalance_dates, orders, traded_value, commission_paid = [], 0, 0.0, 0.0
+        for row, date in enumerate(data.dates.astype(datetime)):
+            cash += cash_flow[row]
+            now = datetime(date.year, date.month, date.day)
+            if last_run is not None and not should_rebalance(last_run, self.frequency, now):
+                continue
+
+            positions, index = self._snapshot(row, holdings, prices[row], cash)
+            if not index.items:
+                continue
+            # Пакетный расчёт для closed_form обходится без DataFrame, остальные движки считаются как обычно
+            [(actions, _)] = Balancer.calculate_actions_batch([positions], index, self.delta, self.commission,
+                                                              self.min_lots_to_keep, self.engine)
+
+            for action in actions:
+                i = columns[action["ticker"]]
+                shares = action["quantity"] * data.lot_sizes[i]
+                if action["type"] == "SELL":
+                    shares = -min(shares, holdings[i])
+                value = abs(shares) * prices[row, i]
+                fee = value * self.commission
+                cash -= shares * prices[row, i] + fee
+                holdings[i] += shares
+                holdings_change[row, i] += shares
+                traded_value += value
+                commission_paid += fee
+
+            cash_flow[row] = cash - cash_flow[:row].sum()
+            orders += len(actions)
+            rebalance_dates.append(str(data.dates[row]))
+            last_run = now
+
+        holdings_history = np.cumsum(holdings_change, axis=0)
+        cash_history = np.cumsum(cash_flow)
+        equity = (holdings_history * np.nan_to_num(prices)).sum(axis=1) + cash_history
+
+        return BacktestResult(
+            dates=data.dates,
+            equity=equity,
+            cash=cash_history,
+            rebalance_dates=rebalance_dates,
+            orders=orders,
+            traded_value=traded_value,
+            commission_paid=commission_paid,
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from src.models.scheduler_frequency import ScheduleFrequency
+
+    parser = argparse.ArgumentParser(description="Прогон балансировки по истории индекса")
+    parser.add_argument("history", help="JSON с историей: dates, tickers, lot_sizes, prices, weights")
+    parser.add_argument("--frequency", choices=[f.name for f in ScheduleFrequency], default="MONTHLY")
+    parser.add_argument("--cash", type=float, default=100_000)
+    parser.add_argument("--engine", default=settings.balancer.engine)
+    parser.add_argument("--output", help="CSV для кривой стоимости портфеля")
+    args = parser.parse_args()
+
+    result = Backtester(BacktestData.from_json(args.history), args.frequency,
+                        initial_cash=args.cash, engine=args.engine).run()
+
+    print(f"Доходность: {result.total_return:.2%}")
+    print(f"Балансировок: {len(result.rebalance_dates)}, заявок: {result.orders}")
+    print(f"Оборот: {result.traded_value:.2f} ({result.turnover:.2f} средней стоимости), "
+          f"комиссия: {result.commission_paid:.2f}")
+    if args.output:
+        result.to_dataframe().to_csv(args.output, index=False)
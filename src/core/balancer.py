@@ -1,11 +1,19 @@
+import time
+import heapq
+import logging
+import numpy as np
 import pandas as pd
 from typing import List, Tuple, Dict
 
 from src.config import settings
 
+from src.core import allocation
+
 from src.models.positions import Positions
 from src.models.index import Index
 
+logger = logging.getLogger(__name__)
+
 
 class Balancer:
     """
@@ -13,10 +21,19 @@ class Balancer:
 
     """
 
+    # Движки, которые считают пакет счетов одним векторным проходом
+    BATCH_ENGINES = ("closed_form",)
+
     def __init__(self, positions: Positions, index: Index,
                  delta: float = settings.balancer.delta,
                  commission: float = settings.balancer.commission,
                  min_lots_to_keep: float = settings.balancer.min_lots_to_keep,
+                 engine: str = settings.balancer.engine,
+                 max_iterations: int = settings.balancer.max_iterations,
+                 buy_only: bool = settings.balancer.buy_only,
+                 max_orders: int = settings.balancer.max_orders,
+                 exact_threshold: float = settings.balancer.exact_threshold,
+                 exact_time_limit: float = settings.balancer.exact_time_limit,
                  ):
         self.actions = []
         self.positions = positions
@@ -26,6 +43,22 @@ class Balancer:
         self.delta = delta
         self.commission = commission
         self.min_lots_to_keep = min_lots_to_keep
+        self.max_iterations = max_iterations
+        self.buy_only = buy_only
+        self.max_orders = max_orders
+        self.exact_threshold = exact_threshold
+        self.exact_time_limit = exact_time_limit
+
+        engines = {
+            "iterative": self._calculate_actions_iterative,
+            "closed_form": self._calculate_actions_closed_form,
+            "heap": self._calculate_actions_heap,
+            "min_orders": self._calculate_actions_min_orders,
+        }
+        if engine not in engines:
+            raise ValueError(f"Unknown balancer engine: {engine}")
+        self.engine = engine
+        self._engine = engines[engine]
 
     def __calculate_portfolio_value(self, portfolio_dataframe: pd.DataFrame) -> float:
         """Общая стоимость портфеля с учетом свободных средств"""
@@ -115,25 +148,423 @@ class Balancer:
 
         return optimized
 
-    def calculate_actions(self) -> Tuple[List[Dict], float]:
-
-        portfolio_df = self.positions.shares_to_dataframe().set_index("ticker")
-        index_df = self.index.to_dataframe().set_index("ticker")
-
-        # Продаём что исключили из индекса
-        total_value = self.__calculate_portfolio_value(portfolio_df)
-        rebalanced = self.create_weights_dataframe(index_df, portfolio_df, total_value)
-        exclude_positions = rebalanced[rebalanced['target_weight'] == 0]
+    def __sell_excluded(self, index_dataframe: pd.DataFrame, portfolio_dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Продаём то, что исключили из индекса, и убираем эти позиции из портфеля"""
+        total_value = self.__calculate_portfolio_value(portfolio_dataframe)
+        rebalanced = self.create_weights_dataframe(index_dataframe, portfolio_dataframe, total_value)
+        # Бумаги индекса с нулевым весом, которых нет в портфеле, продавать нечего
+        exclude_positions = rebalanced[(rebalanced['target_weight'] == 0) &
+                                       rebalanced.index.isin(portfolio_dataframe.index)]
         for ticker, position in exclude_positions.iterrows():
             self.add_action(
                 "SELL",
                 ticker,
-                int(portfolio_df.at[ticker, 'balance'])
+                int(portfolio_dataframe.at[ticker, 'balance'])
             )
 
-        portfolio_df.drop(exclude_positions.index, inplace=True)
+        return portfolio_dataframe.drop(exclude_positions.index)
+
+    @staticmethod
+    def __portfolio_arrays(index_dataframe: pd.DataFrame,
+                           portfolio_dataframe: pd.DataFrame) -> Tuple[np.ndarray, ...]:
+        """
+        Раскладываем индекс и портфель по массивам в порядке тикеров индекса.
+        Цена позиции берётся из портфеля, для бумаг, которых нет в портфеле, - из индекса.
+        :return: Целевой вес, размер лота, цена по индексу, количество бумаг, цена позиции
+        """
+        target_weight = index_dataframe['weight'].to_numpy(dtype=float) / 100
+        lot_size = index_dataframe['lot_size'].to_numpy(dtype=float)
+        last_price = index_dataframe['last_price'].to_numpy(dtype=float)
+
+        portfolio = portfolio_dataframe.reindex(index_dataframe.index)
+        balance = pd.to_numeric(portfolio['balance']).fillna(0).to_numpy(dtype=float)
+        hold_price = pd.to_numeric(portfolio['last_price']).to_numpy(dtype=float)
+        hold_price = np.where(np.isnan(hold_price), last_price, hold_price)
+
+        return target_weight, lot_size, last_price, balance, hold_price
+
+    @staticmethod
+    def __stack_portfolios(positions_list: List[Positions], index: Index) -> Tuple:
+        """
+        Раскладываем портфели по матрице счета × тикеры в порядке тикеров индекса без DataFrame.
+        Цена позиции берётся из портфеля, для бумаг, которых нет в портфеле, - из индекса.
+        :return: Тикеры, целевой вес, размер лота, цена по индексу, количество бумаг, цена позиции
+            и позиции, исключённые из индекса, по каждому счету
+        """
+        tickers = [item.ticker for item in index.items]
+        columns = {ticker: i for i, ticker in enumerate(tickers)}
+        target_weight = np.array([item.weight for item in index.items], dtype=float) / 100
+        lot_size = np.array([item.lot_size for item in index.items], dtype=float)
+        last_price = np.array([item.last_price for item in index.items], dtype=float)
+
+        balance = np.zeros((len(positions_list), len(tickers)))
+        hold_price = np.tile(last_price, (len(positions_list), 1))
+        excluded = []
+        for row, positions in enumerate(positions_list):
+            excluded.append([])
+            for share in positions.shares:
+                column = columns.get(share.ticker)
+                if column is None or target_weight[column] == 0:
+                    excluded[row].append(share)
+                    continue
+                balance[row, column] = share.balance
+                hold_price[row, column] = share.last_price.to_float()
+
+        return tickers, target_weight, lot_size, last_price, balance, hold_price, excluded
+
+    def calculate_actions(self) -> Tuple[List[Dict], float]:
+        """
+        Рассчитать действия для балансировки движком, выбранным в настройках.
+        Если продавать нечего, а нужно только вложить свободные средства, используется быстрый расчёт покупок.
+        :return: Список действий и прогнозируемый остаток средств после балансировки
+        """
+        plan = self._calculate_actions_fast()
+        if plan is not None:
+            return plan
+        return self._engine()
+
+    def _calculate_actions_fast(self) -> Tuple[List[Dict], float] | None:
+        """
+        Расчёты, которые подменяют движок, если подходят к портфелю: точный для небольших счетов
+        и только покупками для пополнения
+        :return: Список действий и прогнозируемый остаток средств или None, если нужен движок
+        """
+        # Быстрые расчёты торгуют всеми бумагами, а min_orders сам ограничивает число заявок
+        if self.engine == "min_orders":
+            return None
+        for fast_path in (self._calculate_actions_exact, self._calculate_actions_buy_only):
+            plan = fast_path()
+            if plan is not None:
+                return plan
+        return None
+
+    def _calculate_actions_exact(self) -> Tuple[List[Dict], float] | None:
+        """
+        Точный расчёт для небольших счетов, где один лот - заметная доля портфеля.
+        Итоговое количество лотов по каждой бумаге подбирается динамикой по остатку средств,
+        чтобы веса были как можно ближе к целевым. Включается, если стоимость портфеля меньше exact_threshold
+        и хотя бы одна бумага вышла за допустимое отклонение delta.
+        :return: Список действий и прогнозируемый остаток средств или None, если расчёт неприменим
+            или не уложился в exact_time_limit
+        """
+        if not self.exact_threshold:
+            return None
+        (tickers, target_weight, lot_size, last_price,
+         balance, hold_price, excluded) = self.__stack_portfolios([self.positions], self.index)
+        balance, hold_price = balance[0], hold_price[0]
+        total = (balance * hold_price).sum() + self.free_cash
+        if total <= 0 or total >= self.exact_threshold:
+            return None
+        # Портфель в пределах допустимого отклонения не торгуем, как и движки: иначе каждый запуск
+        # платил бы комиссию за приближение к целевым весам внутри delta
+        over, under = allocation.outside_band(balance * hold_price / total, target_weight, self.delta)
+        if not excluded[0] and not over.any() and not under.any():
+            return None
+
+        lots_held = balance // lot_size
+        lot_price = lot_size * last_price
+        lots = allocation.exact_lots(lots_held, lot_price, target_weight, total, self.free_cash,
+                                     self.commission, self.min_lots_to_keep,
+                                     deadline=time.perf_counter() + self.exact_time_limit)
+        if lots is None:
+            logger.info("Exact allocation did not fit in %s sec, falling back to %s", self.exact_time_limit,
+                        self.engine)
+            return None
+
+        # Продаём что исключили из индекса
+        for share in excluded[0]:
+            self.add_action("SELL", share.ticker, int(share.balance))
+        change = lots - lots_held
+        for i in np.flatnonzero(change < 0):
+            self.free_cash -= change[i] * lot_price[i] * (1 - self.commission)
+            self.add_action("SELL", tickers[i], int(-change[i]))
+        for i in np.flatnonzero(change > 0):
+            self.free_cash -= change[i] * lot_price[i] * (1 + self.commission)
+            self.add_action("BUY", tickers[i], int(change[i]))
+
+        self.actions = self.optimize_actions()
+        return self.actions, float(self.free_cash)
+
+    def _calculate_actions_buy_only(self) -> Tuple[List[Dict], float] | None:
+        """
+        Быстрый расчёт для пополнения счета: только покупки, жадно по недобору до целевого веса.
+        Подходит, если все бумаги портфеля есть в индексе и ни одна не превышает целевой вес
+        больше чем на delta - тогда продавать нечего, а недобор закрывается свободными средствами.
+        :return: Список действий и прогнозируемый остаток средств или None, если без продаж не обойтись
+        """
+        if not self.buy_only:
+            return None
+        (tickers, target_weight, lot_size, last_price,
+         balance, hold_price, excluded) = self.__stack_portfolios([self.positions], self.index)
+        if excluded[0]:
+            return None
+
+        value = balance[0] * hold_price[0]
+        total = value.sum() + self.free_cash
+        if total <= 0 or (value / total > target_weight * (1 + self.delta)).any():
+            return None
+
+        buy_lots, self.free_cash = allocation.greedy_fill(value, lot_size, last_price, total,
+                                                          target_weight, self.commission, self.free_cash)
+        self.actions = [
+            {"type": "BUY", "ticker": tickers[i], "quantity": int(buy_lots[i])}
+            for i in np.flatnonzero(buy_lots)
+        ]
+        return self.actions, float(self.free_cash)
+
+    def _calculate_actions_closed_form(self) -> Tuple[List[Dict], float]:
+        """
+        Расчёт целевого количества лотов сразу по всем бумагам: округляем вниз до целого лота,
+        а остаток средств раскладываем жадно по одному лоту. Время расчёта не зависит от суммы на счете.
+        """
+        portfolio_df = self.positions.shares_to_dataframe().set_index("ticker")
+        index_df = self.index.to_dataframe().set_index("ticker")
+        portfolio_df = self.__sell_excluded(index_df, portfolio_df)
+
+        target_weight, lot_size, last_price, balance, hold_price = self.__portfolio_arrays(index_df, portfolio_df)
+
+        sell_lots, buy_lots, free_cash = allocation.closed_form_plan(
+            balance[None], hold_price[None], target_weight, lot_size, last_price, [self.free_cash],
+            self.delta, self.commission, self.min_lots_to_keep
+        )
+        sell_lots, buy_lots, self.free_cash = sell_lots[0], buy_lots[0], float(free_cash[0])
+
+        tickers = index_df.index
+        for i in np.flatnonzero(sell_lots):
+            self.add_action('SELL', tickers[i], int(sell_lots[i]))
+        for i in np.flatnonzero(buy_lots):
+            self.add_action('BUY', tickers[i], int(buy_lots[i]))
+
+        self.actions = self.optimize_actions()
+        return self.actions, float(self.free_cash)
+
+    def _calculate_actions_min_orders(self) -> Tuple[List[Dict], float]:
+        """
+        Балансировка наименьшим числом заявок: торгуются только бумаги за пределами допустимого отклонения,
+        каждая одной заявкой сразу до целевого веса. Бумаги берутся по убыванию отклонения от целевого веса,
+        пока не исчерпан бюджет max_orders (0 - без ограничения). Поправки меньше лота пропускаются.
+        Бумаги, исключённые из индекса, продаются всегда, сверх бюджета.
+        """
+        (tickers, target_weight, lot_size, last_price,
+         balance, hold_price, excluded) = self.__stack_portfolios([self.positions], self.index)
+        balance, hold_price = balance[0], hold_price[0]
+        budget = self.max_orders or len(tickers)
+
+        # Продажа исключённых из индекса обязательна, идёт первой и не расходует бюджет заявок
+        for share in excluded[0]:
+            self.add_action("SELL", share.ticker, int(share.balance))
+
+        value = balance * hold_price
+        total = value.sum() + self.free_cash
+        if total <= 0 or budget <= 0:
+            self.actions = self.optimize_actions()
+            return self.actions, float(self.free_cash)
+
+        weight = value / total
+        over, under = allocation.outside_band(weight, target_weight, self.delta)
+        sell_lots = np.where(over, allocation.lots_to_sell(balance, lot_size, last_price, total,
+                                                           target_weight, self.min_lots_to_keep), 0)
+        buy_lots = np.where(under, allocation.lots_to_target(value, lot_size, last_price, total, target_weight), 0)
+
+        # Одна заявка на бумагу, первыми - с наибольшим отклонением
+        drift = np.abs(weight - target_weight)
+        ranked = [i for i in np.argsort(-drift, kind="stable") if sell_lots[i] > 0 or buy_lots[i] > 0]
+
+        sells = [i for i in ranked[:budget] if sell_lots[i] > 0]
+        for i in sells:
+            self.free_cash += sell_lots[i] * lot_size[i] * last_price[i] * (1 - self.commission)
+            self.add_action("SELL", tickers[i], int(sell_lots[i]))
+        budget -= len(sells)
+
+        lot_cost = lot_size * last_price * (1 + self.commission)
+        for i in ranked:
+            if budget <= 0:
+                break
+            if buy_lots[i] <= 0:
+                continue
+            lots = min(int(buy_lots[i]), int(self.free_cash // lot_cost[i]))
+            if lots <= 0:
+                continue
+            self.free_cash -= lots * lot_cost[i]
+            self.add_action("BUY", tickers[i], lots)
+            budget -= 1
+
+        self.actions = self.optimize_actions()
+        return self.actions, float(self.free_cash)
+
+    @classmethod
+    def calculate_actions_batch(cls, positions_list: List[Positions], index: Index,
+                                delta: float = settings.balancer.delta,
+                                commission: float = settings.balancer.commission,
+                                min_lots_to_keep: float = settings.balancer.min_lots_to_keep,
+                                engine: str = settings.balancer.engine,
+                                max_iterations: int = settings.balancer.max_iterations,
+                                buy_only: bool = settings.balancer.buy_only,
+                                max_orders: int = settings.balancer.max_orders,
+                                exact_threshold: float = settings.balancer.exact_threshold,
+                                exact_time_limit: float = settings.balancer.exact_time_limit,
+                                ) -> List[Tuple[List[Dict], float]]:
+        """
+        Рассчитать балансировку сразу для нескольких счетов, отслеживающих один индекс.
+        Векторный расчёт только у движков из BATCH_ENGINES (closed_form): все портфели складываются в матрицу
+        счета × тикеры и считаются за один проход. Остальные движки (iterative по умолчанию, heap, min_orders)
+        считают каждый счет отдельно, как calculate_actions с теми же настройками.
+        Небольшие счета и счета, которым нужны только покупки, считаются быстрыми расчётами.
+        :param positions_list: Открытые позиции по каждому счету
+        :param index: Состав индекса
+        :return: Список действий и прогнозируемый остаток средств по каждому счету
+        """
+        balancers = [cls(positions, index, delta, commission, min_lots_to_keep, engine, max_iterations, buy_only,
+                         max_orders, exact_threshold, exact_time_limit)
+                     for positions in positions_list]
+        if engine not in cls.BATCH_ENGINES:
+            return [balancer.calculate_actions() for balancer in balancers]
+        if not balancers:
+            return []
+
+        tickers, target_weight, lot_size, last_price, balance, hold_price, excluded = cls.__stack_portfolios(
+            positions_list, index
+        )
+        sell_lots, buy_lots, free_cash = allocation.closed_form_plan(
+            balance, hold_price, target_weight, lot_size, last_price,
+            [balancer.free_cash for balancer in balancers],
+            delta, commission, min_lots_to_keep
+        )
+
+        results = []
+        for row, balancer in enumerate(balancers):
+            plan = balancer._calculate_actions_fast()
+            if plan is not None:
+                results.append(plan)
+                continue
+            # Продаём что исключили из индекса
+            for share in excluded[row]:
+                balancer.add_action("SELL", share.ticker, int(share.balance))
+            for i in np.flatnonzero(sell_lots[row]):
+                balancer.add_action('SELL', tickers[i], int(sell_lots[row, i]))
+            for i in np.flatnonzero(buy_lots[row]):
+                balancer.add_action('BUY', tickers[i], int(buy_lots[row, i]))
+            balancer.free_cash = float(free_cash[row])
+            balancer.actions = balancer.optimize_actions()
+            results.append((balancer.actions, balancer.free_cash))
+
+        return results
+
+    def _calculate_actions_heap(self) -> Tuple[List[Dict], float]:
+        """
+        Тот же пошаговый расчёт, что и в iterative, но без пересборки DataFrame на каждом шаге.
+        Позиции хранятся в массивах по номеру тикера в индексе, очередь кандидатов - куча,
+        упорядоченная по недобору до целевого веса. Стоимость портфеля и веса
+        пересчитываются только для изменённой бумаги, шаг покупки стоит O(log N).
+        """
+        portfolio_df = self.positions.shares_to_dataframe().set_index("ticker")
+        index_df = self.index.to_dataframe().set_index("ticker")
+        portfolio_df = self.__sell_excluded(index_df, portfolio_df)
+
+        tickers = index_df.index
+        target_weight, lot_size, last_price, balance, hold_price = self.__portfolio_arrays(index_df, portfolio_df)
+        lot_cost = lot_size * last_price * (1 + self.commission)
+        value = balance * hold_price
+        total_value = value.sum() + self.free_cash
+
+        # Порядок кучи совпадает с сортировкой create_weights_dataframe:
+        # по возрастанию отношения текущего веса к целевому, затем по убыванию целевого веса
+        versions = np.zeros(len(tickers), dtype=int)
+
+        def entry(i: int) -> tuple:
+            # Бумаги с нулевым весом не покупаются и стоят в конце очереди, nan сломал бы порядок кучи
+            ratio = value[i] / target_weight[i] if target_weight[i] else np.inf
+            return ratio, -target_weight[i], i, versions[i]
+
+        def is_actual(item: tuple) -> bool:
+            return item[3] == versions[item[2]]
+
+        def update(i: int, new_balance: float) -> None:
+            nonlocal total_value
+            new_value = new_balance * hold_price[i]
+            total_value += new_value - value[i]
+            balance[i] = new_balance
+            value[i] = new_value
+            versions[i] += 1
+            heapq.heappush(queue, entry(i))
+
+        queue = [entry(i) for i in range(len(tickers))]
+        heapq.heapify(queue)
+
+        for _ in range(self.max_iterations):
+
+            made_changes = False  # Флаг изменений
+
+            # Покупка: достаём кандидатов по возрастанию веса, пока выполняется условие покупки
+            skipped = []
+            while queue:
+                item = heapq.heappop(queue)
+                if not is_actual(item):
+                    continue
+                i = item[2]
+                if not target_weight[i] > value[i] / total_value * (1 + self.delta):
+                    skipped.append(item)
+                    break
+                if lot_cost[i] < self.free_cash:
+                    self.free_cash -= lot_cost[i]
+                    total_value -= lot_cost[i]
+                    update(i, balance[i] + lot_size[i])
+                    self.add_action('BUY', tickers[i], 1)
+                    made_changes = True
+                    break
+                skipped.append(item)
+            for item in skipped:
+                heapq.heappush(queue, item)
+
+            # Продажа: сначала перевешенные бумаги, затем остальные, в порядке возрастания веса
+            if not made_changes:
+                queue = [item for item in queue if is_actual(item)]
+                queue.sort()  # отсортированный список остаётся кучей
+
+                over, rest = [], []
+                for _, _, i, _ in queue:
+                    current_weight = value[i] / total_value
+                    if target_weight[i] > current_weight * (1 + self.delta) or not current_weight > 0:
+                        continue
+                    if current_weight / target_weight[i] > 1 + self.delta:
+                        over.append(i)
+                    else:
+                        rest.append(i)
+
+                for i in over + rest:
+                    position_balance = int(balance[i])
+
+                    shares_to_sell = int(allocation.lots_to_sell(position_balance, lot_size[i], last_price[i],
+                                                                 total_value, target_weight[i],
+                                                                 self.min_lots_to_keep))
+                    if shares_to_sell > 0:
+                        sell_price = shares_to_sell * lot_size[i] * last_price[i]
+                        commission_fee = sell_price * self.commission
+
+                        self.free_cash += sell_price - commission_fee
+                        total_value += sell_price - commission_fee
+                        update(i, position_balance - shares_to_sell * lot_size[i])
+                        self.add_action('SELL', tickers[i], shares_to_sell)
+                        made_changes = True
+                        break
+            if not made_changes:
+                break
+        else:
+            logger.warning("Balancer stopped after %s passes without reaching balance", self.max_iterations)
+
+        self.actions = self.optimize_actions()
+        return self.actions, float(self.free_cash)
+
+    def _calculate_actions_iterative(self) -> Tuple[List[Dict], float]:
+        """
+        Пошаговый расчёт: на каждой итерации покупаем один лот самой недобранной бумаги,
+        а если купить нечего, продаём перевес.
+        """
+        portfolio_df = self.positions.shares_to_dataframe().set_index("ticker")
+        index_df = self.index.to_dataframe().set_index("ticker")
+        portfolio_df = self.__sell_excluded(index_df, portfolio_df)
 
-        while True:
+        for _ in range(self.max_iterations):
 
             made_changes = False  # Флаг изменений
             total_value = self.__calculate_portfolio_value(portfolio_df)
@@ -170,26 +601,21 @@ class Balancer:
                     balance = int(portfolio_df.at[ticker, 'balance'])
                     lot_size = row['lot_size']
 
-                    if balance > lot_size:
-                        shares_to_sell = 0
-                        while (balance > lot_size and
-                               (balance - lot_size) * row['last_price'] / total_value >= row[
-                                   'target_weight'] and
-                               balance // lot_size > self.min_lots_to_keep):
-                            balance -= lot_size
-                            shares_to_sell += 1
-
-                        if shares_to_sell > 0:
-                            sell_price = shares_to_sell * lot_size * row['last_price']
-                            commission_fee = sell_price * self.commission
-
-                            portfolio_df.at[ticker, 'balance'] = balance
-                            self.free_cash += sell_price - commission_fee
-                            self.add_action('SELL', ticker, shares_to_sell)
-                            made_changes = True
-                            break
+                    shares_to_sell = int(allocation.lots_to_sell(balance, lot_size, row['last_price'], total_value,
+                                                                 row['target_weight'], self.min_lots_to_keep))
+                    if shares_to_sell > 0:
+                        sell_price = shares_to_sell * lot_size * row['last_price']
+                        commission_fee = sell_price * self.commission
+
+                        portfolio_df.at[ticker, 'balance'] = balance - shares_to_sell * lot_size
+                        self.free_cash += sell_price - commission_fee
+                        self.add_action('SELL', ticker, shares_to_sell)
+                        made_changes = True
+                        break
             if not made_changes:
                 break
+        else:
+            logger.warning("Balancer stopped after %s passes without reaching balance", self.max_iterations)
 
         self.actions = self.optimize_actions()
         return self.actions, float(self.free_cash)
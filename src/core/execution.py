@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import List, Tuple, Callable, Awaitable, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import settings
+
+from src.models.action import Action
+from src.models.error import Error
+
+from src.services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def split_phases(actions: List[Action]) -> Tuple[List[Action], List[Action]]:
+    """
+    Делит действия на продажи и покупки, сохраняя порядок внутри каждой группы
+    :param actions: Действия балансировщика
+    :return: Продажи и покупки
+    """
+    sells = [action for action in actions if action.type == "SELL"]
+    buys = [action for action in actions if action.type != "SELL"]
+    return sells, buys
+
+
+def order_error(action: Action, error: Exception) -> Error:
+    """
+    Ошибка заявки для отчета. Ошибки брокера возвращаются как есть, остальные исключения
+    (сеть, таймауты, ошибки в коде) оборачиваются, чтобы по каждой заявке был результат
+    :param action: Действие, заявка по которому не выполнена
+    :param error: Исключение
+    :return: Ошибка
+    """
+    if isinstance(error, Error):
+        return error
+    logger.warning("Order for %s failed", action.share.ticker, exc_info=error)
+    return Error(source="Broker", source_data=error, data=action, description=str(error) or type(error).__name__)
+
+
+def execute_orders(create_order: Callable[[Action], object], actions: List[Action],
+                   rate_limiter: Optional[TokenBucket] = None,
+                   max_concurrency: int = settings.broker.order_concurrency) -> Tuple[List[Action], List[Error]]:
+    """
+    Отправляет заявки брокеру. Сначала параллельно все продажи, после того как они приняты -
+    параллельно все покупки, чтобы им хватило освободившихся денег.
+    :param create_order: Создание одной заявки
+    :param actions: Действия балансировщика
+    :param rate_limiter: Ограничение частоты заявок
+    :param max_concurrency: Сколько заявок отправлять одновременно
+    :return: Список действий выполненных успешно и список произошедших ошибок
+    """
+    def submit(action: Action):
+        try:
+            if rate_limiter:
+                rate_limiter.acquire()
+            create_order(action)
+        except Exception as e:
+            return order_error(action, e)
+        return None
+
+    success_action_list: List[Action] = []
+    error_action_list: List[Error] = []
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        for phase in split_phases(actions):
+            for action, error in zip(phase, executor.map(submit, phase)):
+                if error is not None:
+                    error_action_list.append(error)
+                else:
+                    success_action_list.append(action)
+
+    logger.info("Orders executed: %s, failed: %s", len(success_action_list), len(error_action_list))
+    return success_action_list, error_action_list
+
+
+async def execute_orders_async(create_order: Callable[[Action], Awaitable], actions: List[Action],
+                               rate_limiter: Optional[TokenBucket] = None,
+                               max_concurrency: int = settings.broker.order_concurrency
+                               ) -> Tuple[List[Action], List[Error]]:
+    """Асинхронная версия execute_orders"""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def submit(action: Action):
+        async with semaphore:
+            try:
+                if rate_limiter:
+                    await rate_limiter.acquire_async()
+                await create_order(action)
+            except Exception as e:
+                return order_error(action, e)
+            return None
+
+    success_action_list: List[Action] = []
+    error_action_list: List[Error] = []
+    for phase in split_phases(actions):
+        for action, error in zip(phase, await asyncio.gather(*(submit(action) for action in phase))):
+            if error is not None:
+                error_action_list.append(error)
+            else:
+                success_action_list.append(action)
+
+    logger.info("Orders executed: %s, failed: %s", len(success_action_list), len(error_action_list))
+    return success_action_list, error_action_list
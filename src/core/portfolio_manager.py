@@ -1,17 +1,29 @@
+import asyncio
 import datetime
+import logging
+from dataclasses import asdict, replace
 from typing import List, Tuple, Dict, Optional
 
+from src.config import settings
 from src.core.balancer import Balancer
+from src.core.execution import execute_orders, execute_orders_async
 
 from src.models.account import Account
+from src.models.config import UserConfig
 from src.models.bond import MoexBond, Bond
-from src.models.positions import Positions
+from src.models.positions import Positions, Cash
+from src.models.share import Share
 from src.models.action import Action
 from src.models.error import Error
 from src.models.index import  Index
 
 from src.services.broker import TBroker, TAccount
+from src.services.async_broker import AsyncTBroker, AsyncTAccount
 from src.services.stock_market import Moex
+from src.services.cache import cached
+from src.services import profiling
+
+logger = logging.getLogger(__name__)
 
 
 class PortfolioManager:
@@ -22,14 +34,31 @@ class PortfolioManager:
 
     def __init__(self, account_id: str = None):
         self.actions: List[Action] = []
-        self.broker = TBroker()
+        self.broker = TBroker.shared()
         if account_id:
             self.set_account(account_id)
         else:
             self.account_client: Optional[TAccount] = None
-        self._index_cache: Dict[Tuple[str, datetime.date], Index] = {}
-        self._indices_cache: Dict[datetime.date, List[Tuple[str, str]]] = {}
         self.moex = Moex()
+        self._async_broker: Optional[AsyncTBroker] = None
+        self._async_account_client: Optional[AsyncTAccount] = None
+
+    @property
+    def async_broker(self) -> AsyncTBroker:
+        """Асинхронный брокер берётся из общих брокеров при первом обращении из async методов"""
+        if self._async_broker is None:
+            self._async_broker = AsyncTBroker.shared()
+        return self._async_broker
+
+    @property
+    def async_account_client(self) -> AsyncTAccount:
+        """Асинхронный клиент текущего аккаунта"""
+        if not self.account_client:
+            raise ValueError("Account client is not initialized")
+        if self._async_account_client is None or \
+                self._async_account_client.account_id != self.account_client.account_id:
+            self._async_account_client = AsyncTAccount(self.account_client.account_id, self.async_broker)
+        return self._async_account_client
 
     def get_user_accounts(self) -> List[Account]:
         """
@@ -38,6 +67,10 @@ class PortfolioManager:
         """
         return self.broker.get_all_accounts()
 
+    async def get_user_accounts_async(self) -> List[Account]:
+        """Асинхронная версия get_user_accounts"""
+        return await self.async_broker.get_all_accounts()
+
     def set_account(self, account_id: str) -> None:
         """
         Установка текущего аккаунта для работы
@@ -47,12 +80,8 @@ class PortfolioManager:
         self.account_client = TAccount(account_id, self.broker)
         self.actions = []
 
-    def get_portfolio(self, account_id: str = None) -> Positions:
-        """
-        Вернуть текущие позиции по аккаунту
-        :param account_id: Идентификатор аккаунта пользователя в формате uuid
-        :return: Открытые позиции
-        """
+    def _ensure_account(self, account_id: str = None) -> None:
+        """Переключиться на переданный аккаунт, если он отличается от текущего"""
         if not self.account_client:
             if not account_id:
                 raise ValueError("Account client is not initialized and account_id is not provided")
@@ -60,31 +89,122 @@ class PortfolioManager:
         elif account_id and self.account_client.account_id != account_id:
             self.set_account(account_id)
 
+    def get_portfolio(self, account_id: str = None) -> Positions:
+        """
+        Вернуть текущие позиции по аккаунту
+        :param account_id: Идентификатор аккаунта пользователя в формате uuid
+        :return: Открытые позиции
+        """
+        self._ensure_account(account_id)
+
         return self.account_client.get_positions()
 
+    async def get_portfolio_async(self, account_id: str = None) -> Positions:
+        """Асинхронная версия get_portfolio"""
+        self._ensure_account(account_id)
+
+        return await self.async_account_client.get_positions()
+
+    @cached(ttl_seconds=86400, maxsize=32, max_bytes=settings.stock_market.cache_max_bytes,
+            key=lambda self, index_name: (index_name, datetime.date.today()))
+    def _load_index_list(self, index_name: str) -> Index:
+        """
+        Получить состав индекса с Мосбиржи, кешируя результат на день для всех менеджеров
+        :param index_name: Название индекса
+        :return: Состав индекса
+        """
+        return self.moex.get_index_list(index_name)
+
     def get_index_list(self, index_name: str) -> Index:
         """
-        Получить список бумаг индекса, кешируя результат на день
+        Получить список бумаг индекса. Если включён стрим цен, цены бумаг берутся из него
         :param index_name: Название индекса
         :return: Состав индекса
         """
-        today = datetime.date.today()
-        cache_key = (index_name, today)
-        if cache_key not in self._index_cache:
-            idx = self.moex.get_index_list(index_name)
-            self._index_cache[cache_key] = idx
-        return self._index_cache[cache_key]
+        index = self._load_index_list(index_name)
+        if not self.broker.price_stream:
+            return index
+        shares = self.broker.find_shares([item.ticker for item in index.items], "ticker")
+        return self._with_last_prices(index, shares, self.broker)
+
+    async def get_index_list_async(self, index_name: str) -> Index:
+        """Асинхронная версия get_index_list: запрос к Мосбирже выполняется в отдельном потоке"""
+        index = await profiling.to_thread(self._load_index_list, index_name)
+        if not self.async_broker.price_stream:
+            return index
+        shares = await self.async_broker.find_shares([item.ticker for item in index.items], "ticker")
+        return self._with_last_prices(index, shares, self.async_broker)
+
+    @staticmethod
+    def _with_last_prices(index: Index, shares: Dict[str, Optional[Share]], broker) -> Index:
+        """
+        Подставить в состав индекса свежие цены из стрима. Бумаги индекса добавляются в подписку,
+        для бумаг без свежей цены остаётся цена Мосбиржи.
+        Закешированный на день состав индекса не меняется, возвращается копия.
+        :param index: Состав индекса
+        :param shares: Акции брокера по тикерам бумаг индекса
+        :param broker: Брокер, через который читаются цены
+        :return: Состав индекса с актуальными ценами
+        """
+        uids = {item.ticker: shares[item.ticker].uid for item in index.items if shares.get(item.ticker)}
+        last_prices, _ = broker.cached_last_prices(list(uids.values()))
+
+        items = []
+        for item in index.items:
+            last_price = last_prices.get(uids.get(item.ticker))
+            if last_price is not None:
+                item = replace(item, last_price=Cash(**asdict(last_price)).to_float())
+            items.append(item)
+
+        return replace(index, items=items)
 
+    @staticmethod
+    async def track_prices_async(users: List[UserConfig]) -> None:
+        """
+        Подписать стрим цен на бумаги на счетах и бумаги индексов пользователей из настроек,
+        чтобы к первой балансировке цены уже были в таблице
+        :param users: Пользователи из настроек
+        """
+        broker = AsyncTBroker.shared()
+        if not broker.price_stream:
+            return
+
+        bindings = [user.index_bindings for user in users if user.index_bindings]
+        manager = PortfolioManager()
+        uids = set()
+        for index_name in {binding.index_name for binding in bindings}:
+            try:
+                index = await profiling.to_thread(manager._load_index_list, index_name)
+                shares = await broker.find_shares([item.ticker for item in index.items], "ticker")
+            except Exception:
+                logger.warning("Failed to subscribe to prices of index %s", index_name, exc_info=True)
+                continue
+            uids |= {share.uid for share in shares.values() if share}
+
+        for binding in bindings:
+            try:
+                positions = await AsyncTAccount(binding.broker_account_id, broker).get_positions()
+            except Exception:
+                logger.warning("Failed to subscribe to prices of account %s", binding.broker_account_id,
+                               exc_info=True)
+                continue
+            uids |= {position.uid for position in positions.shares + positions.bonds}
+
+        if uids:
+            broker.price_stream.track(uids)
+
+    @cached(ttl_seconds=86400, maxsize=2, max_bytes=settings.stock_market.cache_max_bytes,
+            key=lambda self: datetime.date.today())
     def get_indices_list(self) -> List[Tuple[str, str]]:
         """
-        Получить список индексов, кешируя результат на день
+        Получить список индексов, кешируя результат на день для всех менеджеров
         :return: Список: Индекс, краткое название
         """
-        today = datetime.date.today()
-        if today not in self._indices_cache:
-            idx = self.moex.get_indices()
-            self._indices_cache[today] = idx
-        return self._indices_cache[today]
+        return self.moex.get_indices()
+
+    async def get_indices_list_async(self) -> List[Tuple[str, str]]:
+        """Асинхронная версия get_indices_list"""
+        return await profiling.to_thread(self.get_indices_list)
 
     def get_action_for_rebalance(self, portfolio: Positions, index: Index)-> Tuple[List[Action], float]:
         """
@@ -93,35 +213,88 @@ class PortfolioManager:
         :param index: Состав индекса
         :return: Список действий для балансировки и прогнозируемый остаток средств после балансировки
         """
-        self.actions = []
-
         balancer = Balancer(portfolio, index)
         actions_list, free_cash = balancer.calculate_actions()
+        self.actions = self._resolve_actions(actions_list)
+
+        return self.actions, free_cash
 
-        for action in actions_list:
-            share = self.broker.find_share(action.get("ticker"), "ticker")
-            self.actions.append(Action(type=action.get("type"), quantity=action.get("quantity"), share=share))
+    async def get_action_for_rebalance_async(self, portfolio: Positions, index: Index) -> Tuple[List[Action], float]:
+        """Асинхронная версия get_action_for_rebalance: расчёт балансировки выполняется в отдельном потоке"""
+        actions_list, free_cash = await profiling.to_thread(Balancer(portfolio, index).calculate_actions)
+        self.actions = await self._resolve_actions_async(actions_list)
 
         return self.actions, free_cash
 
+    @staticmethod
+    def get_action_for_rebalance_batch(managers: List["PortfolioManager"], portfolios: List[Positions],
+                                       index: Index) -> List[Tuple[List[Action], float]]:
+        """
+        Рассчитать действия для балансировки сразу для нескольких аккаунтов, отслеживающих один индекс.
+        Действия сохраняются в соответствующем менеджере для последующего выполнения.
+        Одним векторным проходом счета считаются только с движком closed_form, см. Balancer.calculate_actions_batch.
+        :param managers: Менеджеры аккаунтов
+        :param portfolios: Открытые позиции по каждому аккаунту, в том же порядке, что и менеджеры
+        :param index: Состав индекса
+        :return: Список действий и прогнозируемый остаток средств по каждому аккаунту
+        """
+        plans = Balancer.calculate_actions_batch(portfolios, index)
+
+        results = []
+        for manager, (actions_list, free_cash) in zip(managers, plans):
+            manager.actions = manager._resolve_actions(actions_list)
+            results.append((manager.actions, free_cash))
+
+        return results
+
+    @staticmethod
+    async def get_action_for_rebalance_batch_async(managers: List["PortfolioManager"], portfolios: List[Positions],
+                                                   index: Index) -> List[Tuple[List[Action], float]]:
+        """Асинхронная версия get_action_for_rebalance_batch"""
+        plans = await profiling.to_thread(Balancer.calculate_actions_batch, portfolios, index)
+
+        results = []
+        for manager, (actions_list, free_cash) in zip(managers, plans):
+            manager.actions = await manager._resolve_actions_async(actions_list)
+            results.append((manager.actions, free_cash))
+
+        return results
+
+    def _resolve_actions(self, actions_list: List[Dict]) -> List[Action]:
+        """
+        Сопоставить действия балансировщика с акциями брокера
+        :param actions_list: Действия в виде словарей с тикером
+        :return: Список действий
+        """
+        shares = self.broker.find_shares([action.get("ticker") for action in actions_list], "ticker")
+        return [
+            Action(type=action.get("type"), quantity=action.get("quantity"), share=shares[action.get("ticker")])
+            for action in actions_list
+        ]
+
+    async def _resolve_actions_async(self, actions_list: List[Dict]) -> List[Action]:
+        """Асинхронная версия _resolve_actions"""
+        shares = await self.async_broker.find_shares([action.get("ticker") for action in actions_list], "ticker")
+        return [
+            Action(type=action.get("type"), quantity=action.get("quantity"), share=shares[action.get("ticker")])
+            for action in actions_list
+        ]
+
     def execute_actions(self) -> Tuple[List[Action], List[Error]]:
         """
-        Выполнить накопленные действия по аккаунту
+        Выполнить накопленные действия по аккаунту: сначала продажи, затем покупки,
+        заявки внутри каждой группы отправляются параллельно
         :return: Список действий выполненных успешно и список произошедших ошибок
         """
         if not self.account_client:
             raise ValueError("Account client is not initialized")
 
-        success_action_list: List[Action] = []
-        error_action_list: List[Error] = []
-        for action in self.actions:
-            try:
-                self.account_client.create_order(action)
-                success_action_list.append(action)
-            except Error as e:
-                error_action_list.append(e)
+        return execute_orders(self.account_client.create_order, self.actions, self.broker.order_rate_limiter)
 
-        return success_action_list, error_action_list
+    async def execute_actions_async(self) -> Tuple[List[Action], List[Error]]:
+        """Асинхронная версия execute_actions"""
+        return await execute_orders_async(self.async_account_client.create_order, self.actions,
+                                          self.async_broker.order_rate_limiter)
 
     def get_callable_bonds(self, account_id: str = None) -> list[Bond]:
         """
@@ -134,17 +307,27 @@ class PortfolioManager:
         :param account_id: Идентификатор аккаунта пользователя в формате uuid.
         :return: Список облигаций.
         """
-        if not self.account_client:
-            if not account_id:
-                raise ValueError("Account client is not initialized and account_id is not provided")
-            self.set_account(account_id)
-        elif account_id and self.account_client.account_id != account_id:
-            self.set_account(account_id)
+        self._ensure_account(account_id)
 
         moex_bonds: list[MoexBond] = self.moex.get_bonds()
-        moex_bonds_by_tickers = { _moex_bond.ticker : _moex_bond for _moex_bond in moex_bonds if _moex_bond.offer_date }
         portfolio_bonds = self.account_client.get_positions().bonds
 
+        return self._match_callable_bonds(moex_bonds, portfolio_bonds)
+
+    async def get_callable_bonds_async(self, account_id: str = None) -> list[Bond]:
+        """Асинхронная версия get_callable_bonds"""
+        self._ensure_account(account_id)
+
+        moex_bonds, positions = await asyncio.gather(profiling.to_thread(self.moex.get_bonds),
+                                                     self.async_account_client.get_positions())
+
+        return self._match_callable_bonds(moex_bonds, positions.bonds)
+
+    @staticmethod
+    def _match_callable_bonds(moex_bonds: list[MoexBond], portfolio_bonds: list) -> list[Bond]:
+        """Оставляем облигации на счете, по которым на Мосбирже известна дата оферты"""
+        moex_bonds_by_tickers = { _moex_bond.ticker : _moex_bond for _moex_bond in moex_bonds if _moex_bond.offer_date }
+
         callable_bonds = []
         for _portfolio_bond in portfolio_bonds:
             if _portfolio_bond.ticker in moex_bonds_by_tickers.keys():
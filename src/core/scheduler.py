@@ -6,16 +6,20 @@ import logging
 from aiogram import Bot
 from aiogram.types import Message
 
+from src.core.balancer import Balancer
 from src.core.portfolio_manager import PortfolioManager
 from src.config import settings, ConfigLoader
 from src.db.repositories.user_repository import UserRepository
 
-from src.models.scheduler_frequency import ScheduleFrequency
+from src.models.scheduler_frequency import ScheduleFrequency, should_rebalance
 
 from src.db.database import get_session
 from src.db.repositories.task_repository import TaskRepository
 from src.db.enums import TaskType
 
+from src.services.metrics import registry as metrics, SCHEDULER_JOB
+from src.services.profiling import profile, profiled
+
 def _save_result(obj: list):
     if not obj:
         return
@@ -71,34 +75,55 @@ class Scheduler:
 
         return None
 
-    async def _rebalance(self, user):
-
-            account_id = user.index_bindings.broker_account_id
-
-            manager = PortfolioManager(account_id)
-            portfolio = manager.get_portfolio()
+    async def _rebalance(self, index_name: str, users: list):
+        """
+        Балансировка счетов всех пользователей, отслеживающих один индекс.
+        Состав индекса запрашивается один раз. Если движок балансировки умеет считать пакет счетов,
+        планы считаются одним пакетом, иначе - по каждому счету.
+        :param index_name: Индекс Мосбиржи
+        :param users: Пользователи, у которых подошло время балансировки
+        """
+
+        with metrics.timer(SCHEDULER_JOB, job="rebalance", index=index_name), profile(f"rebalance-{index_name}"):
+            managers, portfolios, rebalance_users = [], [], []
+            for user in users:
+                manager = PortfolioManager(user.index_bindings.broker_account_id)
+                portfolio = await manager.get_portfolio_async()
+
+                balance_before_balance = portfolio.cash.to_float()
+                if balance_before_balance > settings.balancer.max_cash:
+                    managers.append(manager)
+                    portfolios.append(portfolio)
+                    rebalance_users.append(user)
+
+            if managers:
+                index_moex = await managers[0].get_index_list_async(index_name)
+                if settings.balancer.engine in Balancer.BATCH_ENGINES:
+                    await PortfolioManager.get_action_for_rebalance_batch_async(managers, portfolios, index_moex)
+                else:
+                    for manager, portfolio in zip(managers, portfolios):
+                        await manager.get_action_for_rebalance_async(portfolio, index_moex)
 
-            balance_before_balance = portfolio.cash.to_float()
-            if balance_before_balance > settings.balancer.max_cash:
-                index_moex = manager.get_index_list(user.index_bindings.index_name)
-                actions, new_balance = manager.get_action_for_rebalance(portfolio, index_moex)  # Для обновления списка действий
-                success_action_list, error_action_list = manager.execute_actions()
+                for user, manager in zip(rebalance_users, managers):
+                    success_action_list, error_action_list = await manager.execute_actions_async()
 
-                await self._send_report(user.telegram_id, "rebalance",
-                                        success_action_list=success_action_list,
-                                        error_action_list=error_action_list)
-                _save_result(success_action_list)
-                _save_result(error_action_list)
+                    await self._send_report(user.telegram_id, "rebalance",
+                                            success_action_list=success_action_list,
+                                            error_action_list=error_action_list)
+                    _save_result(success_action_list)
+                    _save_result(error_action_list)
 
-                ConfigLoader.update_schedule(user.telegram_id, user.schedule.rebalance_frequency)
+                    ConfigLoader.update_schedule(user.telegram_id, user.schedule.rebalance_frequency)
 
-            await asyncio.sleep(settings.scheduler.timeout_in_sec)
+        await asyncio.sleep(settings.scheduler.timeout_in_sec)
 
+    @metrics.timed(SCHEDULER_JOB, job="get_callable_bonds")
+    @profiled("get_callable_bonds")
     async def _get_callable_bonds(self, telegram_id, broker_account_id):
 
         manager = PortfolioManager(broker_account_id)
         now = datetime.now()
-        callable_bonds = [ _bond for _bond in manager.get_callable_bonds()
+        callable_bonds = [ _bond for _bond in await manager.get_callable_bonds_async()
                            if datetime.strptime(_bond.offer_date, "%Y-%m-%d") - now <= timedelta(weeks=2)
                         ]
         if callable_bonds:
@@ -114,25 +139,15 @@ class Scheduler:
 
     async def run(self):
 
-        def should_rebalance(last_run: datetime = None, frequency: str = None) -> bool:
-            if last_run and frequency:
-                now = datetime.now()
-                if frequency == ScheduleFrequency.WEEKLY.name:
-                    return now - last_run >= timedelta(weeks=1)
-                elif frequency == ScheduleFrequency.MONTHLY.name:
-                    return now - last_run >= timedelta(days=30) # Пока по-простому, в будущем переделаем
-                elif frequency == ScheduleFrequency.QUARTERLY.name:
-                    return (now.month - 1) // 3 != (last_run.month - 1) // 3 or now.year != last_run.year
-                else:
-                    return False
-            else:
-                return False
-
         while True:
+            users_by_index = {}
             for user in settings.users:
                 if user.schedule:
                     if should_rebalance(user.schedule.last_run, user.schedule.rebalance_frequency):
-                        await self._rebalance(user)
+                        users_by_index.setdefault(user.index_bindings.index_name, []).append(user)
+
+            for index_name, users in users_by_index.items():
+                await self._rebalance(index_name, users)
 
             async for session in get_session():
                 repo = TaskRepository(session)
@@ -0,0 +1,145 @@
+import os
+import math
+import pickle
+import itertools
+from typing import List, Dict, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+from src.config import settings
+
+from src.core.balancer import Balancer
+
+from src.models.positions import Positions
+from src.models.index import Index
+
+
+# Снимок счета и индекса в процессе-исполнителе, распаковывается один раз при старте процесса
+_snapshot: Optional[Tuple[Positions, Index]] = None
+
+
+def _init_worker(snapshot: bytes) -> None:
+    global _snapshot
+    _snapshot = pickle.loads(snapshot)
+
+
+def plan_metrics(positions: Positions, index: Index, actions: List[Dict], free_cash: float) -> Dict:
+    """
+    Оценка плана балансировки.
+    * turnover - оборот сделок относительно стоимости портфеля;
+    * orders - количество заявок;
+    * residual_cash - остаток средств после балансировки;
+    * tracking_error - среднеквадратичное отклонение весов после балансировки от весов индекса.
+    :param positions: Позиции до балансировки
+    :param index: Состав индекса
+    :param actions: Действия балансировщика
+    :param free_cash: Прогнозируемый остаток средств
+    :return: Метрики плана
+    """
+    lot_sizes = {item.ticker: item.lot_size for item in index.items}
+    prices = {item.ticker: item.last_price for item in index.items}
+    balances = {}
+    for share in positions.shares:
+        lot_sizes.setdefault(share.ticker, share.lot_size)
+        prices.setdefault(share.ticker, share.last_price.to_float())
+        balances[share.ticker] = share.balance
+
+    total_before = sum(balances[t] * prices[t] for t in balances) + positions.cash.to_float()
+
+    traded = 0.0
+    for action in actions:
+        shares = action["quantity"] * lot_sizes[action["ticker"]]
+        traded += shares * prices[action["ticker"]]
+        sign = 1 if action["type"] == "BUY" else -1
+        balances[action["ticker"]] = max(balances.get(action["ticker"], 0) + sign * shares, 0)
+
+    total_after = sum(balances[t] * prices[t] for t in balances) + free_cash
+    targets = {item.ticker: item.weight / 100 for item in index.items}
+    deviations = [
+        (balances.get(t, 0) * prices[t] / total_after if total_after else 0) - targets.get(t, 0)
+        for t in set(targets) | set(balances)
+    ]
+
+    return {
+        "turnover": traded / total_before if total_before else 0,
+        "orders": len(actions),
+        "residual_cash": free_cash,
+        "tracking_error": math.sqrt(sum(d * d for d in deviations)),
+    }
+
+
+def _run_combination(params: Dict) -> Dict:
+    positions, index = _snapshot
+    actions, free_cash = Balancer(positions, index, **params).calculate_actions()
+    return {**params, **plan_metrics(positions, index, actions, free_cash)}
+
+
+def run_sweep(positions: Positions, index: Index,
+              deltas: List[float], commissions: List[float], min_lots_to_keep: List[int],
+              engine: str = settings.balancer.engine,
+              max_workers: Optional[int] = None) -> List[Dict]:
+    """
+    Прогоняет балансировщик по сетке параметров на одном снимке счета.
+    Снимок сериализуется один раз и передаётся каждому процессу при его запуске.
+    :param positions: Позиции на счете
+    :param index: Состав индекса
+    :param deltas: Варианты допустимого отклонения
+    :param commissions: Варианты комиссии
+    :param min_lots_to_keep: Варианты минимального количества лотов
+    :param engine: Движок балансировщика
+    :param max_workers: Количество процессов, по умолчанию по числу ядер
+    :return: Параметры и метрики плана по каждой комбинации
+    """
+    grid = [
+        dict(delta=delta, commission=commission, min_lots_to_keep=min_lots, engine=engine)
+        for delta, commission, min_lots in itertools.product(deltas, commissions, min_lots_to_keep)
+    ]
+    snapshot = pickle.dumps((positions, index))
+    workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(grid) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(snapshot,)) as executor:
+        return list(executor.map(_run_combination, grid, chunksize=chunksize))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from src.core.portfolio_manager import PortfolioManager
+
+    def floats(value: str) -> List[float]:
+        return [float(v) for v in value.split(",")]
+
+    def ints(value: str) -> List[int]:
+        return [int(v) for v in value.split(",")]
+
+    parser = argparse.ArgumentParser(description="Что будет, если: балансировка по сетке параметров")
+    parser.add_argument("--account-id", help="Аккаунт брокера, с которого снимаются позиции")
+    parser.add_argument("--index", default=settings.stock_market.index_name, help="Индекс Мосбиржи")
+    parser.add_argument("--snapshot", help="Файл со снимком (позиции, индекс). Если не найден - будет создан")
+    parser.add_argument("--delta", type=floats, default=[0.01, 0.02, 0.05, 0.1])
+    parser.add_argument("--commission", type=floats, default=[settings.balancer.commission])
+    parser.add_argument("--min-lots-to-keep", type=ints, default=[0, 1, 2])
+    parser.add_argument("--engine", default=settings.balancer.engine)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        with open(args.snapshot, "rb") as f:
+            snapshot_positions, snapshot_index = pickle.load(f)
+    except (TypeError, FileNotFoundError):
+        if not args.account_id:
+            parser.error("--account-id is required without an existing --snapshot")
+        manager = PortfolioManager(args.account_id)
+        snapshot_positions, snapshot_index = manager.get_portfolio(), manager.get_index_list(args.index)
+        if args.snapshot:
+            with open(args.snapshot, "wb") as f:
+                pickle.dump((snapshot_positions, snapshot_index), f)
+
+    results = run_sweep(snapshot_positions, snapshot_index, args.delta, args.commission, args.min_lots_to_keep,
+                        engine=args.engine, max_workers=args.workers)
+
+    print(f"{'delta':>8} {'commission':>10} {'min_lots':>8} {'turnover':>9} {'orders':>6} "
+          f"{'cash':>12} {'tracking':>9}")
+    for r in sorted(results, key=lambda r: (r["tracking_error"], r["orders"])):
+        print(f"{r['delta']:>8} {r['commission']:>10} {r['min_lots_to_keep']:>8} {r['turnover']:>9.4f} "
+              f"{r['orders']:>6} {r['residual_cash']:>12.2f} {r['tracking_error']:>9.4f}")
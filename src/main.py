@@ -6,18 +6,38 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from src.config import settings
 
 from src.bot import handlers, callbacks
+from src.bot.middlewares import MetricsMiddleware, ProfilingMiddleware
 
 from src.core.scheduler import Scheduler
+from src.core.portfolio_manager import PortfolioManager
+
+from src.services.broker import TBroker
+from src.services.async_broker import AsyncTBroker
+from src.services.metrics import start_http_server
+
+
+async def on_shutdown():
+    TBroker.close_all()
+    await AsyncTBroker.close_all()
 
 
 async def main():
     telegram_token = settings.telegram.token
     bot = Bot(token=telegram_token)
     dp = Dispatcher(storage=MemoryStorage())
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(ProfilingMiddleware())
     dp.include_routers(handlers.router, callbacks.router)
+    dp.shutdown.register(on_shutdown)
 
     await bot.delete_webhook(drop_pending_updates=True)
 
+    start_http_server()
+
+    # Цены бумаг на счетах и в индексах пользователей приходят из стрима ещё до первой балансировки
+    asyncio.create_task(PortfolioManager.track_prices_async(settings.users))
+
     scheduler = Scheduler(bot)
     asyncio.create_task(scheduler.run())
 
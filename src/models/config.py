@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Dict
 from datetime import datetime
 
 
@@ -7,12 +7,29 @@ class BrokerConfig(BaseModel):
     token: str
     sandbox_mode: bool = True
     log_file: str
+    catalog_file: str = "instruments.sqlite"  # Справочник инструментов, хранится рядом с логами
+    catalog_ttl_in_sec: int = 86400  # Через сколько справочник обновляется в фоне
+    negative_cache_ttl_in_sec: int = 3600  # Сколько помнить, что инструмента нет у брокера
+    health_check_interval_in_sec: int = 60  # Как часто проверять долгоживущее соединение с API
+    orders_per_minute: int = 100  # Лимит брокера на выставление заявок
+    order_concurrency: int = 8  # Сколько заявок отправлять одновременно
+    price_stream: bool = False  # Получать последние цены из стрима market data вместо запроса на каждый вызов
+    price_max_age_in_sec: int = 60  # Сколько цена из стрима считается свежей
+    # Квота API известна только из ответов с ошибкой: вызовы метода ждут её восстановления после троттлинга
+    # или ошибки с ratelimit_remaining = 0, заранее под остаток квоты они не распределяются
+    retry_attempts: int = 4  # Сколько раз пытаться выполнить запрос при временных ошибках API
+    retry_base_delay_in_sec: float = 0.5  # Начальная задержка между повторами, дальше растёт экспоненциально
+    retry_max_delay_in_sec: float = 30  # Максимальная задержка между повторами
+    positions_ttl_in_sec: int = 30  # Сколько позиции счета берутся из кэша, заявка сбрасывает кэш сразу
+    accounts_ttl_in_sec: int = 300  # Сколько список счетов берётся из кэша
 
 
 class StockMarketConfig(BaseModel):
     index_name: str = "IMOEX"
     limit: int = 100
     base_url: str = "https://iss.moex.com/iss"
+    cache_ttl_in_sec: int = 3600  # Сколько список индексов и облигаций берётся из кэша
+    cache_max_bytes: int = 64 * 1024 * 1024  # Ограничение объёма кэшей состава индексов и облигаций в памяти, байт
 
 
 class BalancerConfig(BaseModel):
@@ -20,6 +37,12 @@ class BalancerConfig(BaseModel):
     commission: float = 0.003
     min_lots_to_keep: int = 1
     max_cash: int
+    engine: str = "iterative"  # iterative, closed_form, heap, min_orders. Счета одного индекса планировщик считает одним пакетом только с closed_form, остальные движки - по одному счету
+    max_iterations: int = 10000  # Ограничение числа шагов пошагового расчёта
+    buy_only: bool = True  # Быстрый расчёт только покупками, если структура портфеля уже сбалансирована
+    max_orders: int = 0  # Бюджет заявок для движка min_orders, 0 - без ограничения. Продажи бумаг вне индекса сверх него
+    exact_threshold: float = 0  # Точный расчёт для портфелей дешевле этой суммы, руб. 0 - выключен
+    exact_time_limit: float = 0.2  # Ограничение времени точного расчёта, сек. Дальше считает движок
 
 
 class TelegramConfig(BaseModel):
@@ -51,12 +74,35 @@ class UserConfig(BaseModel):
 class LoggingConfig(BaseModel):
     enabled: bool = True
     path: str
+    integration_queue_size: int = 10000  # Записи сверх очереди фонового логгера отбрасываются
+    integration_max_items: int = 50  # Сколько элементов списка писать в лог, остальные пропускаются
+    integration_max_chars: int = 20000  # Максимальная длина одной записи интеграции
+    integration_sampling: Dict[str, float] = {}  # Доля успешных вызовов метода, попадающих в лог, ошибки пишутся всегда
+    integration_rotation: str = "size"  # Ротация лога интеграции: size - по размеру, time - по времени
+    integration_max_bytes: int = 50 * 1024 * 1024  # Размер сегмента при ротации по размеру
+    integration_rotate_when: str = "midnight"  # Интервал при ротации по времени, как в TimedRotatingFileHandler
+    integration_backup_count: int = 20  # Сколько закрытых сегментов хранить
+    integration_compression: str = "gzip"  # Сжатие закрытых сегментов: gzip, zstd (нужен zstandard), none
 
 
 class SchedulerConfig(BaseModel):
     timeout_in_sec: int
 
 
+class MetricsConfig(BaseModel):
+    port: int = 0  # Порт HTTP сервера с метриками Prometheus, 0 - сервер не запускается
+    host: str = "127.0.0.1"
+    buckets: List[float] = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]  # Границы гистограмм, сек
+
+
+class ProfilingConfig(BaseModel):
+    enabled: bool = False  # Профилирование заданий планировщика и обработчиков кнопок, включается и командой /profile
+    sample_rate: float = 1.0  # Доля профилируемых вызовов
+    tracemalloc: bool = True  # Сохранять снимок выделений памяти вместе с .prof
+    tracemalloc_frames: int = 10  # Глубина стека для tracemalloc
+    dir: str = "profiles/"  # Каталог для результатов внутри каталога логов
+
+
 class AppConfig(BaseModel):
     telegram: TelegramConfig
     broker: BrokerConfig
@@ -65,4 +111,6 @@ class AppConfig(BaseModel):
     users: List[UserConfig] = []
     logging: LoggingConfig
     scheduler: SchedulerConfig
+    metrics: MetricsConfig = MetricsConfig()
+    profiling: ProfilingConfig = ProfilingConfig()
 
@@ -1,6 +1,29 @@
 from enum import Enum
+from datetime import datetime, timedelta
 
 class ScheduleFrequency(str, Enum):
     WEEKLY = "Раз в неделю"
     MONTHLY = "Раз в 30 дней"
     QUARTERLY = "Раз в квартал"
+
+
+def should_rebalance(last_run: datetime = None, frequency: str = None, now: datetime = None) -> bool:
+    """
+    Проверяет, прошёл ли с последнего запуска интервал, заданный частотой балансировки.
+    :param last_run: Дата последнего запуска
+    :param frequency: Имя частоты из ScheduleFrequency
+    :param now: Текущий момент, по умолчанию - сейчас
+    :return: Пора ли выполнять балансировку
+    """
+    if last_run and frequency:
+        now = now or datetime.now()
+        if frequency == ScheduleFrequency.WEEKLY.name:
+            return now - last_run >= timedelta(weeks=1)
+        elif frequency == ScheduleFrequency.MONTHLY.name:
+            return now - last_run >= timedelta(days=30) # Пока по-простому, в будущем переделаем
+        elif frequency == ScheduleFrequency.QUARTERLY.name:
+            return (now.month - 1) // 3 != (last_run.month - 1) // 3 or now.year != last_run.year
+        else:
+            return False
+    else:
+        return False
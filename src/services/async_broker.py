@@ -0,0 +1,299 @@
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from typing import List, Dict, Optional, Callable, Awaitable
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+
+from grpc import StatusCode
+from t_tech.invest import AsyncClient, RequestError
+
+from src.config import settings
+from src.models.instrument import InstrumentBase
+
+from src.services.utils import log_response
+from src.services.catalog import InstrumentCatalog
+from src.services.retry import RetryingClient
+from src.services.cache import cached
+from src.services.broker import BaseBroker, BrokerResources, CATALOG_KINDS, build_positions, order_request
+
+from src.models.account import Account
+from src.models.positions import Positions, PositionsCash
+from src.models.share import Share, ShareList
+from src.models.action import Action
+from src.models.error import Error
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTBroker(BaseBroker):
+    """
+    Асинхронный брокер Т-Банка на AsyncClient. Возвращает те же модели, что и TBroker,
+    но не блокирует цикл событий бота и планировщика
+    """
+
+    # Все созданные брокеры, чтобы закрыть их соединения при остановке приложения
+    _instances = weakref.WeakSet()
+
+    def __init__(self, token: str = settings.broker.token, sandbox: bool = settings.broker.sandbox_mode,
+                 catalog: Optional[InstrumentCatalog] = None, resources: Optional[BrokerResources] = None):
+        super().__init__(token, sandbox, catalog, resources)
+
+        self.health_check_interval = settings.broker.health_check_interval_in_sec
+        self._client_context = None
+        self._client = None
+        self._client_checked_at = 0.0
+        self._client_lock = asyncio.Lock()
+        AsyncTBroker._instances.add(self)
+
+    def refresh_catalog_in_background(self) -> None:
+        """
+        Запускает обновление справочника фоновой задачей, если истёк его срок.
+        Пока идёт обновление, поиск работает по уже загруженным инструментам.
+        """
+        if not self._catalog_is_stale():
+            return
+        event, leader = self._resources.begin_reload(CATALOG_KINDS)
+        if leader:
+            task = asyncio.create_task(self._refresh_catalog(event))
+            # Задача может быть отменена до старта, тогда перезагрузку закрывает колбэк
+            task.add_done_callback(lambda _: self._resources.end_reload(CATALOG_KINDS, event, False))
+
+    async def _refresh_catalog(self, event: threading.Event) -> None:
+        reloaded = False
+        try:
+            await self.get_all_instruments()
+            reloaded = True
+        except Exception:
+            logger.exception("Instrument catalog refresh failed")
+        finally:
+            self._resources.end_reload(CATALOG_KINDS, event, reloaded)
+
+    async def _connect(self) -> None:
+        context = AsyncClient(**self._client_params())
+        self._client = await context.__aenter__()
+        self._client_context = context
+        self._client_checked_at = time.monotonic()
+
+    async def _disconnect(self) -> None:
+        context, self._client_context, self._client = self._client_context, None, None
+        if context is not None:
+            try:
+                await context.__aexit__(None, None, None)
+            except Exception:
+                logger.exception("Failed to close async broker client")
+
+    async def _is_healthy(self) -> bool:
+        """Проверка соединения лёгким запросом к API"""
+        try:
+            await self._client.users.get_info()
+            return True
+        except Exception:
+            logger.warning("Async broker client health check failed, reconnecting", exc_info=True)
+            return False
+
+    async def close(self) -> None:
+        """Закрывает соединение с API и стрим цен. Следующий вызов откроет новое"""
+        if self.price_stream:
+            self.price_stream.stop()
+        async with self._client_lock:
+            await self._disconnect()
+
+    @classmethod
+    async def close_all(cls) -> None:
+        """Закрывает соединения всех асинхронных брокеров. Вызывается при остановке приложения"""
+        for broker in list(cls._instances):
+            await broker.close()
+
+    @asynccontextmanager
+    async def get_client(self):
+        """
+        Асинхронный контекстный менеджер для работы с клиентом. Соединение переиспользуется так же,
+        как в TBroker.get_client
+        """
+        async with self._client_lock:
+            if self._client is None:
+                await self._connect()
+            elif time.monotonic() - self._client_checked_at >= self.health_check_interval:
+                if not await self._is_healthy():
+                    await self._disconnect()
+                    await self._connect()
+                self._client_checked_at = time.monotonic()
+            client = self._client
+
+        try:
+            yield RetryingClient(client, self.retrier)
+        except RequestError as e:
+            if getattr(e, "code", None) == StatusCode.UNAVAILABLE:
+                async with self._client_lock:
+                    if self._client is client:
+                        await self._disconnect()
+            raise
+
+    @cached(ttl_seconds=settings.broker.accounts_ttl_in_sec)
+    async def get_all_accounts(self) -> List[Account]:
+        """
+            Возвращает список всех аккаунтов доступных в брокере
+        :return: List[Account]
+        """
+        async with self.get_client() as client:
+            accounts = (await client.users.get_accounts()).accounts
+
+        return [Account(id=a.id, name=a.name) for a in accounts]
+
+    @log_response()
+    async def get_all_shares(self) -> ShareList:
+        """
+        Возвращает список акций с их дополнительной информацией.
+        :return: ShareList
+        """
+        return ShareList(await self._load_shares())
+
+    async def _load_shares(self) -> List[Share]:
+        async with self.get_client() as client:
+            shares = self._to_shares((await client.instruments.shares()).instruments)
+        self._index_shares(shares)
+        return shares
+
+    @log_response()
+    async def find_share(self, value: str, field: str = "uid") -> Optional[Share]:
+        """
+        Метод для поиска информации об акции. Может принимать на вход uid или ticker
+        :param value: Значение, по которому осуществляется поиск.
+        :param field: Тип значения, по которому ищем. Допустимые значения: uid, ticker.
+        :return: Share. Информация об акции
+        """
+        self.refresh_catalog_in_background()
+        return await self._find_or_reload("share", value, field, self.get_all_shares)
+
+    @log_response()
+    async def find_shares(self, values: List[str], field: str = "ticker") -> Dict[str, Optional[Share]]:
+        """
+        Поиск сразу нескольких акций, как TBroker.find_shares
+        :param values: Значения, по которым осуществляется поиск.
+        :param field: Тип значений, по которым ищем. Допустимые значения: uid, ticker.
+        :return: Найденные акции по каждому значению, None - если акции нет
+        """
+        self.refresh_catalog_in_background()
+        return await self._find_many_or_reload("share", values, field, self._load_shares)
+
+    @log_response()
+    async def find_instrument(self, value: str, field: str = "uid") -> Optional[InstrumentBase]:
+        """
+        Метод для поиска информации об инструменте. Может принимать на вход uid или ticker
+        :param value: Значение, по которому осуществляется поиск.
+        :param field: Тип значения, по которому ищем. Допустимые значения: uid, ticker.
+        :return: Информация об инструменте
+        """
+        self.refresh_catalog_in_background()
+        return await self._find_or_reload("instrument", value, field, self.get_all_instruments)
+
+    async def _find_or_reload(self, kind: str, value: str, field: str, reload: Callable[[], Awaitable]):
+        return (await self._find_many_or_reload(kind, [value], field, reload))[value]
+
+    async def _find_many_or_reload(self, kind: str, values: List[str], field: str,
+                                   reload: Callable[[], Awaitable]) -> Dict[str, Optional[InstrumentBase]]:
+        """Как TBroker._find_many_or_reload: одна перезагрузка на все одновременные промахи и кэш промахов"""
+        generation = self._reloads[kind]
+        results = {value: self._lookup(kind, value, field) for value in values}
+        missing = [value for value, result in results.items()
+                   if not result and not self._is_known_missing((kind, field, value))]
+        if not missing:
+            return results
+
+        while True:
+            event, leader = self._resources.begin_reload((kind,), {kind: generation})
+            if event is None:
+                break
+            if not leader:
+                # Перезагрузку может вести и синхронный брокер, поэтому ждём событие в потоке
+                await asyncio.to_thread(event.wait)
+                continue
+            reloaded = False
+            try:
+                await reload()
+                reloaded = True
+            finally:
+                self._resources.end_reload((kind,), event, reloaded)
+            break
+
+        for value in missing:
+            results[value] = self._lookup(kind, value, field)
+            if not results[value]:
+                self._remember_missing((kind, field, value))
+        return results
+
+    @log_response()
+    async def get_all_instruments(self) -> list[InstrumentBase]:
+        """
+        Возвращает список всех инструментов с их дополнительной информацией.
+        :return: Список инструментов с их базовой информацией
+        """
+        async with self.get_client() as client:
+            bonds = (await client.instruments.bonds()).instruments
+            shares = (await client.instruments.shares()).instruments
+
+        all_instruments = self._to_instruments(bonds, shares)
+        # Запись в SQLite - в отдельном потоке, чтобы не держать цикл событий
+        await asyncio.to_thread(self._save_catalog, all_instruments)
+        return all_instruments
+
+
+class AsyncTAccount:
+    """
+    Асинхронный аккаунт Т-Банка: позиции на счете и создание заявок
+    """
+    def __init__(self, account_id: str, broker: AsyncTBroker):
+        self.account_id = account_id
+        self.broker = broker
+
+    async def get_positions(self) -> Positions:
+        """
+        Возвращает позиции на счете. Снимок позиций кэшируется так же, как в TAccount.get_positions
+        """
+        positions = self.broker.cached_positions(self.account_id)
+        if positions is None:
+            positions = await self._load_positions()
+            self.broker.remember_positions(self.account_id, positions)
+        return positions
+
+    async def _load_positions(self) -> Positions:
+        async with self.broker.get_client() as client:
+            positions = await client.operations.get_positions(account_id=self.account_id)
+
+            if not positions.securities:
+                return Positions(cash=PositionsCash(**asdict(positions.money[0])) if positions.money else None,
+                                 shares=[])
+
+            securities = [p for p in positions.securities if p.instrument_type in ["share", "bond"]]
+            instruments = await asyncio.gather(*(self.broker.find_instrument(p.instrument_uid) for p in securities))
+            # Инструменты, которых нет у брокера (например, BBG007N0Z367), пропускаем
+            instrument_balance = [(i, p.balance) for i, p in zip(instruments, securities) if i]
+
+            last_prices, stale = self.broker.cached_last_prices([p.instrument_uid for p in positions.securities])
+            if stale:
+                fetched = {
+                    last_price.instrument_uid: last_price.price
+                    for last_price in (await client.market_data.get_last_prices(instrument_id=stale)).last_prices
+                }
+                self.broker.prices.update(fetched)
+                last_prices.update(fetched)
+
+        return build_positions(positions, instrument_balance, last_prices)
+
+    async def create_order(self, action: Action):
+        """
+        Создаёт ордер у брокера в аккаунте.
+        :param action: Данные для ордера
+        :return:
+        """
+        async with self.broker.get_client() as client:
+            try:
+                response = await client.orders.post_order(**order_request(self.account_id, action))
+            except RequestError as e:
+                raise Error(source="Broker", source_data=e, data=action, description=e.metadata.message)
+
+        self.broker.invalidate_positions(self.account_id)
+        return response
@@ -1,15 +1,25 @@
+import time
 import uuid
-from typing import List, Dict, Optional
+import logging
+import weakref
+import threading
+from typing import List, Dict, Tuple, Optional, Callable
 from contextlib import contextmanager
 from dataclasses import asdict
 
+from grpc import StatusCode
 from t_tech.invest import Client, OrderDirection, OrderType, RequestError
 from t_tech.invest.constants import INVEST_GRPC_API_SANDBOX
 
 from src.config import settings
 from src.models.instrument import InstrumentBase
 
-from src.services.utils import cache_data, log_response
+from src.services.utils import log_response
+from src.services.cache import cached
+from src.services.catalog import InstrumentCatalog
+from src.services.rate_limit import TokenBucket
+from src.services.prices import PriceTable, LastPriceStream
+from src.services.retry import Retrier, RetryingClient
 
 from src.models.account import Account
 from src.models.positions import Positions, PositionsCash, Cash, PositionsInstrument
@@ -17,30 +27,389 @@ from src.models.share import Share, ShareList
 from src.models.action import Action
 from src.models.error import Error
 
+logger = logging.getLogger(__name__)
 
-class TBroker:
+# Виды поиска, которые обновляет полная загрузка справочника
+CATALOG_KINDS = ("share", "instrument")
+
+
+def client_params(token: str, target: Optional[str]) -> dict:
+    params = {"token": token}
+    if target:
+        params["target"] = target
+    return params
+
+
+class BrokerResources:
     """
-    Класс брокера Т-Банка. Будем получать информацию об аккаунтах
+    Ресурсы, общие для синхронного и асинхронного брокеров одного токена: словари инструментов,
+    справочник, кэш промахов и перезагрузки, лимит заявок, снимки позиций и последние цены. Справочник загружается и стрим цен
+    открывается один раз на токен, а не на каждый класс брокера.
+    """
+
+    # Общие на процесс ресурсы: (токен, песочница) -> ресурсы
+    _shared: Dict[tuple, "BrokerResources"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, token: str, sandbox: bool, catalog: Optional[InstrumentCatalog] = None):
+        target = INVEST_GRPC_API_SANDBOX if sandbox else None
+        self.shares_by_uid: Dict[str, Share] = {}
+        self.shares_by_ticker: Dict[str, Share] = {}
+        self.instruments_by_uid: Dict[str, InstrumentBase] = {}
+        self.instruments_by_ticker: Dict[str, InstrumentBase] = {}
+
+        # Справочник с диска: поиск инструментов работает сразу, а обновляется он в фоне
+        self.catalog = catalog or InstrumentCatalog()
+        self.catalog_updated_at = self.catalog.updated_at()
+        self.index_instruments(self.catalog.load())
+
+        # Промахи поиска: (вид, поле, значение) -> когда забыть. Перезагрузки считаются по виду поиска
+        self.missing: Dict[tuple, float] = {}
+        self.reloads = {kind: 0 for kind in CATALOG_KINDS}
+        # Идущие перезагрузки по виду поиска, в том числе фоновое обновление справочника:
+        # их ждут, а не запускают вторую загрузку
+        self._reloading: Dict[str, threading.Event] = {}
+        self._reload_lock = threading.Lock()
+
+        # Лимит заявок считается брокером по токену, поэтому ведро общее для всех аккаунтов и брокеров токена
+        self.order_rate_limiter = TokenBucket(settings.broker.orders_per_minute)
+
+        # Снимки позиций по счетам: account_id -> (позиции, когда устареют). Общие, чтобы заявка
+        # через любой брокер токена сбрасывала снимок, который читают остальные
+        self.positions: Dict[str, Tuple[Positions, float]] = {}
+        self.positions_lock = threading.Lock()
+
+        # Последние цены из стрима market data, если он включен
+        self.prices = PriceTable()
+        self.price_stream = LastPriceStream(lambda: client_params(token, target), self.prices) \
+            if settings.broker.price_stream else None
+
+    @classmethod
+    def shared(cls, token: str, sandbox: bool) -> "BrokerResources":
+        """
+        Общие ресурсы токена
+        :param token: Токен API
+        :param sandbox: Режим песочницы
+        """
+        key = (token, sandbox)
+        with cls._shared_lock:
+            resources = cls._shared.get(key)
+            if resources is None:
+                resources = cls._shared[key] = cls(token, sandbox)
+        return resources
+
+    def index_instruments(self, instruments: List[InstrumentBase]) -> None:
+        """Раскладывает инструменты по словарям поиска"""
+        for instrument in instruments:
+            self.instruments_by_uid[instrument.uid] = instrument
+            self.instruments_by_ticker[instrument.ticker] = instrument
+            if instrument.type == "share":
+                share = Share(**asdict(instrument))
+                self.shares_by_uid[share.uid] = share
+                self.shares_by_ticker[share.ticker] = share
+
+    def index_shares(self, shares: List[Share]) -> None:
+        for share in shares:
+            self.shares_by_uid[share.uid] = share
+            self.shares_by_ticker[share.ticker] = share
+
+
+    def begin_reload(self, kinds: Tuple[str, ...],
+                     generations: Optional[Dict[str, int]] = None) -> Tuple[Optional[threading.Event], bool]:
+        """
+        Начинает перезагрузку видов поиска, если она ещё нужна
+        :param kinds: Виды поиска, которые обновит перезагрузка
+        :param generations: Номера перезагрузок, которые видел вызывающий. Если какой-то вид
+            с тех пор перезагрузили, перезагрузка не нужна
+        :return: Событие окончания перезагрузки и признак, что перезагружать должен вызывающий.
+            Если перезагрузка уже идёт - её событие и False, если не нужна - None и False
+        """
+        with self._reload_lock:
+            for kind in kinds:
+                if kind in self._reloading:
+                    return self._reloading[kind], False
+            if generations and any(self.reloads[kind] != generation for kind, generation in generations.items()):
+                return None, False
+            event = threading.Event()
+            for kind in kinds:
+                self._reloading[kind] = event
+            return event, True
+
+    def end_reload(self, kinds: Tuple[str, ...], event: threading.Event, reloaded: bool) -> None:
+        """
+        Заканчивает перезагрузку, начатую begin_reload. Повторный вызов ничего не делает
+        :param reloaded: Перезагрузка прошла успешно
+        """
+        with self._reload_lock:
+            if event.is_set():
+                return
+            for kind in kinds:
+                if self._reloading.get(kind) is event:
+                    del self._reloading[kind]
+                if reloaded:
+                    self.reloads[kind] += 1
+            event.set()
+
+
+class BaseBroker:
     """
+    Общая часть синхронного и асинхронного брокера: словари поиска инструментов,
+    справочник на диске и кэш промахов поиска. Сами данные лежат в BrokerResources
+    """
+
+    # Общие на процесс брокеры: (класс, токен, песочница) -> брокер
+    _shared: Dict[tuple, "BaseBroker"] = {}
+    _shared_lock = threading.Lock()
 
-    def __init__(self, token: str = settings.broker.token, sandbox: bool = settings.broker.sandbox_mode):
+    def __init__(self, token: str, sandbox: bool, catalog: Optional[InstrumentCatalog] = None,
+                 resources: Optional[BrokerResources] = None):
         self.token = token
         self.target = INVEST_GRPC_API_SANDBOX if sandbox else None
-        self._shares_by_uid: Dict[str, Share] = {}
-        self._shares_by_ticker: Dict[str, Share] = {}
-        self._instruments_by_uid: Dict[str, InstrumentBase] = {}
-        self._instruments_by_ticker: Dict[str, InstrumentBase] = {}
 
-    @contextmanager
-    def get_client(self):
-        """Контекстный менеджер для работы с клиентом."""
-        params = {"token": self.token}
-        if self.target:
-            params["target"] = self.target
+        # Брокеры из shared() получают общие ресурсы токена, остальные - собственные
+        self._resources = resources or BrokerResources(token, sandbox, catalog)
+        self._shares_by_uid = self._resources.shares_by_uid
+        self._shares_by_ticker = self._resources.shares_by_ticker
+        self._instruments_by_uid = self._resources.instruments_by_uid
+        self._instruments_by_ticker = self._resources.instruments_by_ticker
+        self._catalog = self._resources.catalog
+
+        self.negative_cache_ttl = settings.broker.negative_cache_ttl_in_sec
+        self._missing = self._resources.missing
+        self._reloads = self._resources.reloads
+
+        self.order_rate_limiter = self._resources.order_rate_limiter
+
+        # Повторы запросов при троттлинге и временных ошибках, счётчики по методам API
+        self.retrier = Retrier((RequestError,))
+
+        # Снимки позиций по счетам: account_id -> (позиции, когда устареют)
+        self.positions_ttl = settings.broker.positions_ttl_in_sec
+        self._positions = self._resources.positions
+        self._positions_lock = self._resources.positions_lock
+
+        self.prices = self._resources.prices
+        self.price_max_age = settings.broker.price_max_age_in_sec
+        self.price_stream = self._resources.price_stream
+
+    @classmethod
+    def shared(cls, token: str = settings.broker.token, sandbox: bool = settings.broker.sandbox_mode):
+        """
+        Общий на процесс брокер для токена и режима песочницы. Соединение с API переиспользуется всеми
+        PortfolioManager, обработчиками бота и планировщиком, а BrokerResources - ещё и брокером другого класса.
+        :param token: Токен API
+        :param sandbox: Режим песочницы
+        :return: Брокер
+        """
+        key = (cls, token, sandbox)
+        with cls._shared_lock:
+            broker = cls._shared.get(key)
+            if broker is None:
+                broker = cls._shared[key] = cls(token, sandbox, resources=BrokerResources.shared(token, sandbox))
+        return broker
+
+    def _client_params(self) -> dict:
+        return client_params(self.token, self.target)
+
+    @property
+    def _catalog_updated_at(self) -> float:
+        return self._resources.catalog_updated_at
+
+    def cached_last_prices(self, uids: List[str]) -> Tuple[Dict[str, object], List[str]]:
+        """
+        Последние цены из стрима. Инструменты добавляются в подписку стрима.
+        :param uids: Идентификаторы инструментов
+        :return: Свежие цены по uid и uid, цены по которым нужно запросить у API
+        """
+        if not self.price_stream:
+            return {}, list(uids)
+        self.price_stream.track(uids)
+        return self.prices.get_many(uids, self.price_max_age)
+
+    def cached_positions(self, account_id: str) -> Optional[Positions]:
+        """
+        Снимок позиций счета, если он ещё не устарел
+        :param account_id: Идентификатор аккаунта
+        :return: Позиции или None
+        """
+        with self._positions_lock:
+            positions, expires_at = self._positions.get(account_id, (None, 0.0))
+            if positions is not None and expires_at > time.monotonic():
+                return positions
+            self._positions.pop(account_id, None)
+            return None
+
+    def remember_positions(self, account_id: str, positions: Positions) -> None:
+        if self.positions_ttl <= 0:
+            return
+        with self._positions_lock:
+            self._positions[account_id] = (positions, time.monotonic() + self.positions_ttl)
+
+    def invalidate_positions(self, account_id: str) -> None:
+        """Сбрасывает снимок позиций счета, например после выставления заявки"""
+        with self._positions_lock:
+            self._positions.pop(account_id, None)
+
+    def _index_instruments(self, instruments: List[InstrumentBase]) -> None:
+        """Раскладывает инструменты по словарям поиска"""
+        self._resources.index_instruments(instruments)
+
+    def _index_shares(self, shares: List[Share]) -> None:
+        self._resources.index_shares(shares)
+
+    def _save_catalog(self, instruments: List[InstrumentBase]) -> None:
+        self._index_instruments(instruments)
+        self._catalog.save(instruments)
+        self._resources.catalog_updated_at = time.time()
+
+    def _catalog_is_stale(self) -> bool:
+        return time.time() - self._catalog_updated_at >= self._catalog.ttl_seconds
+
+    def _lookup(self, kind: str, value: str, field: str) -> Optional[InstrumentBase]:
+        """
+        Поиск по загруженным словарям
+        :param kind: Вид поиска: share, instrument
+        :param value: Значение, по которому осуществляется поиск.
+        :param field: Тип значения, по которому ищем. Допустимые значения: uid, ticker.
+        """
+        lookup_maps = {
+            "share": {"ticker": self._shares_by_ticker, "uid": self._shares_by_uid},
+            "instrument": {"ticker": self._instruments_by_ticker, "uid": self._instruments_by_uid},
+        }
+        return lookup_maps[kind].get(field, {}).get(value)
+
+    def _is_known_missing(self, key: tuple) -> bool:
+        expires_at = self._missing.get(key)
+        if expires_at is None:
+            return False
+        if expires_at > time.time():
+            return True
+        self._missing.pop(key, None)
+        return False
+
+    def _remember_missing(self, key: tuple) -> None:
+        logger.info("%s %s=%s not found, caching the miss", *key)
+        self._missing[key] = time.time() + self.negative_cache_ttl
+
+    @staticmethod
+    def _to_shares(shares) -> List[Share]:
+        return [Share(f.uid, f.figi, f.ticker, f.lot, f.isin, "share") for f in shares if f.currency == 'rub']
+
+    @staticmethod
+    def _to_instruments(bonds, shares) -> List[InstrumentBase]:
+        return [
+            InstrumentBase(_i.uid, _i.figi, _i.ticker, _i.lot, _i.isin, instrument_type)
+            for instrument_type, instruments in (("bond", bonds), ("share", shares))
+            for _i in instruments if _i.currency == 'rub'
+        ]
+
+
+class TBroker(BaseBroker):
+    """
+    Класс брокера Т-Банка. Будем получать информацию об аккаунтах
+    """
+
+    # Все созданные брокеры, чтобы закрыть их соединения при остановке приложения
+    _instances = weakref.WeakSet()
+
+    def __init__(self, token: str = settings.broker.token, sandbox: bool = settings.broker.sandbox_mode,
+                 catalog: Optional[InstrumentCatalog] = None, resources: Optional[BrokerResources] = None):
+        super().__init__(token, sandbox, catalog, resources)
 
-        with Client(**params) as client:
-            yield client
+        # Долгоживущее соединение с API: открывается при первом вызове и переиспользуется
+        self.health_check_interval = settings.broker.health_check_interval_in_sec
+        self._client_context = None
+        self._client = None
+        self._client_checked_at = 0.0
+        self._client_lock = threading.Lock()
+        TBroker._instances.add(self)
+
+    def refresh_catalog_in_background(self) -> None:
+        """
+        Запускает обновление справочника в фоновом потоке, если истёк его срок.
+        Пока идёт обновление, поиск работает по уже загруженным инструментам.
+        """
+        if not self._catalog_is_stale():
+            return
+        event, leader = self._resources.begin_reload(CATALOG_KINDS)
+        if leader:
+            threading.Thread(target=self._refresh_catalog, args=(event,), name="instrument-catalog",
+                             daemon=True).start()
+
+    def _refresh_catalog(self, event: threading.Event) -> None:
+        reloaded = False
+        try:
+            self.get_all_instruments()
+            reloaded = True
+        except Exception:
+            logger.exception("Instrument catalog refresh failed")
+        finally:
+            self._resources.end_reload(CATALOG_KINDS, event, reloaded)
+
+    def _connect(self) -> None:
+        context = Client(**self._client_params())
+        self._client = context.__enter__()
+        self._client_context = context
+        self._client_checked_at = time.monotonic()
+
+    def _disconnect(self) -> None:
+        context, self._client_context, self._client = self._client_context, None, None
+        if context is not None:
+            try:
+                context.__exit__(None, None, None)
+            except Exception:
+                logger.exception("Failed to close broker client")
+
+    def _is_healthy(self) -> bool:
+        """Проверка соединения лёгким запросом к API"""
+        try:
+            self._client.users.get_info()
+            return True
+        except Exception:
+            logger.warning("Broker client health check failed, reconnecting", exc_info=True)
+            return False
+
+    def close(self) -> None:
+        """Закрывает соединение с API и стрим цен. Следующий вызов откроет новое"""
+        if self.price_stream:
+            self.price_stream.stop()
+        with self._client_lock:
+            self._disconnect()
+
+    @classmethod
+    def close_all(cls) -> None:
+        """Закрывает соединения всех брокеров. Вызывается при остановке приложения"""
+        for broker in list(cls._instances):
+            broker.close()
 
+    @contextmanager
+    def get_client(self):
+        """
+        Контекстный менеджер для работы с клиентом. Канал gRPC открывается один раз и переиспользуется
+        между вызовами. Раз в health_check_interval соединение проверяется и при сбое пересоздаётся,
+        а если API недоступен во время вызова, следующий вызов откроет новое соединение.
+        Методы API вызываются через Retrier: при троттлинге и временных ошибках запрос повторяется.
+        """
+        with self._client_lock:
+            if self._client is None:
+                self._connect()
+            elif time.monotonic() - self._client_checked_at >= self.health_check_interval:
+                if not self._is_healthy():
+                    self._disconnect()
+                    self._connect()
+                self._client_checked_at = time.monotonic()
+            client = self._client
+
+        try:
+            yield RetryingClient(client, self.retrier)
+        except RequestError as e:
+            if getattr(e, "code", None) == StatusCode.UNAVAILABLE:
+                with self._client_lock:
+                    if self._client is client:
+                        self._disconnect()
+            raise
+
+    @cached(ttl_seconds=settings.broker.accounts_ttl_in_sec)
     def get_all_accounts(self) -> List[Account]:
         """
             Возвращает список всех аккаунтов доступных в брокере
@@ -52,24 +421,18 @@ class TBroker:
         return [Account(id=a.id, name=a.name) for a in accounts]
 
     @log_response()
-    # @cache_data(ttl_seconds=86400)
     def get_all_shares(self) -> ShareList:
         """
         Возвращает список акций с их дополнительной информацией.
         :return: ShareList
         """
-        shares = []
-        with self.get_client() as client:
-            instruments = client.instruments
-            shares = [
-                Share(f.uid, f.figi, f.ticker, f.lot, f.isin, "share")
-                for f in instruments.shares().instruments if f.currency == 'rub'
-            ]
-            for share in shares:
-                self._shares_by_uid[share.uid] = share
-                self._shares_by_ticker[share.ticker] = share
+        return ShareList(self._load_shares())
 
-        return ShareList(shares)
+    def _load_shares(self) -> List[Share]:
+        with self.get_client() as client:
+            shares = self._to_shares(client.instruments.shares().instruments)
+        self._index_shares(shares)
+        return shares
 
 
     @log_response()
@@ -80,21 +443,20 @@ class TBroker:
         :param field: Тип значения, по которому ищем. Допустимые значения: uid, ticker.
         :return: Share. Информация об акции
         """
-        lookup_maps = {
-            "ticker": self._shares_by_ticker,
-            "uid": self._shares_by_uid
-        }
-        result = lookup_maps.get(field, {}).get(value)
-        if not result:
-            self.get_all_shares()
-            # пересоздаём lookup_maps, так как словари могли обновиться
-            lookup_maps = {
-                "ticker": self._shares_by_ticker,
-                "uid": self._shares_by_uid
-            }
-            result = lookup_maps.get(field, {}).get(value)
-
-        return result
+        self.refresh_catalog_in_background()
+        return self._find_or_reload("share", value, field, self.get_all_shares)
+
+    @log_response()
+    def find_shares(self, values: List[str], field: str = "ticker") -> Dict[str, Optional[Share]]:
+        """
+        Поиск сразу нескольких акций. Список акций у брокера перезагружается не больше одного раза
+        на все промахи, а в журнал интеграции попадает одна запись на весь запрос.
+        :param values: Значения, по которым осуществляется поиск.
+        :param field: Тип значений, по которым ищем. Допустимые значения: uid, ticker.
+        :return: Найденные акции по каждому значению, None - если акции нет
+        """
+        self.refresh_catalog_in_background()
+        return self._find_many_or_reload("share", values, field, self._load_shares)
 
     @log_response()
     def find_instrument(self, value: str, field: str = "uid") -> Optional[InstrumentBase]:
@@ -104,21 +466,53 @@ class TBroker:
         :param field: Тип значения, по которому ищем. Допустимые значения: uid, ticker.
         :return: Bond. Информация об облигации
         """
-        def _find(_value: str, _field: str = "uid"):
+        self.refresh_catalog_in_background()
+        return self._find_or_reload("instrument", value, field, self.get_all_instruments)
 
-            lookup_maps = {
-                "ticker": self._instruments_by_ticker,
-                "uid": self._instruments_by_uid
-            }
-            return lookup_maps.get(_field, {}).get(_value)
+    def _find_or_reload(self, kind: str, value: str, field: str, reload: Callable[[], object]):
+        return self._find_many_or_reload(kind, [value], field, reload)[value]
 
-        result = _find(value, field)
-        if not result:
-            self.get_all_instruments()
-            # пересоздаём lookup_maps, так как словари могли обновиться
-            result = _find(value, field)
-
-        return result
+    def _find_many_or_reload(self, kind: str, values: List[str], field: str,
+                             reload: Callable[[], object]) -> Dict[str, Optional[InstrumentBase]]:
+        """
+        Ищет инструменты, при промахах один раз перезагружает список инструментов у брокера.
+        Одновременные промахи, в том числе из другого брокера токена, ждут одну общую перезагрузку,
+        а если уже идёт фоновое обновление справочника - его. То, чего нет и после перезагрузки
+        (например, делистингованные бумаги в портфеле), запоминается на negative_cache_ttl_in_sec.
+        :param kind: Вид поиска: share, instrument
+        :param values: Значения, по которым осуществляется поиск.
+        :param field: Тип значений, по которым ищем.
+        :param reload: Перезагрузка словарей у брокера
+        :return: Найденный инструмент или None по каждому значению
+        """
+        generation = self._reloads[kind]
+        results = {value: self._lookup(kind, value, field) for value in values}
+        missing = [value for value, result in results.items()
+                   if not result and not self._is_known_missing((kind, field, value))]
+        if not missing:
+            return results
+
+        while True:
+            event, leader = self._resources.begin_reload((kind,), {kind: generation})
+            if event is None:
+                break
+            if not leader:
+                # Дождались чужой перезагрузки. Если она не удалась, перезагрузим сами
+                event.wait()
+                continue
+            reloaded = False
+            try:
+                reload()
+                reloaded = True
+            finally:
+                self._resources.end_reload((kind,), event, reloaded)
+            break
+
+        for value in missing:
+            results[value] = self._lookup(kind, value, field)
+            if not results[value]:
+                self._remember_missing((kind, field, value))
+        return results
 
     @log_response()
     def get_all_instruments(self) -> list[InstrumentBase]:
@@ -126,28 +520,66 @@ class TBroker:
         Возвращает список всех инструментов с их дополнительной информацией.
         :return: Список инструментов с их базовой информацией
         """
-        all_instruments = []
         with self.get_client() as client:
             broker_instruments = client.instruments
+            all_instruments = self._to_instruments(broker_instruments.bonds().instruments,
+                                                   broker_instruments.shares().instruments)
 
-            for _i in broker_instruments.bonds().instruments:
-                if _i.currency == 'rub':
-                    instrument = InstrumentBase(_i.uid, _i.figi, _i.ticker, _i.lot, _i.isin, "bond")
-                    self._instruments_by_uid[instrument.uid] = instrument
-                    self._instruments_by_ticker[instrument.ticker] = instrument
-
-                    all_instruments.append(instrument)
-
-            for _i in broker_instruments.shares().instruments:
-                if _i.currency == 'rub':
-                    instrument = InstrumentBase(_i.uid, _i.figi, _i.ticker, _i.lot, _i.isin, "share")
-                    self._instruments_by_uid[instrument.uid] = instrument
-                    self._instruments_by_ticker[instrument.ticker] = instrument
+        self._save_catalog(all_instruments)
+        return all_instruments
 
-                    all_instruments.append(instrument)
 
-        return all_instruments
+def build_positions(positions, instrument_balance: list, last_prices: dict) -> Positions:
+    """
+    Собирает позиции на счете из ответа брокера
+    :param positions: Ответ get_positions
+    :param instrument_balance: Найденные инструменты и их количество на счете
+    :param last_prices: Последние цены по uid инструмента
+    :return: Позиции на счете
+    """
+    def create_position_instrument(_i: InstrumentBase, _b: int, _last_price) -> PositionsInstrument:
+
+        return PositionsInstrument(
+                        uid=_i.uid,
+                        figi=_i.figi,
+                        balance=_b,
+                        last_price=Cash(**asdict(_last_price)),
+                        lot_size=_i.lot_size,
+                        ticker=_i.ticker,
+                        type=_i.type
+                    )
 
+    shares_positions = []
+    bonds_positions = []
+    for _instrument, _balance in instrument_balance:
+        if _instrument.type == "share":
+            shares_positions.append(
+                create_position_instrument(_instrument, _balance, last_prices.get(_instrument.uid))
+            )
+        if _instrument.type == "bond":
+            bonds_positions.append(
+                create_position_instrument(_instrument, _balance, last_prices.get(_instrument.uid))
+            )
+
+    return Positions(
+        cash=PositionsCash(**asdict(positions.money[0])) if positions.money else None,
+        shares=shares_positions,
+        bonds=bonds_positions
+    )
+
+
+def order_request(account_id: str, action: Action) -> dict:
+    """Параметры post_order для действия"""
+    type_order = OrderDirection.ORDER_DIRECTION_BUY if action.type == "BUY" else OrderDirection.ORDER_DIRECTION_SELL
+    return dict(
+        instrument_id=action.share.uid,
+        quantity=action.quantity,
+        # price=price,
+        direction=type_order,
+        account_id=account_id,
+        order_type=OrderType.ORDER_TYPE_BESTPRICE,  # TODO: Добавить другие типы
+        order_id=str(uuid.uuid4())
+    )
 
 
 class TAccount:
@@ -161,21 +593,16 @@ class TAccount:
 
     def get_positions(self)-> Positions:
         """
-        Возвращает позиции на счете.
+        Возвращает позиции на счете. Снимок позиций живёт positions_ttl_in_sec
+        и сбрасывается после каждой успешной заявки по счету.
         """
-        def create_position_instrument(_i:InstrumentBase, _b:int, _last_price) -> PositionsInstrument:
-
-            return PositionsInstrument(
-                            uid=_i.uid,
-                            figi=_i.figi,
-                            balance=_b,
-                            last_price=Cash(**asdict(_last_price)),
-                            lot_size=_i.lot_size,
-                            ticker=_i.ticker,
-                            type=_i.type
-                        )
-
+        positions = self.broker.cached_positions(self.account_id)
+        if positions is None:
+            positions = self._load_positions()
+            self.broker.remember_positions(self.account_id, positions)
+        return positions
 
+    def _load_positions(self) -> Positions:
         with self.broker.get_client() as client:
             positions = client.operations.get_positions(account_id=self.account_id)
 
@@ -184,41 +611,26 @@ class TAccount:
                                  shares=[])
 
             # Матчим акции и баланс
-            instrument_uids = []
             instrument_balance = []
             for _position in positions.securities:
                 if _position.instrument_type in ["share", "bond"]:
-                    instrument_uids.append(_position.instrument_uid)
                     instrument = self.broker.find_instrument(_position.instrument_uid)
 
                     # TODO: Возможно логика лишняя и требует удаления
                     if instrument:  # Проблема с BBG007N0Z367. Его нет в списке всех акций, но в портфеле он остался, хоть и продан
                         instrument_balance.append((instrument, _position.balance))
 
-            # Получаем информацию о последних ценах
-            last_prices = {
-                last_price.instrument_uid: last_price.price
-                for last_price in client.market_data.get_last_prices(
-                    instrument_id=[p.instrument_uid for p in positions.securities]).last_prices
-            }
-
-            shares_positions = []
-            bonds_positions = []
-            for _instrument, _balance in instrument_balance:
-                if _instrument.type == "share":
-                    shares_positions.append(
-                        create_position_instrument(_instrument, _balance, last_prices.get(_instrument.uid))
-                    )
-                if _instrument.type == "bond":
-                    bonds_positions.append(
-                        create_position_instrument(_instrument, _balance, last_prices.get(_instrument.uid))
-                    )
+            # Последние цены берём из стрима, а устаревшие или неизвестные запрашиваем у API
+            last_prices, stale = self.broker.cached_last_prices([p.instrument_uid for p in positions.securities])
+            if stale:
+                fetched = {
+                    last_price.instrument_uid: last_price.price
+                    for last_price in client.market_data.get_last_prices(instrument_id=stale).last_prices
+                }
+                self.broker.prices.update(fetched)
+                last_prices.update(fetched)
 
-        return Positions(
-            cash=PositionsCash(**asdict(positions.money[0])) if positions.money else None,
-            shares=shares_positions,
-            bonds=bonds_positions
-        )
+        return build_positions(positions, instrument_balance, last_prices)
 
     def create_order(self, action: Action):
         """
@@ -226,22 +638,15 @@ class TAccount:
         :param action: Данные для ордера
         :return:
         """
-        type_order = OrderDirection.ORDER_DIRECTION_BUY if action.type == "BUY" else OrderDirection.ORDER_DIRECTION_SELL
-        order_id = str(uuid.uuid4())
         with self.broker.get_client() as client:
             try:
-                return client.orders.post_order(
-                    instrument_id=action.share.uid,
-                    quantity=action.quantity,
-                    # price=price,
-                    direction=type_order,
-                    account_id=self.account_id,
-                    order_type=OrderType.ORDER_TYPE_BESTPRICE,  # TODO: Добавить другие типы
-                    order_id=order_id
-                )
+                response = client.orders.post_order(**order_request(self.account_id, action))
             except RequestError as e:
                 raise Error(source="Broker", source_data=e, data=action, description=e.metadata.message)
 
+        self.broker.invalidate_positions(self.account_id)
+        return response
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+import sys
+import time
+import asyncio
+import inspect
+import logging
+import threading
+from functools import wraps
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, fields, is_dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass()
+class CacheStats:
+    """
+    Статистика кэша
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    size: int = 0
+    bytes: int = 0
+
+
+def approx_size(obj, _seen: Optional[set] = None) -> int:
+    """Примерный размер объекта в памяти вместе с вложенными контейнерами и датаклассами"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, seen) for v in obj)
+    elif is_dataclass(obj) and not isinstance(obj, type):
+        size += sum(approx_size(getattr(obj, f.name), seen) for f in fields(obj))
+    return size
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш с вытеснением давно не использованных значений (LRU) и сроком жизни (TTL).
+    Размер ограничивается количеством значений и, если задан max_bytes, примерным объёмом памяти.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: int = 128, max_bytes: Optional[int] = None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Any, Tuple[Any, float, int]]" = OrderedDict()
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Tuple[bool, Any]:
+        """
+        :param key: Ключ
+        :return: Найдено ли значение и само значение
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, size = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._stats.hits += 1
+                    return True, value
+                self._remove(key)
+                self._stats.expirations += 1
+            self._stats.misses += 1
+            return False, None
+
+    def set(self, key, value) -> None:
+        size = approx_size(value) if self.max_bytes else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic() + self.ttl_seconds, size)
+            self._stats.size += 1
+            self._stats.bytes += size
+            while self._data and (self._stats.size > self.maxsize or
+                                  (self.max_bytes and self._stats.bytes > self.max_bytes)):
+                self._remove(next(iter(self._data)))
+                self._stats.evictions += 1
+
+    def _remove(self, key) -> None:
+        _, _, size = self._data.pop(key)
+        self._stats.size -= 1
+        self._stats.bytes -= size
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._stats.size = self._stats.bytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**asdict(self._stats))
+
+
+# Все кэши, созданные декоратором cached: имя -> кэш
+_caches: Dict[str, TTLCache] = {}
+
+
+def cache_stats() -> Dict[str, dict]:
+    """Статистика всех кэшей cached: hits, misses, evictions, expirations, size, bytes"""
+    return {name: asdict(cache.stats()) for name, cache in _caches.items()}
+
+
+# Результат общего вычисления, прерванного отменой: ожидающие повторяют вызов сами
+_RETRY = object()
+
+
+class _Call:
+    """Вычисление значения, которого ждут одновременные промахи по тому же ключу"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _RETRY
+        self.error: Optional[Exception] = None
+
+
+def cached(ttl_seconds: float, maxsize: int = 128, max_bytes: Optional[int] = None,
+           key: Optional[Callable[..., Any]] = None, name: Optional[str] = None):
+    """
+    Декоратор кэширования результатов функции или метода, синхронного или асинхронного.
+    Одновременные промахи по одному ключу ждут одно общее вычисление.
+    :param ttl_seconds: Срок жизни значения
+    :param maxsize: Максимальное количество значений
+    :param max_bytes: Ограничение примерного объёма значений в памяти
+    :param key: Функция с той же сигнатурой, что и декорируемая, возвращающая ключ кэша.
+        По умолчанию ключ - все аргументы вызова
+    :param name: Имя кэша в статистике, по умолчанию модуль и имя функции
+    """
+    def decorator(func):
+        cache = TTLCache(ttl_seconds, maxsize, max_bytes)
+        _caches[name or f"{func.__module__}.{func.__qualname__}"] = cache
+
+        def make_key(args, kwargs):
+            if key is not None:
+                return key(*args, **kwargs)
+            return args + tuple(sorted(kwargs.items()))
+
+        if inspect.iscoroutinefunction(func):
+            pending: Dict[Any, asyncio.Future] = {}
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                cache_key = make_key(args, kwargs)
+                while True:
+                    found, value = cache.get(cache_key)
+                    if found:
+                        return value
+                    if cache_key not in pending:
+                        break
+                    # Если вызвавший вычисление отменён, один из ожидающих повторяет вызов
+                    value = await asyncio.shield(pending[cache_key])
+                    if value is not _RETRY:
+                        return value
+
+                future = asyncio.get_running_loop().create_future()
+                pending[cache_key] = future
+                try:
+                    value = await func(*args, **kwargs)
+                    cache.set(cache_key, value)
+                    future.set_result(value)
+                    return value
+                except Exception as e:
+                    future.set_exception(e)
+                    future.exception()  # Ошибку получат ожидающие, если они есть
+                    raise
+                finally:
+                    pending.pop(cache_key, None)
+                    if not future.done():
+                        future.set_result(_RETRY)
+
+            async_wrapper.cache = cache
+            return async_wrapper
+
+        pending_calls: Dict[Any, _Call] = {}
+        pending_lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = make_key(args, kwargs)
+            while True:
+                found, value = cache.get(cache_key)
+                if found:
+                    return value
+
+                with pending_lock:
+                    call = pending_calls.get(cache_key)
+                    leader = call is None
+                    if leader:
+                        call = pending_calls[cache_key] = _Call()
+                if leader:
+                    break
+
+                call.done.wait()
+                if call.error is not None:
+                    raise call.error
+                if call.value is not _RETRY:
+                    return call.value
+
+            try:
+                value = func(*args, **kwargs)
+                cache.set(cache_key, value)
+                call.value = value
+                return value
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with pending_lock:
+                    pending_calls.pop(cache_key, None)
+                call.done.set()
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
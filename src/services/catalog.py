@@ -0,0 +1,66 @@
+import os
+import time
+import sqlite3
+import logging
+from contextlib import closing
+from typing import List
+
+from src.config import settings
+
+from src.models.instrument import InstrumentBase
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentCatalog:
+    """
+    Справочник инструментов брокера на диске (SQLite). Хранит последнюю выгрузку бумаг
+    и облигаций, чтобы новый процесс не скачивал весь список инструментов при старте.
+    """
+
+    def __init__(self, path: str = settings.logging.path + settings.broker.catalog_file,
+                 ttl_seconds: int = settings.broker.catalog_ttl_in_sec):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS instruments ("
+                "uid TEXT PRIMARY KEY, figi TEXT, ticker TEXT, lot_size INTEGER, isin TEXT, type TEXT)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение на каждый вызов: справочник обновляется из фонового потока
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self) -> List[InstrumentBase]:
+        """
+        Загружает инструменты из справочника
+        :return: Список инструментов, пустой, если справочник ещё не заполнен
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT uid, figi, ticker, lot_size, isin, type FROM instruments").fetchall()
+        return [InstrumentBase(*row) for row in rows]
+
+    def save(self, instruments: List[InstrumentBase]) -> None:
+        """
+        Полностью заменяет содержимое справочника одной транзакцией
+        :param instruments: Актуальный список инструментов
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM instruments")
+            connection.executemany(
+                "INSERT OR REPLACE INTO instruments VALUES (?, ?, ?, ?, ?, ?)",
+                [(i.uid, i.figi, i.ticker, i.lot_size, i.isin, i.type) for i in instruments]
+            )
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('updated_at', ?)", (time.time(),))
+        logger.info("Instrument catalog saved: %s instruments", len(instruments))
+
+    def updated_at(self) -> float:
+        """Время последнего обновления справочника, 0 - если ещё не заполнялся"""
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'updated_at'").fetchone()
+        return row[0] if row else 0
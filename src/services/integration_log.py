@@ -0,0 +1,149 @@
+import io
+import os
+import glob
+import gzip
+import json
+import shutil
+import logging
+from datetime import datetime
+from typing import Iterator, List, Optional
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+
+try:
+    import zstandard
+except ImportError:  # zstd - необязательная зависимость, без неё сегменты сжимаются gzip
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSED_SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+
+def _compression(compression: str) -> str:
+    if compression not in COMPRESSED_SUFFIXES:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed, integration log segments are compressed with gzip")
+        return "gzip"
+    return compression
+
+
+def _compress(source: str, destination: str) -> None:
+    """Сжимает закрытый сегмент лога и удаляет исходный файл"""
+    if destination.endswith(".zst"):
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            zstandard.ZstdCompressor().copy_stream(src, dst)
+    elif destination.endswith(".gz"):
+        with open(source, "rb") as src, gzip.open(destination, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    else:
+        os.replace(source, destination)
+        return
+    os.remove(source)
+
+
+def make_handler(path: str, rotation: str = "size", max_bytes: int = 50 * 1024 * 1024,
+                 when: str = "midnight", backup_count: int = 20, compression: str = "gzip") -> logging.Handler:
+    """
+    Обработчик лога интеграции с ротацией по размеру или по времени. Закрытые сегменты сжимаются.
+    :param path: Файл текущего сегмента
+    :param rotation: size - по размеру, time - по времени
+    :param max_bytes: Размер сегмента для ротации по размеру
+    :param when: Интервал для ротации по времени, как в TimedRotatingFileHandler
+    :param backup_count: Сколько закрытых сегментов хранить
+    :param compression: gzip, zstd или none
+    :return: Обработчик
+    """
+    if rotation == "size":
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    elif rotation == "time":
+        handler = TimedRotatingFileHandler(path, when=when, backupCount=backup_count, encoding="utf-8")
+    else:
+        raise ValueError(f"Unknown rotation: {rotation}")
+
+    suffix = COMPRESSED_SUFFIXES[_compression(compression)]
+    if suffix:
+        handler.namer = lambda name: name + suffix
+        handler.rotator = _compress
+    return handler
+
+
+def segments(path: str) -> List[str]:
+    """
+    Сегменты лога от старых к новым: закрытые (в том числе сжатые) и текущий
+    :param path: Файл текущего сегмента
+    """
+    closed = [p for p in glob.glob(glob.escape(path) + ".*") if not p.endswith(".tmp")]
+    closed.sort(key=os.path.getmtime)
+    return closed + ([path] if os.path.exists(path) else [])
+
+
+def _open_segment(path: str):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_records(paths: List[str], name: Optional[str] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, errors_only: bool = False) -> Iterator[dict]:
+    """
+    Построчно читает сегменты и отдаёт подходящие записи, не загружая файлы в память целиком.
+    Строки не в формате NDJSON (например, старый многострочный формат) пропускаются.
+    :param paths: Сегменты лога
+    :param name: Имя метода
+    :param since: Записи не раньше этого времени
+    :param until: Записи раньше этого времени
+    :param errors_only: Только вызовы, завершившиеся ошибкой
+    :return: Записи лога
+    """
+    since_ts = since.timestamp() if since else None
+    until_ts = until.timestamp() if until else None
+    for path in paths:
+        with _open_segment(path) as segment:
+            for line in segment:
+                # Быстрый отсев по имени метода до разбора JSON
+                if name and f'"name": "{name}"' not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict) or "ts" not in record:
+                    continue
+                if name and record.get("name") != name:
+                    continue
+                if since_ts and record["ts"] < since_ts:
+                    continue
+                if until_ts and record["ts"] >= until_ts:
+                    continue
+                if errors_only and not record.get("error"):
+                    continue
+                yield record
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    from src.config import settings
+
+    parser = argparse.ArgumentParser(description="Поиск по логу интеграции с брокером")
+    parser.add_argument("--path", default=settings.logging.path + settings.broker.log_file,
+                        help="Файл текущего сегмента лога")
+    parser.add_argument("--name", help="Имя метода, например get_all_instruments")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Начало интервала, ISO 8601")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Конец интервала, ISO 8601")
+    parser.add_argument("--errors", action="store_true", help="Только вызовы с ошибкой")
+    parser.add_argument("--count", action="store_true", help="Вывести только количество записей")
+    args = parser.parse_args()
+
+    records = iter_records(segments(args.path), args.name, args.since, args.until, args.errors)
+    if args.count:
+        print(sum(1 for _ in records))
+    else:
+        for found in records:
+            sys.stdout.write(json.dumps(found, ensure_ascii=False) + "\n")
@@ -0,0 +1,183 @@
+import time
+import bisect
+import inspect
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "shadowtrader_"
+
+# Метрики длительности в секундах
+INTEGRATION = "integration_call_seconds"  # Методы брокера под log_response
+BROKER_REQUEST = "broker_request_seconds"  # Запросы к API брокера
+MOEX_REQUEST = "moex_request_seconds"  # Запросы к ISS Мосбиржи
+SCHEDULER_JOB = "scheduler_job_seconds"  # Задания планировщика
+BOT_HANDLER = "bot_handler_seconds"  # Обработчики бота
+
+
+class Histogram:
+    """
+    Гистограмма длительностей с фиксированными границами корзин, как в Prometheus
+    """
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Последняя корзина - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class MetricsRegistry:
+    """
+    Реестр гистограмм: (метрика, метки) -> Histogram. Потокобезопасный
+    """
+
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.default_buckets = buckets or settings.metrics.buckets
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, metric: str, value: float, **labels) -> None:
+        """
+        Записывает наблюдение
+        :param metric: Имя метрики
+        :param value: Значение, для длительностей - в секундах
+        :param labels: Метки
+        """
+        key = (metric, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.default_buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, metric: str, **labels):
+        """Замеряет длительность блока. Если блок завершился исключением, добавляется метка status=error"""
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.observe(metric, time.perf_counter() - started, status=status, **labels)
+
+    def timed(self, metric: str, **labels):
+        """Декоратор для замера длительности синхронных и асинхронных функций"""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(metric, **labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(metric, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        """Все гистограммы в текстовом формате Prometheus"""
+        with self._lock:
+            items = sorted(self._histograms.items())
+            lines, described = [], set()
+            for (metric, labels), histogram in items:
+                name = PREFIX + metric
+                if name not in described:
+                    lines.append(f"# TYPE {name} histogram")
+                    described.add(name)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + [float("inf")], histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f"{name}_bucket{_labels_text(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels_text(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_labels_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> List[dict]:
+        """Краткая сводка для команды /stats: количество, среднее и p95 по каждой гистограмме"""
+        with self._lock:
+            return [
+                {"metric": metric, "labels": dict(labels), "count": h.count,
+                 "avg": h.sum / h.count if h.count else 0.0, "p95": h.quantile(0.95)}
+                for (metric, labels), h in sorted(self._histograms.items())
+            ]
+
+
+registry = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format, *args)
+
+
+def start_http_server(port: int = settings.metrics.port,
+                      host: str = settings.metrics.host) -> Optional[ThreadingHTTPServer]:
+    """
+    Запускает HTTP сервер с метриками на /metrics в фоновом потоке
+    :param port: Порт, 0 - сервер не запускается
+    :param host: Адрес, по умолчанию только локальный
+    :return: Сервер или None
+    """
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Metrics are served on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,112 @@
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Tuple, Any, Callable, Optional
+
+from t_tech.invest import Client, LastPriceInstrument
+
+logger = logging.getLogger(__name__)
+
+
+class PriceTable:
+    """
+    Таблица последних цен в памяти: uid инструмента -> цена и время её получения
+    """
+
+    def __init__(self):
+        self._prices: Dict[str, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+
+    def update(self, prices: Dict[str, Any]) -> None:
+        """
+        Запоминает цены
+        :param prices: Цены по uid инструмента
+        """
+        now = time.monotonic()
+        with self._lock:
+            for uid, price in prices.items():
+                self._prices[uid] = (price, now)
+
+    def get_many(self, uids: Iterable[str], max_age: float) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Читает цены, полученные не раньше max_age секунд назад
+        :param uids: Идентификаторы инструментов
+        :param max_age: Допустимый возраст цены в секундах
+        :return: Свежие цены по uid и список uid, цены по которым нет или она устарела
+        """
+        now = time.monotonic()
+        fresh, stale = {}, []
+        with self._lock:
+            for uid in uids:
+                price, updated_at = self._prices.get(uid, (None, 0.0))
+                if price is not None and now - updated_at <= max_age:
+                    fresh[uid] = price
+                else:
+                    stale.append(uid)
+        return fresh, stale
+
+
+class LastPriceStream:
+    """
+    Подписка на поток последних цен. Фоновый поток держит открытый стрим market data,
+    подписывается на все отслеживаемые инструменты и пишет цены в PriceTable.
+    При обрыве стрима переподключается и подписывается заново.
+    """
+
+    def __init__(self, client_params: Callable[[], dict], table: PriceTable, reconnect_delay: float = 5):
+        self._client_params = client_params
+        self.table = table
+        self.reconnect_delay = reconnect_delay
+
+        self._tracked: set = set()
+        self._stream = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def track(self, uids: Iterable[str]) -> None:
+        """
+        Добавляет инструменты в подписку. Первый вызов запускает фоновый поток
+        :param uids: Идентификаторы инструментов
+        """
+        with self._lock:
+            new = set(uids) - self._tracked
+            if not new:
+                return
+            self._tracked |= new
+            if self._stream is not None:
+                self._subscribe(self._stream, new)
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="last-price-stream", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Закрывает стрим и останавливает фоновый поток"""
+        self._stopped.set()
+        with self._lock:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop()
+
+    @staticmethod
+    def _subscribe(stream, uids: Iterable[str]) -> None:
+        stream.last_price.subscribe([LastPriceInstrument(instrument_id=uid) for uid in uids])
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                with Client(**self._client_params()) as client:
+                    stream = client.create_market_data_stream()
+                    with self._lock:
+                        self._stream = stream
+                        self._subscribe(stream, self._tracked)
+                    for market_data in stream:
+                        if market_data.last_price:
+                            self.table.update({market_data.last_price.instrument_uid: market_data.last_price.price})
+            except Exception:
+                logger.warning("Last price stream failed, reconnecting", exc_info=True)
+            finally:
+                with self._lock:
+                    self._stream = None
+            self._stopped.wait(self.reconnect_delay)
@@ -0,0 +1,159 @@
+import os
+import asyncio
+import inspect
+import pstats
+import random
+import cProfile
+import logging
+import threading
+import tracemalloc
+from datetime import datetime
+from functools import wraps
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Профилировщик в процессе может быть активен только один, одновременные сессии пропускаются
+_active = threading.Lock()
+
+
+class _Session:
+    """Профили рабочих потоков, запущенных через to_thread во время сессии"""
+
+    def __init__(self):
+        self.thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add(self, profiler: cProfile.Profile) -> None:
+        with self._lock:
+            self.thread_profiles.append(profiler)
+
+
+_session: ContextVar[Optional[_Session]] = ContextVar("profiling_session", default=None)
+
+
+def _is_sampled() -> bool:
+    config = settings.profiling
+    return config.enabled and random.random() < config.sample_rate
+
+
+def profile_dir() -> str:
+    """Каталог для .prof и снимков памяти внутри каталога логов"""
+    return os.path.join(settings.logging.path, settings.profiling.dir)
+
+
+@contextmanager
+def profile(name: str, directory: Optional[str] = None):
+    """
+    Профилирует блок cProfile и tracemalloc, если профилирование включено и вызов попал в выборку.
+    Результат пишется в <directory>/<name>-<время>.prof и <name>-<время>.snapshot.
+    cProfile видит только поток, в котором включён. Работа, вынесенная в поток, попадает в профиль,
+    если запущена через to_thread. В асинхронном коде профиль включает и другие задачи,
+    выполнявшиеся во время await.
+    :param name: Имя профилируемого задания или обработчика
+    :param directory: Каталог для результатов, по умолчанию profile_dir()
+    """
+    if not _is_sampled() or not _active.acquire(blocking=False):
+        yield
+        return
+
+    memory = settings.profiling.tracemalloc
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(settings.profiling.tracemalloc_frames)
+    session = _Session()
+    token = _session.set(session)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _session.reset(token)
+        snapshot = tracemalloc.take_snapshot() if memory else None
+        peak = tracemalloc.get_traced_memory()[1] if memory else 0
+        if started_tracing:
+            tracemalloc.stop()
+        _active.release()
+        _dump(name, directory or profile_dir(), [profiler] + session.thread_profiles, snapshot, peak)
+
+
+async def to_thread(func: Callable, *args, **kwargs):
+    """
+    asyncio.to_thread, который во время сессии profile профилирует и рабочий поток.
+    Профиль потока добавляется к профилю сессии
+    :param func: Функция для выполнения в потоке
+    :return: Результат func
+    """
+    session = _session.get()
+    if session is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def run():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # С Python 3.12 профилировщик общий для всех потоков и уже собирает этот поток
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            session.add(profiler)
+
+    return await asyncio.to_thread(run)
+
+
+def profiled(name: str):
+    """Декоратор для профилирования синхронных и асинхронных функций, см. profile"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with profile(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _dump(name: str, directory: str, profilers: List[cProfile.Profile],
+          snapshot: Optional[tracemalloc.Snapshot], peak: int) -> None:
+    try:
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{name}-{datetime.now():%Y%m%d-%H%M%S-%f}")
+        stats = pstats.Stats(profilers[0])
+        for thread_profiler in profilers[1:]:
+            stats.add(thread_profiler)
+        stats.dump_stats(base + ".prof")
+        if snapshot is not None:
+            snapshot.dump(base + ".snapshot")
+        logger.info("Profile of %s saved to %s.prof, peak traced memory %s bytes", name, base, peak)
+    except OSError:
+        logger.exception("Failed to save profile of %s", name)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Просмотр сохранённых профилей")
+    parser.add_argument("path", help="Файл .prof или .snapshot")
+    parser.add_argument("--sort", default="cumulative", help="Сортировка для .prof, как в pstats")
+    parser.add_argument("--limit", type=int, default=30, help="Сколько строк вывести")
+    args = parser.parse_args()
+
+    if args.path.endswith(".snapshot"):
+        for stat in tracemalloc.Snapshot.load(args.path).statistics("lineno")[:args.limit]:
+            print(stat)
+    else:
+        pstats.Stats(args.path).sort_stats(args.sort).print_stats(args.limit)
@@ -0,0 +1,46 @@
+import time
+import asyncio
+import threading
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Ведро токенов для ограничения частоты запросов к брокеру. Пополняется равномерно,
+    rate_per_minute токенов в минуту, и вмещает не больше capacity токенов.
+    Один объект можно использовать и из потоков, и из корутин.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """
+        Резервирует токен. Если токенов нет, он берётся в долг у будущего пополнения.
+        :return: Сколько секунд нужно подождать до использования токена
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> None:
+        """Ждёт, пока можно будет отправить запрос"""
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """Асинхронная версия acquire, не блокирует цикл событий"""
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
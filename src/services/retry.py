@@ -0,0 +1,202 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import inspect
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from typing import Dict, Tuple, Type, Callable, Any, Optional
+
+from src.config import settings
+
+from src.services.metrics import registry as metrics, BROKER_REQUEST
+
+logger = logging.getLogger(__name__)
+
+# Коды gRPC, при которых запрос имеет смысл повторить
+RETRYABLE_CODES = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL"}
+THROTTLED_CODE = "RESOURCE_EXHAUSTED"
+
+
+@dataclass()
+class ThrottleCounters:
+    """
+    Счётчики вызовов одного метода API
+    """
+
+    calls: int = 0
+    retries: int = 0
+    throttled: int = 0
+    failures: int = 0
+
+
+def _code_name(error: Exception) -> str:
+    code = getattr(error, "code", None)
+    return getattr(code, "name", str(code))
+
+
+def _reset_seconds(error: Exception) -> float:
+    """Через сколько секунд API восстановит квоту, по метаданным ошибки. 0 - если неизвестно"""
+    metadata = getattr(error, "metadata", None)
+    reset = getattr(metadata, "ratelimit_reset", None)
+    try:
+        return max(0.0, float(reset)) if reset is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _remaining(error: Exception) -> Optional[int]:
+    """Сколько запросов осталось в квоте метода, по метаданным ошибки. None - если неизвестно"""
+    metadata = getattr(error, "metadata", None)
+    remaining = getattr(metadata, "ratelimit_remaining", None)
+    try:
+        return int(remaining) if remaining is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class Retrier:
+    """
+    Повтор запросов к API при временных ошибках. Задержка растёт экспоненциально со случайным
+    разбросом, а при исчерпании квоты берётся из метаданных ratelimit_reset ответа. Пока квота
+    метода не восстановилась, новые вызовы этого метода ждут, а не уходят в API.
+    SDK отдаёт метаданные квоты только вместе с ошибкой, поэтому квота учитывается после ответа
+    с ошибкой: троттлинга или любой другой, в которой ratelimit_remaining равен 0.
+    """
+
+    def __init__(self, errors: Tuple[Type[Exception], ...],
+                 attempts: int = settings.broker.retry_attempts,
+                 base_delay: float = settings.broker.retry_base_delay_in_sec,
+                 max_delay: float = settings.broker.retry_max_delay_in_sec):
+        if attempts < 1:
+            raise ValueError("attempts must be at least 1")
+
+        self.errors = errors
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._counters: Dict[str, ThrottleCounters] = defaultdict(ThrottleCounters)
+        self._blocked_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, dict]:
+        """Счётчики по методам: calls, retries, throttled, failures"""
+        with self._lock:
+            return {method: asdict(counters) for method, counters in self._counters.items()}
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _wait_before_call(self, method: str) -> float:
+        """Сколько ждать до восстановления квоты метода. Заодно считает вызов"""
+        with self._lock:
+            self._counters[method].calls += 1
+            return max(0.0, self._blocked_until.get(method, 0.0) - time.monotonic())
+
+    def _on_error(self, method: str, error: Exception, attempt: int) -> float:
+        """
+        Решает, повторять ли запрос
+        :return: Задержка перед повтором или -1, если повторять не нужно
+        """
+        code = _code_name(error)
+        reset = _reset_seconds(error)
+        with self._lock:
+            counters = self._counters[method]
+            if reset and _remaining(error) == 0:
+                # Квота метода кончилась, даже если сам запрос упал по другой причине
+                self._blocked_until[method] = max(self._blocked_until.get(method, 0.0),
+                                                  time.monotonic() + min(self.max_delay, reset))
+            if code not in RETRYABLE_CODES or attempt + 1 >= self.attempts:
+                counters.failures += 1
+                return -1
+
+            counters.retries += 1
+            delay = self._backoff(attempt)
+            if code == THROTTLED_CODE:
+                counters.throttled += 1
+                if reset:
+                    # Квота метода кончилась: все вызовы метода ждут её восстановления
+                    delay = min(self.max_delay, reset) + random.uniform(0, self.base_delay)
+                    self._blocked_until[method] = max(self._blocked_until.get(method, 0.0),
+                                                      time.monotonic() + delay)
+
+        logger.warning("%s failed with %s (ratelimit remaining %s), retry %s in %.2fs",
+                       method, code, _remaining(error), attempt + 1, delay)
+        return delay
+
+    def call(self, method: str, func: Callable, *args, **kwargs):
+        """
+        Вызов с повторами
+        :param method: Имя метода для счётчиков и квоты
+        :param func: Вызываемая функция
+        :return: Результат func
+        """
+        for attempt in range(self.attempts):
+            wait = self._wait_before_call(method)
+            if wait:
+                time.sleep(wait)
+            try:
+                with metrics.timer(BROKER_REQUEST, method=method):
+                    return func(*args, **kwargs)
+            except self.errors as e:
+                delay = self._on_error(method, e, attempt)
+                if delay < 0:
+                    raise
+                time.sleep(delay)
+
+    async def call_async(self, method: str, func: Callable, *args, **kwargs):
+        """Асинхронная версия call"""
+        for attempt in range(self.attempts):
+            wait = self._wait_before_call(method)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                with metrics.timer(BROKER_REQUEST, method=method):
+                    return await func(*args, **kwargs)
+            except self.errors as e:
+                delay = self._on_error(method, e, attempt)
+                if delay < 0:
+                    raise
+                await asyncio.sleep(delay)
+
+
+class RetryingClient:
+    """
+    Обёртка клиента API: методы сервисов (client.orders.post_order и т.п.) вызываются через Retrier,
+    остальные атрибуты клиента отдаются как есть
+    """
+
+    def __init__(self, client, retrier: Retrier):
+        self._client = client
+        self._retrier = retrier
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if callable(attribute):
+            return attribute
+        return _RetryingService(attribute, name, self._retrier)
+
+
+class _RetryingService:
+
+    def __init__(self, service, name: str, retrier: Retrier):
+        self._service = service
+        self._name = name
+        self._retrier = retrier
+
+    def __getattr__(self, name: str):
+        method = getattr(self._service, name)
+        if not callable(method):
+            return method
+        method_name = f"{self._name}.{name}"
+
+        if inspect.iscoroutinefunction(method):
+            async def async_call(*args, **kwargs):
+                return await self._retrier.call_async(method_name, method, *args, **kwargs)
+            return async_call
+
+        def call(*args, **kwargs):
+            return self._retrier.call(method_name, method, *args, **kwargs)
+        return call
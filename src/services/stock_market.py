@@ -2,6 +2,9 @@ import requests
 
 from src.config import settings
 
+from src.services.cache import cached
+from src.services.metrics import registry as metrics, MOEX_REQUEST
+
 from src.models.index import Index, IndexItem
 from src.models.bond import MoexBond
 from src.models.error import Error
@@ -19,10 +22,12 @@ class Moex:
         self.session = requests.Session()
 
     def _fetch_json(self, url: str, params: dict) -> dict:
+        endpoint = url.replace(self.base_url, "").split("?")[0]
         try:
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+            with metrics.timer(MOEX_REQUEST, endpoint=endpoint):
+                response = self.session.get(url, params=params)
+                response.raise_for_status()
+                return response.json()
         except requests.RequestException as e:
             raise Error(source="Moex",
                         source_data=e,
@@ -92,6 +97,7 @@ class Moex:
 
         return index
 
+    @cached(ttl_seconds=settings.stock_market.cache_ttl_in_sec, key=lambda self: self.base_url)
     def get_indices(self) -> list[tuple[str, str]]:
         """
         Возвращает список индексов для отслеживания.
@@ -113,6 +119,8 @@ class Moex:
 
         return result
 
+    @cached(ttl_seconds=settings.stock_market.cache_ttl_in_sec, max_bytes=settings.stock_market.cache_max_bytes,
+            key=lambda self: self.base_url)
     def get_bonds(self) -> list[MoexBond]:
         """
         Возвращает список облигаций с Мосбиржи
@@ -1,36 +1,18 @@
 import os
 import json
+import queue
+import random
+import atexit
 import logging
 import inspect
 from functools import wraps
-import time
-from dataclasses import asdict, is_dataclass
+from logging.handlers import QueueHandler, QueueListener
+from dataclasses import asdict, is_dataclass, fields
 
 from src.config import settings
 
-### Функция для кэширования
-
-def cache_data(ttl_seconds: int):
-    """Декоратор для кэширования вызова метода с TTL."""
-    def decorator(func):
-        cache = None
-        last_update = 0
-
-        @wraps(func)
-        def wrapper(self, *args, **kwargs):
-            nonlocal cache, last_update
-
-            current_time = time.time()
-            if cache is not None and (current_time - last_update) < ttl_seconds:
-                return cache
-
-            print(f"Обновляю кэш в {func.__name__}...")
-            cache = func(self, *args, **kwargs)
-            last_update = current_time
-            return cache
-        return wrapper
-    return decorator
-
+from src.services.integration_log import make_handler
+from src.services.metrics import registry as metrics, INTEGRATION
 
 ### Функции для сбора логов
 
@@ -39,36 +21,137 @@ def default_serializer(obj):
         return asdict(obj)
     return str(obj)
 
-def log_integration(name: str, request: dict, response: dict):
 
-    integration_logger.debug(json.dumps({
+def compact_payload(obj, max_items: int):
+    """
+    Готовит данные к записи в лог: датаклассы превращаются в словари, а длинные списки
+    обрезаются до max_items элементов с пометкой, сколько пропущено
+    """
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: compact_payload(getattr(obj, f.name), max_items) for f in fields(obj)}
+    if isinstance(obj, dict):
+        return {str(k): compact_payload(v, max_items) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, set)):
+        items = list(obj)
+        result = [compact_payload(v, max_items) for v in items[:max_items]]
+        if len(items) > max_items:
+            result.append(f"... {len(items) - max_items} more")
+        return result
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return str(obj)
+
+
+class IntegrationFormatter(logging.Formatter):
+    """
+    Сериализует запись интеграции в одну строку JSON (NDJSON): ts, time, name, request, response, error.
+    Работает в фоновом потоке QueueListener, поэтому json.dumps больших ответов не задерживает вызывающий код.
+    Если запись длиннее max_chars, request и response заменяются обрезанными строками и ставится truncated.
+    """
+
+    def __init__(self, max_items: int, max_chars: int):
+        super().__init__()
+        self.max_items = max_items
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not isinstance(record.msg, dict):
+            return json.dumps({"ts": record.created, "time": self.formatTime(record), "message": record.getMessage()},
+                              ensure_ascii=False)
+
+        entry = {"ts": record.created, "time": self.formatTime(record),
+                 **compact_payload(record.msg, self.max_items)}
+        line = json.dumps(entry, ensure_ascii=False, default=default_serializer)
+        if len(line) > self.max_chars:
+            for key in ("request", "response"):
+                value = json.dumps(entry.get(key), ensure_ascii=False, default=default_serializer)
+                entry[key] = value[:self.max_chars // 2]
+            entry["truncated"] = len(line)
+            line = json.dumps(entry, ensure_ascii=False, default=default_serializer)
+        return line
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler без сериализации на стороне вызывающего потока: в очередь уходит снимок данных записи,
+    обрезанный compact_payload, а json.dumps и запись в файл выполняются в QueueListener.
+    Снимок нужен, потому что позиции и значения кэшей переиспользуются и могут измениться до записи.
+    При переполнении очереди запись отбрасывается.
+    """
+
+    dropped = 0
+
+    def __init__(self, handler_queue: queue.Queue, max_items: int):
+        super().__init__(handler_queue)
+        self.max_items = max_items
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.msg, dict):
+            record.msg = compact_payload(record.msg, self.max_items)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DeferredQueueHandler.dropped += 1
+
+
+def _is_sampled(name: str) -> bool:
+    rate = INTEGRATION_LOG_SAMPLING.get(name, 1.0)
+    return rate >= 1 or random.random() < rate
+
+
+def log_integration(name: str, request: dict, response: dict, error: bool = False):
+
+    integration_logger.debug({
         "name": name,
         "request": request,
         "response": response,
-    }, ensure_ascii=False, default=default_serializer, indent=2))
+        "error": error,
+    })
 
 
 def log_response():
     def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            bound_args = inspect.signature(func).bind(*args, **kwargs)
+        signature = inspect.signature(func)
+
+        def request_data(args, kwargs) -> dict:
+            bound_args = signature.bind(*args, **kwargs)
             bound_args.apply_defaults()
-            request_data = dict(bound_args.arguments)
+            return dict(bound_args.arguments)
+
+        def write(args, kwargs, response_data, failed: bool):
+            # Ошибки пишутся всегда, успешные вызовы - с долей integration_sampling для метода
+            if not integration_logger.isEnabledFor(logging.DEBUG):
+                return
+            if failed or _is_sampled(func.__name__):
+                log_integration(func.__name__, request_data(args, kwargs), response_data, failed)
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    with metrics.timer(INTEGRATION, method=func.__name__):
+                        result = await func(*args, **kwargs)
+                except Exception as e:
+                    write(args, kwargs, {"error": str(e)}, failed=True)
+                    raise
+
+                write(args, kwargs, result, failed=False)
+                return result
+            return async_wrapper
 
+        @wraps(func)
+        def wrapper(*args, **kwargs):
             try:
-                result = func(*args, **kwargs)
-                response_data = result
+                with metrics.timer(INTEGRATION, method=func.__name__):
+                    result = func(*args, **kwargs)
             except Exception as e:
-                response_data = {"error": str(e)}
+                write(args, kwargs, {"error": str(e)}, failed=True)
                 raise
-            finally:
-                log_integration(
-                    func.__name__,
-                    request_data,
-                    response_data
-                )
 
+            write(args, kwargs, result, failed=False)
             return result
         return wrapper
     return decorator
@@ -77,13 +160,26 @@ def log_response():
 
 INTEGRATION_LOG_PATH = settings.logging.path + settings.broker.log_file
 INTEGRATION_LOG_ENABLED = settings.logging.enabled
+INTEGRATION_LOG_SAMPLING = settings.logging.integration_sampling
 
 integration_logger = logging.getLogger("broker_integration")
 integration_logger.setLevel(logging.DEBUG if INTEGRATION_LOG_ENABLED else logging.CRITICAL)
+# Записи интеграции не дублируются в консоль приложения, они пишутся только в свой файл
+integration_logger.propagate = False
 
 if not integration_logger.handlers:
     os.makedirs(os.path.dirname(INTEGRATION_LOG_PATH), exist_ok=True)
-    handler = logging.FileHandler(INTEGRATION_LOG_PATH, encoding="utf-8")
-    formatter = logging.Formatter('%(asctime)s | %(name)s | %(levelname)s | %(message)s')
-    handler.setFormatter(formatter)
-    integration_logger.addHandler(handler)
\ No newline at end of file
+    handler = make_handler(INTEGRATION_LOG_PATH,
+                           rotation=settings.logging.integration_rotation,
+                           max_bytes=settings.logging.integration_max_bytes,
+                           when=settings.logging.integration_rotate_when,
+                           backup_count=settings.logging.integration_backup_count,
+                           compression=settings.logging.integration_compression)
+    handler.setFormatter(IntegrationFormatter(settings.logging.integration_max_items,
+                                              settings.logging.integration_max_chars))
+
+    integration_queue = queue.Queue(maxsize=settings.logging.integration_queue_size)
+    integration_listener = QueueListener(integration_queue, handler)
+    integration_listener.start()
+    atexit.register(integration_listener.stop)
+    integration_logger.addHandler(DeferredQueueHandler(integration_queue, settings.logging.integration_max_items))
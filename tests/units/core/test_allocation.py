@@ -0,0 +1,95 @@
+import pytest
+import random
+import itertools
+
+import numpy as np
+
+from src.core import allocation
+
+
+def lots_to_sell_by_loop(balance, lot_size, last_price, total, target_weight, min_lots_to_keep):
+    """Поштучная продажа, которую заменяет allocation.lots_to_sell"""
+    shares_to_sell = 0
+    while (balance > lot_size and
+           (balance - lot_size) * last_price / total >= target_weight and
+           balance // lot_size > min_lots_to_keep):
+        balance -= lot_size
+        shares_to_sell += 1
+    return shares_to_sell
+
+
+class TestLotsToSell:
+
+    @pytest.mark.parametrize("balance, lot_size, last_price, total, target_weight, min_lots_to_keep", [
+        (300, 10, 310.5, 100000, 0.15, 1),
+        (5, 1, 6950.0, 100000, 0.14, 1),
+        (10, 10, 131.2, 10000, 0.01, 1),
+        (0, 10, 131.2, 10000, 0.01, 1),
+        (120, 10, 118.4, 10000, 0.0, 3),
+        (1000, 1, 100.0, 100000, 0.5, 1),
+        (70, 1, 97.3, 81757.8, 0.07, 0),
+    ])
+    def test_matches_loop(self, balance, lot_size, last_price, total, target_weight, min_lots_to_keep):
+        expected = lots_to_sell_by_loop(balance, lot_size, last_price, total, target_weight, min_lots_to_keep)
+
+        result = allocation.lots_to_sell(balance, lot_size, last_price, total, target_weight, min_lots_to_keep)
+
+        assert int(result) == expected
+
+    def test_matches_loop_on_random_positions(self):
+        rnd = random.Random(42)
+        for _ in range(2000):
+            lot_size = rnd.choice([1, 10, 100, 1000])
+            balance = lot_size * rnd.randint(0, 300)
+            last_price = round(rnd.uniform(0.01, 8000), 2)
+            total = balance * last_price + rnd.uniform(0, 1e6) + 1
+            target_weight = round(rnd.uniform(0, 0.2), 4)
+            min_lots_to_keep = rnd.randint(0, 3)
+            expected = lots_to_sell_by_loop(balance, lot_size, last_price, total, target_weight, min_lots_to_keep)
+
+            result = allocation.lots_to_sell(balance, lot_size, last_price, total, target_weight, min_lots_to_keep)
+
+            assert int(result) == expected
+
+
+class TestExactLots:
+
+    @staticmethod
+    def best_by_brute_force(lots_held, lot_price, target_weight, total, free_cash, min_lots_to_keep):
+        options = [
+            range(min(held, min_lots_to_keep), max(held, int(np.ceil(weight * total / price))) + 1)
+            for held, price, weight in zip(lots_held, lot_price, target_weight)
+        ]
+        best = None
+        for lots in itertools.product(*options):
+            spent = sum((n - held) * price for n, held, price in zip(lots, lots_held, lot_price))
+            if spent > free_cash:
+                continue
+            penalty = sum((n * price / total - weight) ** 2 for n, price, weight in zip(lots, lot_price, target_weight))
+            best = penalty if best is None else min(best, penalty)
+        return best
+
+    def test_matches_brute_force_on_random_portfolios(self):
+        rnd = random.Random(0)
+        for _ in range(50):
+            lot_price = np.array([rnd.randint(50, 3000) for _ in range(3)])
+            lots_held = np.array([rnd.randint(0, 5) for _ in range(3)])
+            target_weight = np.array([rnd.random() for _ in range(3)])
+            target_weight /= target_weight.sum()
+            free_cash = rnd.randint(0, 10000)
+            total = float((lots_held * lot_price).sum() + free_cash)
+            # Без комиссии и с корзиной в 1 рубль округление не влияет на результат
+            capacity = int((lots_held * lot_price).sum() + free_cash)
+
+            lots = allocation.exact_lots(lots_held, lot_price, target_weight, total, free_cash,
+                                         commission=0, min_lots_to_keep=1, buckets=capacity)
+
+            spent = ((lots - lots_held) * lot_price).sum()
+            penalty = ((lots * lot_price / total - target_weight) ** 2).sum()
+            assert spent <= free_cash
+            assert penalty == pytest.approx(self.best_by_brute_force(lots_held, lot_price, target_weight,
+                                                                     total, free_cash, 1))
+
+    def test_returns_none_after_deadline(self):
+        assert allocation.exact_lots(np.array([0]), np.array([100.0]), np.array([1.0]), 1000, 1000,
+                                     commission=0, min_lots_to_keep=0, deadline=0) is None
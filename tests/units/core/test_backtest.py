@@ -0,0 +1,67 @@
+import pytest
+import numpy as np
+
+from src.core.backtest import Backtester, BacktestData
+from src.models.index import Index, IndexItem
+
+
+def make_history(days: int, drift: float = 0.0) -> BacktestData:
+    dates = np.arange(np.datetime64("2024-01-01"), np.datetime64("2024-01-01") + days)
+    base = np.array([300.0, 7000.0, 130.0])
+    growth = (1 + drift) ** np.arange(days)[:, None]
+    return BacktestData(
+        dates=dates,
+        tickers=["SBER", "LKOH", "GAZP"],
+        lot_sizes=np.array([10, 1, 10], dtype=float),
+        prices=base * growth,
+        weights=np.tile([40.0, 35.0, 25.0], (days, 1)),
+    )
+
+
+class TestBacktester:
+
+    @pytest.mark.parametrize("frequency, expected_runs", [
+        ("WEEKLY", 13),
+        ("MONTHLY", 3),
+        ("QUARTERLY", 1),
+    ])
+    def test_rebalances_by_schedule(self, frequency, expected_runs):
+        result = Backtester(make_history(90), frequency, initial_cash=100_000, engine="closed_form").run()
+
+        assert len(result.rebalance_dates) == expected_runs
+        assert result.rebalance_dates[0] == "2024-01-01"
+        assert len(result.equity) == 90
+
+    def test_flat_prices_lose_only_commission(self):
+        result = Backtester(make_history(60), "WEEKLY", initial_cash=100_000, commission=0.003,
+                            engine="closed_form").run()
+
+        assert result.equity[-1] == pytest.approx(100_000 - result.commission_paid)
+        assert result.commission_paid == pytest.approx(result.traded_value * 0.003)
+        assert result.cash.min() >= 0
+
+    def test_growing_prices_grow_equity(self):
+        result = Backtester(make_history(60, drift=0.001), "MONTHLY", initial_cash=100_000,
+                            engine="closed_form").run()
+
+        assert result.total_return > 0
+        assert result.turnover > 0
+
+    def test_deposits_are_added_to_cash(self):
+        deposits = np.zeros(60)
+        deposits[30] = 50_000
+        result = Backtester(make_history(60), "WEEKLY", initial_cash=100_000, deposits=deposits,
+                            commission=0, engine="closed_form").run()
+
+        assert result.equity[-1] == pytest.approx(150_000)
+
+    def test_from_indices_keeps_composition_until_next_date(self):
+        first = Index("TEST", "2024-01-01", [IndexItem("SBER", "", 60, 10, "", 300), IndexItem("GAZP", "", 40, 10, "", 130)])
+        second = Index("TEST", "2024-01-03", [IndexItem("SBER", "", 100, 10, "", 310)])
+
+        data = BacktestData.from_indices([first, second], prices={"2024-01-02": {"SBER": 305, "GAZP": 128}})
+
+        assert data.tickers == ["SBER", "GAZP"]
+        assert data.weights.tolist() == [[60, 40], [60, 40], [100, 0]]
+        assert data.prices[1].tolist() == [305, 128]
+        assert np.isnan(data.prices[2, 1])
@@ -0,0 +1,354 @@
+import pytest
+
+import os
+import json
+
+from src.core.balancer import Balancer
+from src.models.index import Index, IndexItem
+from src.models.positions import Positions, PositionsCash, PositionsInstrument, Cash
+
+
+def load_test_data(filename):
+    with open(os.path.join(os.path.dirname(__file__), "test_data", filename), "r") as f:
+        return json.load(f)
+
+
+TEST_DATA = load_test_data("balancer_portfolios.json")
+BALANCER_PARAMS = dict(delta=0.05, commission=0.003, min_lots_to_keep=1, buy_only=False, exact_threshold=0)
+
+
+def make_index(data: dict) -> Index:
+    return Index(name=data["name"], date=data["date"], items=[IndexItem(**item) for item in data["items"]])
+
+
+def make_positions(data: dict) -> Positions:
+    shares = [
+        PositionsInstrument(**{**share, "last_price": Cash(**share["last_price"])})
+        for share in data["shares"]
+    ]
+    return Positions(cash=PositionsCash(**data["cash"]), shares=shares)
+
+
+def make_small_index(weights: list, prices: list) -> Index:
+    items = [IndexItem(ticker=ticker, shortnames=ticker, weight=weight, lot_size=1, isin=ticker, last_price=price)
+             for ticker, weight, price in zip("ABC", weights, prices)]
+    return Index(name="TEST", date="2025-06-17", items=items)
+
+
+def make_small_positions(cash: float, balances: list, prices: list) -> Positions:
+    shares = [{"uid": f"uid-{ticker}", "figi": f"figi-{ticker}", "balance": balance, "lot_size": 1,
+               "last_price": {"units": price, "nano": 0}, "ticker": ticker, "type": "share"}
+              for ticker, balance, price in zip("ABC", balances, prices) if balance]
+    return make_positions({"cash": {"currency": "rub", "units": cash, "nano": 0}, "shares": shares})
+
+
+def tracking_error(positions: Positions, index: Index, actions: list) -> float:
+    """
+    Сумма квадратов отклонений весов от целевых после плана. Веса - от стоимости портфеля до плана
+    без бумаг, исключённых из индекса, как в балансировщике
+    """
+    lot_sizes = {item.ticker: item.lot_size for item in index.items}
+    balances = {s.ticker: s.balance for s in positions.shares}
+    for a in actions:
+        change = a["quantity"] * lot_sizes.get(a["ticker"], 1) * (1 if a["type"] == "BUY" else -1)
+        balances[a["ticker"]] = balances.get(a["ticker"], 0) + change
+    total = sum(s.balance * s.last_price.to_float() for s in positions.shares
+                if s.ticker in lot_sizes) + positions.cash.to_float()
+    return sum((balances.get(item.ticker, 0) * item.last_price / total - item.weight / 100) ** 2
+               for item in index.items)
+
+
+def lots_cost(actions: list, index: Index, commission: float) -> float:
+    prices = {item.ticker: item.last_price * item.lot_size for item in index.items}
+    return sum(
+        prices[a["ticker"]] * a["quantity"] * (1 + commission) * (1 if a["type"] == "BUY" else -1)
+        for a in actions if a["ticker"] in prices
+    )
+
+
+@pytest.mark.parametrize("case", TEST_DATA["cases"], ids=[c["name"] for c in TEST_DATA["cases"]])
+class TestBalancerEngines:
+
+    def test_iterative_matches_recorded_plan(self, case):
+        balancer = Balancer(make_positions(case["positions"]), make_index(TEST_DATA["index"]),
+                            engine="iterative", **BALANCER_PARAMS)
+
+        actions, free_cash = balancer.calculate_actions()
+
+        assert actions == case["expected"]["actions"]
+        assert free_cash == pytest.approx(case["expected"]["free_cash"])
+
+    def test_heap_matches_iterative(self, case):
+        balancer = Balancer(make_positions(case["positions"]), make_index(TEST_DATA["index"]),
+                            engine="heap", **BALANCER_PARAMS)
+
+        actions, free_cash = balancer.calculate_actions()
+
+        assert actions == case["expected"]["actions"]
+        assert free_cash == pytest.approx(case["expected"]["free_cash"])
+
+    def test_closed_form_returns_same_contract(self, case):
+        index = make_index(TEST_DATA["index"])
+        positions = make_positions(case["positions"])
+        balancer = Balancer(positions, index, engine="closed_form", **BALANCER_PARAMS)
+
+        actions, free_cash = balancer.calculate_actions()
+
+        assert isinstance(free_cash, float)
+        assert free_cash >= 0
+        for action in actions:
+            assert set(action.keys()) == {"type", "ticker", "quantity"}
+            assert action["type"] in ("BUY", "SELL")
+            assert isinstance(action["quantity"], int) and action["quantity"] > 0
+
+        # Без продаж остаток средств совпадает со стоимостью покупок
+        if all(a["type"] == "BUY" for a in actions):
+            spent = lots_cost(actions, index, BALANCER_PARAMS["commission"])
+            assert positions.cash.to_float() - spent == pytest.approx(free_cash)
+
+    def test_closed_form_sells_excluded_positions(self, case):
+        index = make_index(TEST_DATA["index"])
+        index_tickers = {item.ticker for item in index.items}
+        excluded = {s["ticker"] for s in case["positions"]["shares"]} - index_tickers
+        balancer = Balancer(make_positions(case["positions"]), index, engine="closed_form", **BALANCER_PARAMS)
+
+        actions, _ = balancer.calculate_actions()
+
+        sold = {a["ticker"] for a in actions if a["type"] == "SELL"}
+        assert excluded <= sold
+        assert not any(a["type"] == "BUY" and a["ticker"] not in index_tickers for a in actions)
+
+
+class TestIterativeEngine:
+
+    @pytest.mark.parametrize("held", [0, 5])
+    def test_heap_handles_zero_weight_items(self, held):
+        index = make_small_index([0, 60, 40], [50, 100, 20])
+        positions = make_small_positions(10_000, [held, 10, 40], [50, 100, 20])
+
+        heap, heap_cash = Balancer(positions, index, engine="heap", **BALANCER_PARAMS).calculate_actions()
+        iterative, iterative_cash = Balancer(positions, index, engine="iterative",
+                                             **BALANCER_PARAMS).calculate_actions()
+
+        assert heap == iterative
+        assert heap_cash == pytest.approx(iterative_cash)
+        assert [a for a in heap if a["ticker"] == "A"] == ([{"type": "SELL", "ticker": "A", "quantity": held}]
+                                                          if held else [])
+
+    @pytest.mark.parametrize("engine", ["iterative", "heap"])
+    def test_passes_are_bounded(self, engine):
+        positions = Positions(cash=PositionsCash(units=100_000_000, nano=0, currency="rub"))
+        balancer = Balancer(positions, make_index(TEST_DATA["index"]), engine=engine,
+                            max_iterations=50, **BALANCER_PARAMS)
+
+        actions, free_cash = balancer.calculate_actions()
+
+        assert sum(a["quantity"] for a in actions) == 50
+        assert free_cash > 0
+
+
+class TestBuyOnlyFastPath:
+
+    @pytest.mark.parametrize("case", [c for c in TEST_DATA["cases"] if c["name"] in ("empty_portfolio",
+                                                                                      "deposit_into_balanced")])
+    def test_top_up_buys_without_selling(self, case):
+        index = make_index(TEST_DATA["index"])
+        positions = make_positions(case["positions"])
+        params = {**BALANCER_PARAMS, "buy_only": True}
+
+        actions, free_cash = Balancer(positions, index, **params).calculate_actions()
+
+        assert actions and all(a["type"] == "BUY" for a in actions)
+        assert len({a["ticker"] for a in actions}) == len(actions)
+        assert len(actions) <= len(case["expected"]["actions"])
+        assert positions.cash.to_float() - lots_cost(actions, index, params["commission"]) == pytest.approx(free_cash)
+        assert free_cash >= 0
+
+    @pytest.mark.parametrize("case", [c for c in TEST_DATA["cases"] if c["name"] in ("overweight_position",
+                                                                                      "excluded_position")])
+    def test_falls_back_to_engine_when_sells_needed(self, case):
+        balancer = Balancer(make_positions(case["positions"]), make_index(TEST_DATA["index"]),
+                            **{**BALANCER_PARAMS, "buy_only": True})
+
+        actions, free_cash = balancer.calculate_actions()
+
+        assert actions == case["expected"]["actions"]
+        assert free_cash == pytest.approx(case["expected"]["free_cash"])
+
+    def test_batch_uses_fast_path(self):
+        index = make_index(TEST_DATA["index"])
+        positions_list = [make_positions(case["positions"]) for case in TEST_DATA["cases"]]
+        params = {**BALANCER_PARAMS, "buy_only": True}
+
+        results = Balancer.calculate_actions_batch(positions_list, index, engine="closed_form", **params)
+
+        for positions, (actions, free_cash) in zip(positions_list, results):
+            expected_actions, expected_cash = Balancer(positions, index, engine="closed_form",
+                                                       **params).calculate_actions()
+            assert actions == expected_actions
+            assert free_cash == pytest.approx(expected_cash)
+
+
+class TestExactAllocation:
+
+    @pytest.mark.parametrize("case", TEST_DATA["cases"], ids=[c["name"] for c in TEST_DATA["cases"]])
+    def test_small_portfolio_is_allocated_exactly(self, case):
+        index = make_index(TEST_DATA["index"])
+        positions = make_positions(case["positions"])
+        params = {**BALANCER_PARAMS, "exact_threshold": 10_000_000}
+
+        actions, free_cash = Balancer(positions, index, **params).calculate_actions()
+
+        assert free_cash >= 0
+        assert len({a["ticker"] for a in actions}) == len(actions)
+        # Точный расчёт не хуже пошагового по сумме квадратов отклонений от целевых весов
+        # с точностью до одной корзины остатка средств
+        assert tracking_error(positions, index, actions) <= tracking_error(positions, index,
+                                                                            case["expected"]["actions"]) * 1.01
+
+    def test_lots_are_optimal(self):
+        index = make_small_index([50, 30, 20], [1000, 1000, 1000])
+        positions = make_small_positions(cash=10_000, balances=[0, 0, 0], prices=[1000, 1000, 1000])
+        params = {**BALANCER_PARAMS, "commission": 0, "exact_threshold": 1_000_000}
+
+        actions, free_cash = Balancer(positions, index, **params).calculate_actions()
+
+        assert actions == [{"type": "BUY", "ticker": "A", "quantity": 5},
+                           {"type": "BUY", "ticker": "B", "quantity": 3},
+                           {"type": "BUY", "ticker": "C", "quantity": 2}]
+        assert free_cash == pytest.approx(0)
+
+    def test_portfolio_inside_band_is_not_traded(self):
+        prices = [7135, 7608, 5940]
+        index = make_small_index([50, 30, 20], prices)
+        # Веса 0.480 / 0.312 / 0.208 - все в пределах delta = 5% от целевых,
+        # без проверки отклонения точный расчёт продал бы лот B и купил лот A
+        positions = make_small_positions(cash=0, balances=[23, 14, 12], prices=prices)
+        params = {**BALANCER_PARAMS, "exact_threshold": 1_000_000}
+
+        actions, _ = Balancer(positions, index, **params).calculate_actions()
+
+        assert actions == []
+
+    def test_falls_back_to_engine_after_time_limit(self):
+        case = TEST_DATA["cases"][0]
+        params = {**BALANCER_PARAMS, "exact_threshold": 10_000_000, "exact_time_limit": -1}
+
+        actions, free_cash = Balancer(make_positions(case["positions"]), make_index(TEST_DATA["index"]),
+                                      **params).calculate_actions()
+
+        assert actions == case["expected"]["actions"]
+        assert free_cash == pytest.approx(case["expected"]["free_cash"])
+
+    def test_large_portfolio_uses_engine(self):
+        case = TEST_DATA["cases"][1]
+        params = {**BALANCER_PARAMS, "exact_threshold": 1}
+
+        actions, _ = Balancer(make_positions(case["positions"]), make_index(TEST_DATA["index"]),
+                              **params).calculate_actions()
+
+        assert actions == case["expected"]["actions"]
+
+
+class TestMinOrdersEngine:
+
+    @pytest.mark.parametrize("max_orders", [0, 1, 3])
+    @pytest.mark.parametrize("case", TEST_DATA["cases"], ids=[c["name"] for c in TEST_DATA["cases"]])
+    def test_one_order_per_ticker_within_budget(self, case, max_orders):
+        index = make_index(TEST_DATA["index"])
+        balancer = Balancer(make_positions(case["positions"]), index, engine="min_orders",
+                            max_orders=max_orders, **BALANCER_PARAMS)
+
+        actions, free_cash = balancer.calculate_actions()
+
+        index_tickers = {item.ticker for item in index.items}
+        assert free_cash >= 0
+        assert len({a["ticker"] for a in actions}) == len(actions)
+        if max_orders:
+            assert len([a for a in actions if a["ticker"] in index_tickers]) <= max_orders
+
+    def test_skips_tickers_inside_band(self):
+        index = make_index(TEST_DATA["index"])
+        case = next(c for c in TEST_DATA["cases"] if c["name"] == "overweight_position")
+        positions = make_positions(case["positions"])
+        total = sum(s.balance * s.last_price.to_float() for s in positions.shares) + positions.cash.to_float()
+        weights = {s.ticker: s.balance * s.last_price.to_float() / total for s in positions.shares}
+        params = {**BALANCER_PARAMS, "delta": 0.5}
+
+        actions, _ = Balancer(positions, index, engine="min_orders", **params).calculate_actions()
+
+        for item in index.items:
+            weight, target = weights.get(item.ticker, 0), item.weight / 100
+            if target <= weight * (1 + params["delta"]) and weight <= target * (1 + params["delta"]):
+                assert item.ticker not in {a["ticker"] for a in actions}
+
+    def test_excluded_positions_go_first(self):
+        index = make_index(TEST_DATA["index"])
+        case = next(c for c in TEST_DATA["cases"] if c["name"] == "excluded_position")
+
+        actions, _ = Balancer(make_positions(case["positions"]), index, engine="min_orders",
+                              max_orders=1, **BALANCER_PARAMS).calculate_actions()
+
+        assert actions[0] == {"type": "SELL", "ticker": "MOEX", "quantity": 100}
+        assert len(actions) <= 2
+
+    def test_excluded_positions_are_sold_beyond_budget(self):
+        index = make_small_index([100], [100])
+        positions = make_small_positions(0, [1, 3, 4], [100, 50, 20])
+
+        actions, _ = Balancer(positions, index, engine="min_orders", max_orders=1,
+                              **BALANCER_PARAMS).calculate_actions()
+
+        assert {"type": "SELL", "ticker": "B", "quantity": 3} in actions
+        assert {"type": "SELL", "ticker": "C", "quantity": 4} in actions
+
+
+class TestClosedFormEngine:
+
+    @pytest.mark.parametrize("cash", [1_000, 100_000, 100_000_000])
+    def test_spends_cash_down_to_single_lot(self, cash):
+        index = make_index(TEST_DATA["index"])
+        positions = Positions(cash=PositionsCash(units=cash, nano=0, currency="rub"))
+        balancer = Balancer(positions, index, engine="closed_form", **BALANCER_PARAMS)
+
+        actions, free_cash = balancer.calculate_actions()
+
+        max_lot_cost = max(i.last_price * i.lot_size for i in index.items) * (1 + BALANCER_PARAMS["commission"])
+        assert 0 <= free_cash < max_lot_cost
+        assert len(actions) <= len(index.items)
+
+    def test_batch_matches_single_account(self):
+        index = make_index(TEST_DATA["index"])
+        positions_list = [make_positions(case["positions"]) for case in TEST_DATA["cases"]]
+
+        results = Balancer.calculate_actions_batch(positions_list, index, engine="closed_form", **BALANCER_PARAMS)
+
+        assert len(results) == len(positions_list)
+        for positions, (actions, free_cash) in zip(positions_list, results):
+            expected_actions, expected_cash = Balancer(positions, index, engine="closed_form",
+                                                       **BALANCER_PARAMS).calculate_actions()
+            assert actions == expected_actions
+            assert free_cash == pytest.approx(expected_cash)
+
+    def test_batch_with_other_engine_calculates_each_account(self):
+        index = make_index(TEST_DATA["index"])
+        positions_list = [make_positions(case["positions"]) for case in TEST_DATA["cases"]]
+
+        results = Balancer.calculate_actions_batch(positions_list, index, engine="heap", **BALANCER_PARAMS)
+
+        assert [actions for actions, _ in results] == [case["expected"]["actions"] for case in TEST_DATA["cases"]]
+
+    def test_batch_forwards_balancer_settings(self):
+        index = make_index(TEST_DATA["index"])
+        positions_list = [make_positions(case["positions"]) for case in TEST_DATA["cases"]]
+        params = {**BALANCER_PARAMS, "engine": "min_orders", "max_orders": 1}
+
+        results = Balancer.calculate_actions_batch(positions_list, index, **params)
+
+        assert results == [Balancer(positions, index, **params).calculate_actions() for positions in positions_list]
+
+    def test_unknown_engine_raises(self):
+        positions = Positions(cash=PositionsCash(units=1000, nano=0, currency="rub"))
+
+        with pytest.raises(ValueError):
+            Balancer(positions, make_index(TEST_DATA["index"]), engine="unknown")
@@ -0,0 +1,100 @@
+import time
+import asyncio
+import threading
+
+from src.core.execution import execute_orders, execute_orders_async
+
+from src.models.action import Action
+from src.models.error import Error
+from src.models.share import Share
+
+
+def make_action(action_type: str, ticker: str) -> Action:
+    return Action(type=action_type, quantity=1, share=Share(ticker, ticker, ticker, 1, None, "share"))
+
+
+ACTIONS = [make_action("BUY", "SBER"), make_action("SELL", "GAZP"), make_action("BUY", "LKOH"),
+           make_action("SELL", "MGNT")]
+
+
+class TestExecuteOrders:
+
+    def test_sells_are_accepted_before_buys_start(self):
+        events = []
+        lock = threading.Lock()
+
+        def create_order(action):
+            with lock:
+                events.append(("start", action.type))
+            time.sleep(0.02)
+            with lock:
+                events.append(("done", action.type))
+
+        success, errors = execute_orders(create_order, ACTIONS, max_concurrency=4)
+
+        first_buy = events.index(("start", "BUY"))
+        assert all(event == ("done", "SELL") for event in events[first_buy - 2:first_buy])
+        assert [a.share.ticker for a in success] == ["GAZP", "MGNT", "SBER", "LKOH"]
+        assert errors == []
+
+    def test_concurrency_is_bounded(self):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def create_order(action):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        actions = [make_action("BUY", f"T{i}") for i in range(10)]
+        success, _ = execute_orders(create_order, actions, max_concurrency=3)
+
+        assert len(success) == 10
+        assert 1 < peak[0] <= 3
+
+    def test_errors_are_collected(self):
+        def create_order(action):
+            if action.share.ticker == "LKOH":
+                raise Error(source="Broker", source_data=None, data=action, description="Not enough money")
+
+        success, errors = execute_orders(create_order, ACTIONS)
+
+        assert len(success) == 3
+        assert [e.data.share.ticker for e in errors] == ["LKOH"]
+
+    def test_unexpected_exceptions_do_not_stop_buys(self):
+        def create_order(action):
+            if action.share.ticker == "GAZP":
+                raise TimeoutError("deadline exceeded")
+
+        success, errors = execute_orders(create_order, ACTIONS)
+
+        assert [a.share.ticker for a in success] == ["MGNT", "SBER", "LKOH"]
+        assert [(e.data.share.ticker, e.description) for e in errors] == [("GAZP", "deadline exceeded")]
+
+    def test_async_unexpected_exceptions_do_not_stop_buys(self):
+        async def create_order(action):
+            if action.share.ticker == "GAZP":
+                raise ValueError("bad price")
+
+        success, errors = asyncio.run(execute_orders_async(create_order, ACTIONS))
+
+        assert [a.share.ticker for a in success] == ["MGNT", "SBER", "LKOH"]
+        assert [(e.data.share.ticker, e.description) for e in errors] == [("GAZP", "bad price")]
+
+    def test_async_sells_before_buys(self):
+        events = []
+
+        async def create_order(action):
+            events.append(("start", action.type))
+            await asyncio.sleep(0.01)
+            events.append(("done", action.type))
+
+        success, errors = asyncio.run(execute_orders_async(create_order, ACTIONS, max_concurrency=4))
+
+        assert events[:4] == [("start", "SELL")] * 2 + [("done", "SELL")] * 2
+        assert [a.type for a in success] == ["SELL", "SELL", "BUY", "BUY"]
+        assert errors == []
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.config import settings
+from src.core.balancer import Balancer
+from src.core.portfolio_manager import PortfolioManager
+from src.core.scheduler import Scheduler
+from src.models.config import UserConfig, UserIndexBindingsConfig, UserScheduleConfig
+
+from test_balancer import TEST_DATA, make_index, make_positions
+
+
+def make_user(telegram_id: int) -> UserConfig:
+    return UserConfig(
+        telegram_id=telegram_id,
+        index_bindings=UserIndexBindingsConfig(broker_account_id=f"acc_{telegram_id}",
+                                               broker_account_name=f"Account {telegram_id}", index_name="IMOEX"),
+        schedule=UserScheduleConfig(rebalance_frequency="DAILY"),
+    )
+
+
+class TestSchedulerRebalance:
+
+    @staticmethod
+    def run_rebalance(users, portfolios, index, engine):
+        """Балансировка по расписанию с подменёнными менеджерами, возвращает менеджеров и мок пакетного расчёта"""
+        managers = []
+
+        def make_manager(account_id):
+            manager = MagicMock()
+            manager.get_portfolio_async = AsyncMock(return_value=portfolios[len(managers)])
+            manager.get_index_list_async = AsyncMock(return_value=index)
+            manager._resolve_actions_async = AsyncMock(side_effect=lambda actions: actions)
+            manager.execute_actions_async = AsyncMock(return_value=([], []))
+
+            async def get_action_for_rebalance_async(portfolio, _index):
+                manager.actions, free_cash = Balancer(portfolio, _index, engine=engine).calculate_actions()
+                return manager.actions, free_cash
+            manager.get_action_for_rebalance_async = AsyncMock(side_effect=get_action_for_rebalance_async)
+
+            managers.append(manager)
+            return manager
+
+        manager_cls = MagicMock(side_effect=make_manager)
+        manager_cls.get_action_for_rebalance_batch_async = PortfolioManager.get_action_for_rebalance_batch_async
+        calculate_actions_batch = Balancer.calculate_actions_batch
+
+        with patch("src.core.scheduler.PortfolioManager", manager_cls), \
+                patch("src.core.scheduler.ConfigLoader"), \
+                patch("src.core.scheduler._save_result"), \
+                patch("src.core.scheduler.asyncio.sleep", new=AsyncMock()), \
+                patch.object(settings.balancer, "engine", engine), \
+                patch.object(Balancer, "calculate_actions_batch",
+                             side_effect=lambda p, i: calculate_actions_batch(p, i, engine=engine)) as batch:
+            asyncio.run(Scheduler()._rebalance("IMOEX", users))
+
+        return managers, batch
+
+    @pytest.mark.parametrize("engine", ["closed_form", "iterative"])
+    def test_accounts_of_one_index_share_index_and_match_single_plans(self, engine):
+        """Индекс запрашивается один раз, одним пакетом счета считаются только движком, который это умеет,
+        а планы совпадают с расчётом по одному счету"""
+        index = make_index(TEST_DATA["index"])
+        portfolios = [make_positions(case["positions"]) for case in TEST_DATA["cases"]]
+        users = [make_user(i) for i in range(len(portfolios))]
+
+        managers, batch = self.run_rebalance(users, portfolios, index, engine)
+
+        assert batch.call_count == (1 if engine in Balancer.BATCH_ENGINES else 0)
+        assert sum(m.get_index_list_async.await_count for m in managers) == 1
+        for manager, portfolio in zip(managers, portfolios):
+            if portfolio.cash.to_float() <= settings.balancer.max_cash:
+                continue
+            assert manager.actions == Balancer(portfolio, index, engine=engine).calculate_actions()[0]
@@ -0,0 +1,35 @@
+import pytest
+
+from src.core.balancer import Balancer
+from src.core.sweep import run_sweep, plan_metrics
+
+from test_balancer import TEST_DATA, make_index, make_positions
+
+
+class TestSweep:
+
+    def test_plan_metrics_without_actions(self):
+        positions = make_positions(TEST_DATA["cases"][0]["positions"])
+
+        metrics = plan_metrics(positions, make_index(TEST_DATA["index"]), [], positions.cash.to_float())
+
+        assert metrics["turnover"] == 0
+        assert metrics["orders"] == 0
+        assert metrics["residual_cash"] == positions.cash.to_float()
+        assert metrics["tracking_error"] > 0
+
+    def test_run_sweep_reports_every_combination(self):
+        positions = make_positions(TEST_DATA["cases"][1]["positions"])
+        index = make_index(TEST_DATA["index"])
+
+        results = run_sweep(positions, index, deltas=[0.01, 0.05], commissions=[0.003],
+                            min_lots_to_keep=[0, 1], engine="closed_form", max_workers=2)
+
+        assert {(r["delta"], r["min_lots_to_keep"]) for r in results} == {(0.01, 0), (0.01, 1), (0.05, 0), (0.05, 1)}
+        for result in results:
+            _, free_cash = Balancer(positions, index, delta=result["delta"], commission=result["commission"],
+                                    min_lots_to_keep=result["min_lots_to_keep"],
+                                    engine="closed_form").calculate_actions()
+            assert result["residual_cash"] == pytest.approx(free_cash)
+            assert result["orders"] > 0
+            assert result["turnover"] > 0
@@ -0,0 +1,54 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+class TestAsyncTBroker:
+
+    def test_get_all_accounts(self, tmp_path):
+        from src.models.account import Account
+        from src.services.async_broker import AsyncTBroker
+        from src.services.catalog import InstrumentCatalog
+
+        mock_client = MagicMock()
+        services = mock_client.__aenter__.return_value
+        services.users.get_accounts = AsyncMock(return_value=MagicMock(accounts=[MagicMock(id="acc_1")]))
+        catalog = InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600)
+
+        with patch("src.services.async_broker.AsyncClient", return_value=mock_client) as client:
+            broker = AsyncTBroker(token="test-token", sandbox=True, catalog=catalog)
+            accounts = asyncio.run(broker.get_all_accounts())
+
+        assert [account.id for account in accounts] == ["acc_1"]
+        assert isinstance(accounts[0], Account)
+        client.assert_called_once()
+
+
+class TestAsyncTAccount:
+
+    def test_get_positions_with_securities_and_money(self):
+        from src.services.async_broker import AsyncTAccount
+        from src.models.instrument import InstrumentBase
+        from src.models.positions import Positions, Cash, PositionsCash
+
+        broker = MagicMock()
+        broker.cached_positions.return_value = None
+        client = MagicMock()
+
+        position_security = MagicMock(instrument_uid="uid123", instrument_type="share", balance=5)
+        instrument = InstrumentBase(uid="uid123", figi="figi123", ticker="TST", lot_size=10, isin="ISIN123",
+                                    type="share")
+        last_price = MagicMock(instrument_uid="uid123", price=Cash(units=100, nano=0))
+        money = [PositionsCash(currency="rub", units=1000, nano=0)]
+
+        client.operations.get_positions = AsyncMock(return_value=MagicMock(securities=[position_security],
+                                                                           money=money))
+        client.market_data.get_last_prices = AsyncMock(return_value=MagicMock(last_prices=[last_price]))
+        broker.get_client.return_value.__aenter__.return_value = client
+        broker.find_instrument = AsyncMock(return_value=instrument)
+        broker.cached_last_prices.return_value = ({}, ["uid123"])
+
+        positions = asyncio.run(AsyncTAccount(account_id="acc_1", broker=broker).get_positions())
+
+        assert isinstance(positions, Positions)
+        assert positions.cash.currency == "rub"
+        assert [share.ticker for share in positions.shares] == ["TST"]
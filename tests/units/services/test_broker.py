@@ -24,21 +24,24 @@ class TestTBroker:
     #     # Подменяем ДО любого импорта TBroker
     #     monkeypatch.setattr("src.services.utils.cache_data", no_cache_decorator)
 
-    def test_init_with_default_settings(self):
+    def test_init_with_default_settings(self, tmp_path):
         from src.config import settings
         from t_tech.invest.constants import INVEST_GRPC_API_SANDBOX
         from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
 
-        broker = TBroker()
+        # Пустой справочник, чтобы не зависеть от справочника, оставшегося от прошлых запусков
+        broker = TBroker(catalog=InstrumentCatalog(str(tmp_path / "instruments.sqlite")))
 
         assert broker.token == settings.broker.token
         assert broker.target == (INVEST_GRPC_API_SANDBOX if settings.broker.sandbox_mode else None)
         assert broker._shares_by_uid == {}
         assert broker._shares_by_ticker == {}
 
-    def test_get_all_accounts(self):
+    def test_get_all_accounts(self, tmp_path):
         from src.models.account import Account
         from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
 
         mock_client = MagicMock()
         mock_client.__enter__.return_value.users.get_accounts.return_value.accounts = [
@@ -47,7 +50,8 @@ class TestTBroker:
         ]
 
         with patch("src.services.broker.Client", return_value=mock_client):
-            mock_broker = TBroker(token="test-token", sandbox=True)
+            mock_broker = TBroker(token="test-token", sandbox=True,
+                                  catalog=InstrumentCatalog(str(tmp_path / "instruments.sqlite")))
             accounts = mock_broker.get_all_accounts()
             assert isinstance(accounts, list)
             assert len(accounts) == 2
@@ -60,9 +64,10 @@ class TestTBroker:
     @pytest.mark.parametrize("mock_data",
                              load_test_data("broker_find_share_response_success.json")
                              )
-    def test_find_share_triggers_cache(self, mock_data, monkeypatch):
+    def test_find_share_triggers_cache(self, mock_data, monkeypatch, tmp_path):
 
         from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
         from src.models.share import Share
 
         response = mock_data.get("response")
@@ -87,7 +92,8 @@ class TestTBroker:
             return mock_context_manager
 
         with patch("src.services.broker.Client", side_effect=make_mock_context_manager):
-            mock_broker = TBroker(token="test-token", sandbox=True)
+            mock_broker = TBroker(token="test-token", sandbox=True,
+                                  catalog=InstrumentCatalog(str(tmp_path / "instruments.sqlite")))
 
             share = mock_broker.find_share(value=request.get("value"), field=request.get("field"))
 
@@ -101,6 +107,7 @@ class TestTAccount:
         from src.models.positions import Positions, Cash, PositionsCash
 
         broker = MagicMock()
+        broker.cached_positions.return_value = None
         client = MagicMock()
 
         # Мокаем данные
@@ -116,6 +123,7 @@ class TestTAccount:
 
         broker.get_client.return_value.__enter__.return_value = client
         broker.find_share.return_value = share
+        broker.cached_last_prices.return_value = ({}, ["uid123"])
 
         account = TAccount(account_id="acc_1", broker=broker)
         positions = account.get_positions()
@@ -130,6 +138,7 @@ class TestTAccount:
         from src.models.positions import Positions, PositionsCash
 
         broker = MagicMock()
+        broker.cached_positions.return_value = None
         client = MagicMock()
 
         money = [PositionsCash(currency="usd", units=200, nano=0)]
@@ -149,6 +158,7 @@ class TestTAccount:
         from src.models.positions import Positions
 
         broker = MagicMock()
+        broker.cached_positions.return_value = None
         client = MagicMock()
 
         client.operations.get_positions.return_value = MagicMock(securities=[], money=[])
@@ -167,6 +177,7 @@ class TestTAccount:
         from t_tech.invest import OrderDirection
 
         broker = MagicMock()
+        broker.cached_positions.return_value = None
         client = MagicMock()
 
         broker.get_client.return_value.__enter__.return_value = client
@@ -188,6 +199,7 @@ class TestTAccount:
         from t_tech.invest import RequestError
 
         broker = MagicMock()
+        broker.cached_positions.return_value = None
         client = MagicMock()
 
         error = RequestError("Error", metadata=MagicMock(message="Order failed"), details="Order failed")
@@ -200,4 +212,363 @@ class TestTAccount:
         with pytest.raises(Exception) as exc:
             account.create_order(action)
 
-        assert "Order failed" in str(exc.value)
\ No newline at end of file
+        assert "Order failed" in str(exc.value)
+
+class TestTBrokerCatalog:
+
+    def test_lookup_uses_catalog_without_network(self, tmp_path):
+        from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
+        from src.models.instrument import InstrumentBase
+
+        catalog = InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600)
+        catalog.save([InstrumentBase("uid123", "figi123", "TST", 10, "ISIN123", "share")])
+
+        with patch("src.services.broker.Client") as client:
+            broker = TBroker(token="test-token", sandbox=True, catalog=catalog)
+
+            assert broker.find_instrument("uid123").ticker == "TST"
+            assert broker.find_share("TST", "ticker").uid == "uid123"
+            client.assert_not_called()
+
+    def test_get_all_instruments_saves_catalog(self, tmp_path):
+        from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
+
+        bond = MagicMock(uid="uid-bond", figi="figi-bond", ticker="BOND", lot=1, isin="ISIN-BOND", currency="rub")
+        mock_client = MagicMock()
+        mock_client.__enter__.return_value.instruments.bonds.return_value.instruments = [bond]
+        mock_client.__enter__.return_value.instruments.shares.return_value.instruments = []
+        catalog = InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600)
+
+        with patch("src.services.broker.Client", return_value=mock_client):
+            TBroker(token="test-token", sandbox=True, catalog=catalog).get_all_instruments()
+
+        assert [i.uid for i in catalog.load()] == ["uid-bond"]
+
+    def test_missing_instrument_is_reloaded_once(self, tmp_path):
+        from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
+
+        catalog = InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600)
+        catalog.save([])  # Свежий справочник, чтобы не запускалось фоновое обновление
+        broker = TBroker(token="test-token", sandbox=True, catalog=catalog)
+
+        with patch.object(TBroker, "get_all_instruments", return_value=[]) as reload:
+            assert broker.find_instrument("BBG007N0Z367") is None
+            assert broker.find_instrument("BBG007N0Z367") is None
+
+        reload.assert_called_once()
+
+    def test_concurrent_misses_share_one_reload(self, tmp_path):
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
+
+        catalog = InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600)
+        catalog.save([])  # Свежий справочник, чтобы не запускалось фоновое обновление
+        broker = TBroker(token="test-token", sandbox=True, catalog=catalog)
+
+        def slow_reload():
+            time.sleep(0.1)
+            return []
+
+        with patch.object(TBroker, "get_all_instruments", side_effect=slow_reload) as reload:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(lambda uid: broker.find_instrument(uid), [f"uid-{i}" for i in range(8)]))
+
+        assert results == [None] * 8
+        reload.assert_called_once()
+
+    def test_miss_waits_for_background_refresh(self, tmp_path):
+        import time
+        from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
+        from src.models.instrument import InstrumentBase
+
+        # Пустой справочник устарел: поиск запускает фоновое обновление
+        broker = TBroker(token="test-token", sandbox=True,
+                         catalog=InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600))
+
+        def slow_reload():
+            time.sleep(0.1)
+            broker._save_catalog([InstrumentBase("uid-x", "figi-x", "X", 1, "ISIN-X", "bond")])
+            return []
+
+        with patch.object(TBroker, "get_all_instruments", side_effect=slow_reload) as reload:
+            assert broker.find_instrument("uid-x").ticker == "X"
+
+        reload.assert_called_once()
+
+    def test_async_miss_waits_for_sync_refresh(self, tmp_path):
+        import time
+        import asyncio
+        from src.services.broker import TBroker, BrokerResources
+        from src.services.async_broker import AsyncTBroker
+        from src.services.catalog import InstrumentCatalog
+        from src.models.instrument import InstrumentBase
+
+        resources = BrokerResources("test-token", True,
+                                    InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600))
+        broker = TBroker(token="test-token", sandbox=True, resources=resources)
+        async_broker = AsyncTBroker(token="test-token", sandbox=True, resources=resources)
+
+        def slow_reload():
+            time.sleep(0.1)
+            broker._save_catalog([InstrumentBase("uid-x", "figi-x", "X", 1, "ISIN-X", "bond")])
+            return []
+
+        with patch.object(TBroker, "get_all_instruments", side_effect=slow_reload) as reload, \
+                patch.object(AsyncTBroker, "get_all_instruments") as async_reload:
+            broker.refresh_catalog_in_background()
+            assert asyncio.run(async_broker.find_instrument("uid-x")).ticker == "X"
+
+        reload.assert_called_once()
+        async_reload.assert_not_called()
+
+    def test_find_shares_reloads_once_for_all_misses(self, tmp_path):
+        from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
+        from src.models.instrument import InstrumentBase
+        from src.models.share import Share
+
+        catalog = InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600)
+        catalog.save([InstrumentBase("uid-sber", "figi-sber", "SBER", 10, "ISIN-SBER", "share")])
+        broker = TBroker(token="test-token", sandbox=True, catalog=catalog)
+
+        def reload():
+            broker._index_shares([Share("uid-gazp", "figi-gazp", "GAZP", 10, "ISIN-GAZP", "share")])
+            return []
+
+        with patch.object(TBroker, "_load_shares", side_effect=reload) as load:
+            shares = broker.find_shares(["SBER", "GAZP", "DELISTED", "GONE"])
+            assert broker.find_shares(["DELISTED"]) == {"DELISTED": None}
+
+        assert shares["SBER"].uid == "uid-sber"
+        assert shares["GAZP"].uid == "uid-gazp"
+        assert shares["DELISTED"] is None and shares["GONE"] is None
+        load.assert_called_once()
+
+
+class TestPositionsCache:
+
+    def test_positions_are_cached_until_order(self, tmp_path):
+        from src.services.broker import TBroker, TAccount
+        from src.services.catalog import InstrumentCatalog
+        from src.models.action import Action
+        from src.models.share import Share
+        from src.models.positions import PositionsCash
+
+        mock_client = MagicMock()
+        api = mock_client.__enter__.return_value
+        api.operations.get_positions.return_value = MagicMock(
+            securities=[], money=[PositionsCash(currency="rub", units=1000, nano=0)])
+        catalog = InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600)
+
+        with patch("src.services.broker.Client", return_value=mock_client):
+            account = TAccount("acc_1", TBroker(token="test-token", sandbox=True, catalog=catalog))
+            account.get_positions()
+            account.get_positions()
+            assert api.operations.get_positions.call_count == 1
+
+            account.create_order(Action(type="BUY", quantity=1, share=Share("uid", "figi", "TST", 1, None, "share")))
+            account.get_positions()
+            assert api.operations.get_positions.call_count == 2
+
+    def test_positions_expire_after_ttl(self, tmp_path):
+        from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
+        from src.models.positions import Positions
+
+        broker = TBroker(token="test-token", sandbox=True,
+                         catalog=InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=3600))
+        broker.positions_ttl = 30
+        positions = Positions(cash=None, shares=[])
+
+        with patch("src.services.broker.time.monotonic", return_value=100):
+            broker.remember_positions("acc_1", positions)
+        with patch("src.services.broker.time.monotonic", return_value=120):
+            assert broker.cached_positions("acc_1") is positions
+        with patch("src.services.broker.time.monotonic", return_value=131):
+            assert broker.cached_positions("acc_1") is None
+
+
+class TestSharedBroker:
+
+    @pytest.fixture(autouse=True)
+    def isolated_registry(self, tmp_path):
+        """Пустые реестры общих брокеров и справочник во временном каталоге"""
+        from src.services.broker import TBroker, BrokerResources
+        from src.services.async_broker import AsyncTBroker
+        from src.services.catalog import InstrumentCatalog
+
+        def make_catalog():
+            return InstrumentCatalog(str(tmp_path / "instruments.sqlite"))
+
+        with patch.object(TBroker, "_shared", {}), patch.object(AsyncTBroker, "_shared", {}), \
+                patch.object(BrokerResources, "_shared", {}), \
+                patch("src.services.broker.InstrumentCatalog", side_effect=make_catalog):
+            yield
+
+    def test_shared_broker_is_reused_per_token_and_mode(self):
+        from src.services.broker import TBroker
+
+        broker = TBroker.shared("token-a", True)
+
+        assert TBroker.shared("token-a", True) is broker
+        assert TBroker.shared("token-a", False) is not broker
+        assert TBroker.shared("token-b", True) is not broker
+
+    def test_portfolio_managers_share_one_broker(self):
+        from src.core.portfolio_manager import PortfolioManager
+
+        assert PortfolioManager().broker is PortfolioManager("acc_1").broker
+
+    def test_sync_and_async_brokers_share_token_resources(self):
+        from src.services.broker import TBroker
+        from src.services.async_broker import AsyncTBroker
+        from src.models.share import Share
+
+        broker, async_broker = TBroker.shared("token-a", True), AsyncTBroker.shared("token-a", True)
+        broker._index_shares([Share("uid-sber", "figi-sber", "SBER", 10, "ISIN-SBER", "share")])
+
+        assert async_broker._lookup("share", "SBER", "ticker").uid == "uid-sber"
+        assert async_broker.prices is broker.prices
+        assert async_broker.price_stream is broker.price_stream
+        assert AsyncTBroker.shared("token-b", True).prices is not broker.prices
+
+    def test_sync_and_async_brokers_share_order_rate_limit(self):
+        from src.services.broker import TBroker
+        from src.services.async_broker import AsyncTBroker
+
+        broker, async_broker = TBroker.shared("token-a", True), AsyncTBroker.shared("token-a", True)
+
+        assert async_broker.order_rate_limiter is broker.order_rate_limiter
+        assert TBroker.shared("token-b", True).order_rate_limiter is not broker.order_rate_limiter
+
+    def test_order_through_async_broker_invalidates_sync_positions(self):
+        from src.services.broker import TBroker
+        from src.services.async_broker import AsyncTBroker
+        from src.models.positions import Positions
+
+        broker, async_broker = TBroker.shared("token-a", True), AsyncTBroker.shared("token-a", True)
+        broker.remember_positions("acc_1", Positions(cash=None, shares=[]))
+
+        async_broker.invalidate_positions("acc_1")
+
+        assert broker.cached_positions("acc_1") is None
+
+    @staticmethod
+    def make_index():
+        from src.models.index import Index, IndexItem
+
+        return Index(name="IMOEX", date="2026-10-16", items=[
+            IndexItem("SBER", "Сбербанк", 0.6, 10, "ISIN-SBER", 280.0),
+            IndexItem("GAZP", "Газпром", 0.4, 10, "ISIN-GAZP", 120.0),
+        ])
+
+    @staticmethod
+    def make_shares():
+        from src.models.share import Share
+
+        return {
+            "SBER": Share("uid-sber", "figi-sber", "SBER", 10, "ISIN-SBER", "share"),
+            "GAZP": Share("uid-gazp", "figi-gazp", "GAZP", 10, "ISIN-GAZP", "share"),
+        }
+
+    def test_index_prices_come_from_price_stream(self):
+        from src.core.portfolio_manager import PortfolioManager
+        from src.models.positions import Cash
+
+        manager = PortfolioManager()
+        manager.broker.price_stream = MagicMock()
+        manager.broker.prices.update({"uid-sber": Cash(units=300, nano=500000000)})
+        index = self.make_index()
+
+        with patch.object(PortfolioManager, "_load_index_list", return_value=index), \
+                patch.object(manager.broker, "find_shares", return_value=self.make_shares()):
+            priced = manager.get_index_list("IMOEX")
+
+        assert [item.last_price for item in priced.items] == [300.5, 120.0]
+        assert index.items[0].last_price == 280.0
+        manager.broker.price_stream.track.assert_called_once_with(["uid-sber", "uid-gazp"])
+
+    def test_price_stream_tracks_held_and_index_instruments_of_users(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+        from src.core.portfolio_manager import PortfolioManager
+        from src.services.async_broker import AsyncTBroker
+        from src.models.config import UserConfig, UserIndexBindingsConfig
+        from src.models.positions import Positions, PositionsInstrument, Cash
+
+        broker = AsyncTBroker.shared()
+        broker.price_stream = MagicMock()
+        users = [
+            UserConfig(telegram_id=1, index_bindings=UserIndexBindingsConfig(
+                broker_account_id="acc_1", broker_account_name="Account 1", index_name="IMOEX")),
+            UserConfig(telegram_id=2),
+        ]
+        positions = Positions(cash=None, shares=[
+            PositionsInstrument("uid-lkoh", "figi-lkoh", 2, Cash(7000, 0), 1, "LKOH", "share"),
+        ])
+
+        with patch.object(PortfolioManager, "_load_index_list", return_value=self.make_index()), \
+                patch.object(broker, "find_shares", new=AsyncMock(return_value=self.make_shares())), \
+                patch("src.core.portfolio_manager.AsyncTAccount") as account:
+            account.return_value.get_positions = AsyncMock(return_value=positions)
+            asyncio.run(PortfolioManager.track_prices_async(users))
+
+        account.assert_called_once_with("acc_1", broker)
+        broker.price_stream.track.assert_called_once_with({"uid-sber", "uid-gazp", "uid-lkoh"})
+
+
+class TestTBrokerConnection:
+
+    @staticmethod
+    def make_broker(tmp_path):
+        from src.services.broker import TBroker
+        from src.services.catalog import InstrumentCatalog
+
+        return TBroker(token="test-token", sandbox=True, catalog=InstrumentCatalog(str(tmp_path / "instruments.sqlite")))
+
+    def test_client_is_reused_between_calls(self, tmp_path):
+        mock_client = MagicMock()
+        mock_client.__enter__.return_value.instruments.shares.return_value.instruments = []
+
+        with patch("src.services.broker.Client", return_value=mock_client) as client:
+            broker = self.make_broker(tmp_path)
+            # get_all_shares не кешируется, поэтому оба вызова доходят до get_client
+            broker.get_all_shares()
+            broker.get_all_shares()
+
+            assert mock_client.__enter__.return_value.instruments.shares.call_count == 2
+
+            client.assert_called_once()
+
+    def test_reconnects_after_failed_health_check(self, tmp_path):
+        broken, healthy = MagicMock(), MagicMock()
+        broken.__enter__.return_value.users.get_info.side_effect = Exception("channel closed")
+
+        with patch("src.services.broker.Client", side_effect=[broken, healthy]):
+            broker = self.make_broker(tmp_path)
+            broker.health_check_interval = 0
+            with broker.get_client():
+                pass
+            with broker.get_client():
+                assert broker._client is healthy.__enter__.return_value
+
+        broken.__exit__.assert_called_once()
+
+    def test_close_all_closes_open_clients(self, tmp_path):
+        from src.services.broker import TBroker
+
+        mock_client = MagicMock()
+        with patch("src.services.broker.Client", return_value=mock_client):
+            broker = self.make_broker(tmp_path)
+            with broker.get_client():
+                pass
+
+        TBroker.close_all()
+
+        mock_client.__exit__.assert_called_once()
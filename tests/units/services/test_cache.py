@@ -0,0 +1,119 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from src.services.cache import TTLCache, cached, cache_stats
+
+
+class TestTTLCache:
+
+    def test_least_recently_used_value_is_evicted(self):
+        cache = TTLCache(ttl_seconds=60, maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == (True, 1)
+        assert cache.get("b") == (False, None)
+        assert cache.stats().evictions == 1
+
+    def test_values_expire(self):
+        cache = TTLCache(ttl_seconds=10)
+        with patch("src.services.cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with patch("src.services.cache.time.monotonic", return_value=111):
+            assert cache.get("a") == (False, None)
+
+        assert cache.stats().expirations == 1
+
+    def test_memory_bound(self):
+        cache = TTLCache(ttl_seconds=60, maxsize=100, max_bytes=2000)
+        for i in range(10):
+            cache.set(i, list(range(50)))
+
+        stats = cache.stats()
+        assert stats.bytes <= 2000
+        assert 0 < stats.size < 10
+
+
+class TestCached:
+
+    def test_keys_on_arguments_and_counts_hits(self):
+        calls = []
+
+        @cached(ttl_seconds=60, name="test.square")
+        def square(x):
+            calls.append(x)
+            return x * x
+
+        assert [square(2), square(3), square(2)] == [4, 9, 4]
+        assert calls == [2, 3]
+        assert cache_stats()["test.square"]["hits"] == 1
+        assert cache_stats()["test.square"]["misses"] == 2
+
+    def test_concurrent_misses_share_one_call(self):
+        calls = []
+
+        @cached(ttl_seconds=60)
+        def load(key):
+            calls.append(key)
+            time.sleep(0.1)
+            return key.upper()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(load, ["a"] * 8))
+
+        assert results == ["A"] * 8
+        assert calls == ["a"]
+
+    def test_errors_are_not_cached(self):
+        calls = []
+
+        @cached(ttl_seconds=60)
+        def fail():
+            calls.append(1)
+            raise RuntimeError("boom")
+
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                fail()
+        assert len(calls) == 2
+
+    def test_async_single_flight(self):
+        calls = []
+
+        @cached(ttl_seconds=60, key=lambda key, **kwargs: key)
+        async def load(key, attempt=0):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key.upper()
+
+        async def run():
+            return await asyncio.gather(*(load("a", attempt=i) for i in range(5)))
+
+        assert asyncio.run(run()) == ["A"] * 5
+        assert calls == ["a"]
+
+    def test_async_waiters_survive_cancelled_caller(self):
+        calls = []
+
+        @cached(ttl_seconds=60)
+        async def load(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key.upper()
+
+        async def run():
+            first = asyncio.create_task(load("a"))
+            await asyncio.sleep(0)
+            waiters = [asyncio.create_task(load("a")) for _ in range(2)]
+            await asyncio.sleep(0)
+            first.cancel()
+            return await asyncio.gather(*waiters), first.cancelled()
+
+        assert asyncio.run(run()) == (["A", "A"], True)
+        assert calls == ["a", "a"]
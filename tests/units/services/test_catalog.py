@@ -0,0 +1,23 @@
+from src.models.instrument import InstrumentBase
+from src.services.catalog import InstrumentCatalog
+
+
+class TestInstrumentCatalog:
+
+    def test_empty_catalog(self, tmp_path):
+        catalog = InstrumentCatalog(str(tmp_path / "instruments.sqlite"), ttl_seconds=60)
+
+        assert catalog.load() == []
+        assert catalog.updated_at() == 0
+
+    def test_save_replaces_instruments(self, tmp_path):
+        path = str(tmp_path / "instruments.sqlite")
+        sber = InstrumentBase("uid-1", "figi-1", "SBER", 10, "RU0009029540", "share")
+        bond = InstrumentBase("uid-2", "figi-2", "RU000A105SK4", 1, None, "bond")
+
+        InstrumentCatalog(path, ttl_seconds=60).save([sber, bond])
+        InstrumentCatalog(path, ttl_seconds=60).save([bond])
+        catalog = InstrumentCatalog(path, ttl_seconds=60)
+
+        assert catalog.load() == [bond]
+        assert catalog.updated_at() > 0
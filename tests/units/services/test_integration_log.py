@@ -0,0 +1,50 @@
+import json
+import logging
+from datetime import datetime
+
+from src.services.integration_log import make_handler, segments, iter_records
+from src.services.utils import IntegrationFormatter
+
+
+def write_records(handler: logging.Handler, records: list) -> None:
+    handler.setFormatter(IntegrationFormatter(max_items=50, max_chars=10000))
+    for created, payload in records:
+        record = logging.LogRecord("broker_integration", logging.DEBUG, __file__, 0, payload, None, None)
+        record.created = created
+        handler.emit(record)
+    handler.close()
+
+
+class TestIntegrationLog:
+
+    def test_closed_segments_are_compressed(self, tmp_path):
+        path = str(tmp_path / "broker.jsonl")
+        handler = make_handler(path, rotation="size", max_bytes=300, backup_count=10, compression="gzip")
+
+        write_records(handler, [(1000 + i, {"name": "find_share", "request": {"value": "x" * 100},
+                                            "response": None, "error": False}) for i in range(6)])
+
+        files = segments(path)
+        assert files[-1] == path
+        assert len(files) > 2
+        assert all(f.endswith(".gz") for f in files[:-1])
+        assert [r["ts"] for r in iter_records(files)] == [1000 + i for i in range(6)]
+
+    def test_filters_by_name_time_and_error(self, tmp_path):
+        path = str(tmp_path / "broker.jsonl")
+        write_records(make_handler(path, compression="none"), [
+            (datetime(2026, 1, 1, 10).timestamp(), {"name": "get_all_shares", "request": {}, "response": [],
+                                                    "error": False}),
+            (datetime(2026, 1, 1, 11).timestamp(), {"name": "find_share", "request": {}, "response": None,
+                                                    "error": False}),
+            (datetime(2026, 1, 1, 12).timestamp(), {"name": "find_share", "request": {},
+                                                    "response": {"error": "boom"}, "error": True}),
+        ])
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("2025-12-31 | broker_integration | DEBUG | {\n")  # Строка старого формата
+
+        assert [r["error"] for r in iter_records([path], name="find_share")] == [False, True]
+        assert len(list(iter_records([path], since=datetime(2026, 1, 1, 10, 30),
+                                     until=datetime(2026, 1, 1, 12)))) == 1
+        assert [r["response"] for r in iter_records([path], errors_only=True)] == [{"error": "boom"}]
+        assert json.loads(open(path, encoding="utf-8").readline())["name"] == "get_all_shares"
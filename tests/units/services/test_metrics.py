@@ -0,0 +1,78 @@
+import socket
+import asyncio
+import urllib.request
+import urllib.error
+
+import pytest
+
+from src.services.metrics import MetricsRegistry, Histogram, start_http_server, registry
+
+
+class TestHistogram:
+
+    def test_quantile_is_bucket_upper_bound(self):
+        histogram = Histogram([0.1, 1, 10])
+        for value in [0.05] * 90 + [5] * 10:
+            histogram.observe(value)
+
+        assert histogram.quantile(0.5) == 0.1
+        assert histogram.quantile(0.95) == 10
+        assert histogram.count == 100
+
+
+class TestMetricsRegistry:
+
+    def test_render_prometheus(self):
+        metrics = MetricsRegistry([0.1, 1])
+        metrics.observe("broker_request_seconds", 0.05, method="orders.post_order")
+        metrics.observe("broker_request_seconds", 0.5, method="orders.post_order")
+
+        text = metrics.render_prometheus()
+
+        assert "# TYPE shadowtrader_broker_request_seconds histogram" in text
+        assert 'shadowtrader_broker_request_seconds_bucket{method="orders.post_order",le="0.1"} 1' in text
+        assert 'shadowtrader_broker_request_seconds_bucket{method="orders.post_order",le="+Inf"} 2' in text
+        assert 'shadowtrader_broker_request_seconds_count{method="orders.post_order"} 2' in text
+
+    def test_timer_marks_errors(self):
+        metrics = MetricsRegistry([1])
+        with pytest.raises(RuntimeError):
+            with metrics.timer("job_seconds", job="rebalance"):
+                raise RuntimeError("boom")
+
+        summary = metrics.summary()
+        assert summary[0]["labels"] == {"job": "rebalance", "status": "error"}
+        assert summary[0]["count"] == 1
+
+    def test_timed_async(self):
+        metrics = MetricsRegistry([1])
+
+        @metrics.timed("handler_seconds", handler="cmd_start")
+        async def handler():
+            return "ok"
+
+        assert asyncio.run(handler()) == "ok"
+        assert metrics.summary()[0]["labels"] == {"handler": "cmd_start", "status": "ok"}
+
+
+class TestHttpServer:
+
+    def test_disabled_by_default(self):
+        assert start_http_server(port=0) is None
+
+    def test_serves_metrics(self):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        registry.observe("moex_request_seconds", 0.2, endpoint="/iss/statistics")
+        server = start_http_server(port=port, host="127.0.0.1")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                body = response.read().decode("utf-8")
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/other")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert 'shadowtrader_moex_request_seconds_count{endpoint="/iss/statistics"} 1' in body
@@ -0,0 +1,67 @@
+from unittest.mock import MagicMock, patch
+
+
+class TestPriceTable:
+
+    def test_fresh_and_stale_prices(self):
+        from src.services.prices import PriceTable
+
+        table = PriceTable()
+        with patch("src.services.prices.time.monotonic", return_value=100):
+            table.update({"uid-old": 1})
+        with patch("src.services.prices.time.monotonic", return_value=150):
+            table.update({"uid-new": 2})
+
+        with patch("src.services.prices.time.monotonic", return_value=170):
+            fresh, stale = table.get_many(["uid-old", "uid-new", "uid-unknown"], max_age=60)
+
+        assert fresh == {"uid-new": 2}
+        assert stale == ["uid-old", "uid-unknown"]
+
+
+class TestStreamPricesInPositions:
+
+    def test_get_positions_reads_stream_prices(self):
+        from src.services.broker import TAccount
+        from src.models.instrument import InstrumentBase
+        from src.models.positions import Cash, PositionsCash
+
+        broker = MagicMock()
+        broker.cached_positions.return_value = None
+        client = MagicMock()
+        position_security = MagicMock(instrument_uid="uid123", instrument_type="share", balance=5)
+
+        client.operations.get_positions.return_value = MagicMock(
+            securities=[position_security], money=[PositionsCash(currency="rub", units=1000, nano=0)])
+        broker.get_client.return_value.__enter__.return_value = client
+        broker.find_instrument.return_value = InstrumentBase("uid123", "figi123", "TST", 10, "ISIN123", "share")
+        broker.cached_last_prices.return_value = ({"uid123": Cash(units=100, nano=0)}, [])
+
+        positions = TAccount(account_id="acc_1", broker=broker).get_positions()
+
+        assert positions.shares[0].last_price.to_float() == 100
+        client.market_data.get_last_prices.assert_not_called()
+
+    def test_stale_prices_fall_back_to_api(self):
+        from src.services.broker import TAccount
+        from src.models.instrument import InstrumentBase
+        from src.models.positions import Cash, PositionsCash
+
+        broker = MagicMock()
+        broker.cached_positions.return_value = None
+        client = MagicMock()
+        position_security = MagicMock(instrument_uid="uid123", instrument_type="share", balance=5)
+
+        client.operations.get_positions.return_value = MagicMock(
+            securities=[position_security], money=[PositionsCash(currency="rub", units=1000, nano=0)])
+        client.market_data.get_last_prices.return_value.last_prices = [
+            MagicMock(instrument_uid="uid123", price=Cash(units=105, nano=0))]
+        broker.get_client.return_value.__enter__.return_value = client
+        broker.find_instrument.return_value = InstrumentBase("uid123", "figi123", "TST", 10, "ISIN123", "share")
+        broker.cached_last_prices.return_value = ({}, ["uid123"])
+
+        positions = TAccount(account_id="acc_1", broker=broker).get_positions()
+
+        assert positions.shares[0].last_price.to_float() == 105
+        client.market_data.get_last_prices.assert_called_once_with(instrument_id=["uid123"])
+        broker.prices.update.assert_called_once()
@@ -0,0 +1,84 @@
+import os
+import asyncio
+import pstats
+import tracemalloc
+from unittest.mock import patch
+
+from src.models.config import ProfilingConfig
+from src.services.profiling import profile, profiled, to_thread
+
+
+def _work():
+    return sum(i * i for i in range(1000))
+
+
+def _work_in_thread():
+    return _work()
+
+
+class TestProfile:
+
+    def test_disabled_writes_nothing(self, tmp_path):
+        with patch("src.services.profiling.settings.profiling", ProfilingConfig(enabled=False)):
+            with profile("rebalance", str(tmp_path)):
+                _work()
+
+        assert os.listdir(tmp_path) == []
+
+    def test_writes_profile_and_snapshot(self, tmp_path):
+        with patch("src.services.profiling.settings.profiling", ProfilingConfig(enabled=True)):
+            with profile("rebalance", str(tmp_path)):
+                _work()
+
+        files = sorted(os.listdir(tmp_path))
+        assert [os.path.splitext(f)[1] for f in files] == [".prof", ".snapshot"]
+        assert pstats.Stats(str(tmp_path / files[0])).total_calls > 0
+        assert tracemalloc.Snapshot.load(str(tmp_path / files[1])).traces
+        assert not tracemalloc.is_tracing()
+
+    def test_sampling(self, tmp_path):
+        config = ProfilingConfig(enabled=True, sample_rate=0.5, tracemalloc=False)
+        with patch("src.services.profiling.settings.profiling", config), \
+                patch("src.services.profiling.random.random", side_effect=[0.9, 0.1]):
+            for _ in range(2):
+                with profile("rebalance", str(tmp_path)):
+                    _work()
+
+        assert len(os.listdir(tmp_path)) == 1
+
+    def test_nested_session_is_skipped(self, tmp_path):
+        config = ProfilingConfig(enabled=True, tracemalloc=False)
+        with patch("src.services.profiling.settings.profiling", config):
+            with profile("outer", str(tmp_path)):
+                with profile("inner", str(tmp_path)):
+                    _work()
+
+        assert [f.split("-")[0] for f in os.listdir(tmp_path)] == ["outer"]
+
+    def test_profiled_async(self, tmp_path):
+        config = ProfilingConfig(enabled=True, tracemalloc=False)
+
+        @profiled("get_callable_bonds")
+        async def job():
+            await asyncio.sleep(0)
+            return _work()
+
+        with patch("src.services.profiling.settings.profiling", config), \
+                patch("src.services.profiling.profile_dir", return_value=str(tmp_path)):
+            assert asyncio.run(job()) == _work()
+
+        assert len(os.listdir(tmp_path)) == 1
+
+    def test_work_in_thread_is_profiled(self, tmp_path):
+        config = ProfilingConfig(enabled=True, tracemalloc=False)
+
+        async def job():
+            with profile("rebalance", str(tmp_path)):
+                return await to_thread(_work_in_thread)
+
+        with patch("src.services.profiling.settings.profiling", config):
+            assert asyncio.run(job()) == _work()
+
+        stats = pstats.Stats(str(tmp_path / os.listdir(tmp_path)[0]))
+        assert "_work_in_thread" in {function for _, _, function in stats.stats}
+
@@ -0,0 +1,42 @@
+import time
+import asyncio
+
+import pytest
+
+from src.services.rate_limit import TokenBucket
+
+
+class TestTokenBucket:
+
+    def test_burst_within_capacity_does_not_wait(self):
+        bucket = TokenBucket(rate_per_minute=600, capacity=5)
+
+        started = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+
+        assert time.monotonic() - started < 0.05
+
+    def test_waits_for_refill_after_burst(self):
+        bucket = TokenBucket(rate_per_minute=600, capacity=2)  # 10 токенов в секунду
+
+        started = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+
+        assert time.monotonic() - started == pytest.approx(0.2, abs=0.05)
+
+    def test_async_acquire(self):
+        bucket = TokenBucket(rate_per_minute=600, capacity=1)
+
+        async def run():
+            await asyncio.gather(*(bucket.acquire_async() for _ in range(3)))
+
+        started = time.monotonic()
+        asyncio.run(run())
+
+        assert time.monotonic() - started == pytest.approx(0.2, abs=0.05)
+
+    def test_rate_must_be_positive(self):
+        with pytest.raises(ValueError):
+            TokenBucket(rate_per_minute=0)
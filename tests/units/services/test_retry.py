@@ -0,0 +1,124 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.services.retry import Retrier, RetryingClient
+
+
+class FakeRequestError(Exception):
+    """Ошибка API в виде, в котором её возвращает SDK: код gRPC и метаданные с квотой"""
+
+    def __init__(self, code: str, ratelimit_reset=None, ratelimit_remaining=0):
+        super().__init__(code)
+        self.code = SimpleNamespace(name=code)
+        self.metadata = SimpleNamespace(ratelimit_remaining=ratelimit_remaining, ratelimit_reset=ratelimit_reset,
+                                        message=code)
+
+
+class FakeOrdersService:
+    """Сервис заявок: первые ответы - ошибки из списка, дальше успешный ответ"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def post_order(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"order_id": kwargs["order_id"]}
+
+
+class FakeClient:
+
+    def __init__(self, orders):
+        self.orders = orders
+
+
+@pytest.fixture()
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr("src.services.retry.time.sleep", delays.append)
+    return delays
+
+
+class TestRetrier:
+
+    def test_transient_errors_are_retried(self, sleeps):
+        orders = FakeOrdersService([FakeRequestError("UNAVAILABLE"), FakeRequestError("INTERNAL")])
+        retrier = Retrier((FakeRequestError,), attempts=4, base_delay=0.1, max_delay=1)
+
+        response = RetryingClient(FakeClient(orders), retrier).orders.post_order(order_id="1")
+
+        assert response == {"order_id": "1"}
+        assert orders.calls == 3
+        assert len(sleeps) == 2 and all(0 <= d <= 0.4 for d in sleeps)
+        assert retrier.stats()["orders.post_order"] == {"calls": 3, "retries": 2, "throttled": 0, "failures": 0}
+
+    def test_throttling_waits_for_quota_reset(self, sleeps):
+        orders = FakeOrdersService([FakeRequestError("RESOURCE_EXHAUSTED", ratelimit_reset=3)])
+        retrier = Retrier((FakeRequestError,), attempts=3, base_delay=0.1, max_delay=10)
+
+        RetryingClient(FakeClient(orders), retrier).orders.post_order(order_id="1")
+
+        assert 3 <= sleeps[0] <= 3.1
+        assert retrier.stats()["orders.post_order"]["throttled"] == 1
+
+    def test_permanent_errors_are_not_retried(self, sleeps):
+        orders = FakeOrdersService([FakeRequestError("INVALID_ARGUMENT")])
+        retrier = Retrier((FakeRequestError,), attempts=3)
+
+        with pytest.raises(FakeRequestError):
+            RetryingClient(FakeClient(orders), retrier).orders.post_order(order_id="1")
+
+        assert orders.calls == 1
+        assert sleeps == []
+        assert retrier.stats()["orders.post_order"]["failures"] == 1
+
+    def test_exhausted_quota_holds_next_calls(self, sleeps):
+        orders = FakeOrdersService([FakeRequestError("INVALID_ARGUMENT", ratelimit_reset=2)])
+        client = RetryingClient(FakeClient(orders), Retrier((FakeRequestError,), attempts=3))
+
+        with pytest.raises(FakeRequestError):
+            client.orders.post_order(order_id="1")
+        client.orders.post_order(order_id="2")
+
+        assert len(sleeps) == 1 and 1.9 <= sleeps[0] <= 2
+
+    def test_remaining_quota_does_not_hold_calls(self, sleeps):
+        orders = FakeOrdersService([FakeRequestError("INVALID_ARGUMENT", ratelimit_reset=2, ratelimit_remaining=5)])
+        client = RetryingClient(FakeClient(orders), Retrier((FakeRequestError,), attempts=3))
+
+        with pytest.raises(FakeRequestError):
+            client.orders.post_order(order_id="1")
+        client.orders.post_order(order_id="2")
+
+        assert sleeps == []
+
+    def test_gives_up_after_attempts(self, sleeps):
+        orders = FakeOrdersService([FakeRequestError("UNAVAILABLE")] * 5)
+        retrier = Retrier((FakeRequestError,), attempts=3, base_delay=0)
+
+        with pytest.raises(FakeRequestError):
+            RetryingClient(FakeClient(orders), retrier).orders.post_order(order_id="1")
+
+        assert orders.calls == 3
+
+    def test_async_methods_are_retried(self, monkeypatch):
+        async def no_sleep(delay):
+            return None
+
+        monkeypatch.setattr("src.services.retry.asyncio.sleep", no_sleep)
+
+        class AsyncOrdersService(FakeOrdersService):
+            async def post_order(self, **kwargs):
+                return FakeOrdersService.post_order(self, **kwargs)
+
+        orders = AsyncOrdersService([FakeRequestError("RESOURCE_EXHAUSTED", ratelimit_reset=1)])
+        retrier = Retrier((FakeRequestError,), attempts=3)
+
+        response = asyncio.run(RetryingClient(FakeClient(orders), retrier).orders.post_order(order_id="1"))
+
+        assert response == {"order_id": "1"}
+        assert orders.calls == 2
@@ -95,3 +95,22 @@ class TestLoadIndexData:
         expected_data = expected.get("data", [])
 
         assert result == expected_data
+
+
+class TestGetBonds:
+
+    def test_bonds_cache_is_bounded_by_memory(self, mocker):
+        from src.config import settings
+
+        Moex.get_bonds.cache.clear()
+        mocker.patch.object(Moex, '_fetch_json', return_value={"securities": {"data": [
+            ["SU26238RMFS4", "ОФЗ 26238", "TQOB", 1000, "2041-05-15", None, None, None],
+        ]}})
+
+        bonds = Moex().get_bonds()
+        stats = Moex.get_bonds.cache.stats()
+        Moex.get_bonds.cache.clear()
+
+        assert bonds[0].ticker == "SU26238RMFS4"
+        assert Moex.get_bonds.cache.max_bytes == settings.stock_market.cache_max_bytes
+        assert stats.size == 1 and stats.bytes > 0
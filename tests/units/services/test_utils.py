@@ -0,0 +1,67 @@
+import json
+import queue
+import logging
+from unittest.mock import patch
+
+from src.models.share import Share, ShareList
+from src.services.utils import compact_payload, IntegrationFormatter, DeferredQueueHandler, log_response
+
+
+def make_shares(count: int) -> ShareList:
+    return ShareList([Share(f"uid-{i}", "figi", "TST", 1, None, "share") for i in range(count)])
+
+
+class TestIntegrationLogging:
+
+    def test_long_lists_are_cut(self):
+        payload = compact_payload({"response": make_shares(1000)}, max_items=2)
+
+        assert payload["response"]["items"][:2] == [
+            {"uid": "uid-0", "figi": "figi", "ticker": "TST", "lot_size": 1, "isin": None, "type": "share"},
+            {"uid": "uid-1", "figi": "figi", "ticker": "TST", "lot_size": 1, "isin": None, "type": "share"},
+        ]
+        assert payload["response"]["items"][2] == "... 998 more"
+
+    def test_formatter_caps_message_size(self):
+        formatter = IntegrationFormatter(max_items=1000, max_chars=100)
+        record = logging.LogRecord("broker_integration", logging.DEBUG, __file__, 0,
+                                   {"name": "get_all_shares", "request": {}, "response": make_shares(100)},
+                                   None, None)
+
+        entry = json.loads(formatter.format(record))
+
+        assert entry["name"] == "get_all_shares"
+        assert entry["truncated"] > 100
+        assert len(entry["response"]) == 50
+
+    def test_queued_record_is_a_snapshot(self):
+        records = queue.Queue()
+        handler = DeferredQueueHandler(records, max_items=10)
+        shares = make_shares(2)
+        record = logging.LogRecord("broker_integration", logging.DEBUG, __file__, 0,
+                                   {"name": "get_all_shares", "request": {}, "response": shares}, None, None)
+
+        handler.emit(record)
+        shares.items[0].ticker = "CHANGED"
+        shares.items.append(Share("uid-2", "figi", "TST", 1, None, "share"))
+
+        entry = json.loads(IntegrationFormatter(max_items=10, max_chars=10000).format(records.get_nowait()))
+        assert [item["ticker"] for item in entry["response"]["items"]] == ["TST", "TST"]
+
+    def test_sampled_out_calls_are_not_logged_but_errors_are(self):
+        @log_response()
+        def get_all_shares(fail: bool = False):
+            if fail:
+                raise RuntimeError("boom")
+            return make_shares(1)
+
+        with patch("src.services.utils.INTEGRATION_LOG_SAMPLING", {"get_all_shares": 0}), \
+                patch("src.services.utils.log_integration") as log:
+            get_all_shares()
+            log.assert_not_called()
+
+            try:
+                get_all_shares(fail=True)
+            except RuntimeError:
+                pass
+            log.assert_called_once_with("get_all_shares", {"fail": True}, {"error": "boom"}, True)